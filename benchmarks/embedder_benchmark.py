@@ -0,0 +1,117 @@
+"""
+embedder_benchmark.py
+Embedding throughput (docs/sec) of the VectorStore embedder backends
+(torch, onnx, onnx_int8) on statement-like texts, plus how closely each
+backend's vectors agree with the first one (mean cosine similarity).
+
+Usage:
+    python -m benchmarks.embedder_benchmark --docs 2000
+    python -m benchmarks.embedder_benchmark --backends onnx onnx_int8 --threads 4 --batch-size 32
+    python -m benchmarks.embedder_benchmark --json ./bench_embedder.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from src.utils.config import load_config
+from src.vectorstore.embedders import DEFAULT_EMBEDDER_CONFIG, EMBEDDER_BACKENDS, load_embedder
+
+
+BANKS = ["HDFC Bank", "State Bank of India", "ICICI Bank", "Axis Bank", "Kotak Mahindra Bank"]
+
+
+def synthetic_statements(count, seed=0):
+    """
+    Texts shaped like JSONIngestor.json_to_text output, with varied
+    lengths so dynamic batching has something to group.
+    """
+    rng = np.random.default_rng(seed)
+    docs = []
+    for i in range(count):
+        lines = [
+            f"bank name: {BANKS[i % len(BANKS)]}",
+            f"account number: {rng.integers(10**9, 10**10)}",
+            f"statement from date: 01-{1 + i % 12:02d}-2024",
+            f"statement to date: 28-{1 + i % 12:02d}-2024",
+            f"opening balance: {rng.uniform(0, 1e6):.2f}",
+            f"closing balance: {rng.uniform(0, 1e6):.2f}",
+            "currency: INR",
+        ]
+        # Some statements carry long branch / narration text
+        lines += [f"note: transaction narration {j} at branch {rng.integers(1000)}" for j in range(int(rng.integers(0, 12)))]
+        docs.append("\n".join(lines))
+    return docs
+
+
+def run(backends, docs, model_name, base_config, repeats=3):
+    results, reference = [], None
+    for backend in backends:
+        start = time.perf_counter()
+        embedder = load_embedder(model_name, {**base_config, "backend": backend})
+        load_s = time.perf_counter() - start
+
+        embedder.encode(docs[:32])  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            vectors = embedder.encode(docs)
+            timings.append(time.perf_counter() - start)
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if reference is None:
+            reference = vectors
+        best_s = min(timings)
+
+        results.append({
+            "backend": backend,
+            "load_s": round(load_s, 3),
+            "docs_per_s": round(len(docs) / best_s, 1),
+            "cosine_vs_first": round(float(np.mean(np.sum(vectors * reference, axis=1))), 5),
+        })
+        print_row(results[-1])
+
+    return results
+
+
+def print_row(row):
+    print(
+        f"{row['backend']:<10} load {row['load_s']:>7.2f}s  {row['docs_per_s']:>10.1f} docs/s  "
+        f"cosine vs first {row['cosine_vs_first']:.5f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedder backend throughput benchmark")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDER_BACKENDS), choices=EMBEDDER_BACKENDS)
+    parser.add_argument("--docs", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2", help="torch backend model")
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--config", default="./configs/vectorstore.yaml")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    base_config = load_config(args.config, "embedder", DEFAULT_EMBEDDER_CONFIG)
+    if args.batch_size:
+        base_config["batch_size"] = args.batch_size
+    if args.threads is not None:
+        base_config["threads"] = args.threads
+
+    docs = synthetic_statements(args.docs)
+    print(f"Docs: {len(docs)}, batch_size={base_config['batch_size']}, threads={base_config['threads'] or 'default'}")
+    print("=" * 60)
+
+    results = run(args.backends, docs, args.model, base_config, args.repeats)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"docs": len(docs), "config": base_config, "results": results}, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
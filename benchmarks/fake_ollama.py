@@ -0,0 +1,158 @@
+"""
+fake_ollama.py
+A local stand-in for Ollama's /api/generate, shared by the pipeline
+benchmark and the tests.
+
+Usage:
+    server = start_fake_ollama(ocr_latency_ms=50, llm_latency_ms=20)
+    os.environ["OLLAMA_HOST"] = server.url
+    ...
+    stop_fake_ollama(server)
+
+Image requests (OCR) are answered with `ocr_response`, everything else with
+`llm_response`; each is a string or a callable taking the request number.
+Streaming requests get one NDJSON chunk per word. Per-server knobs and
+counters (set them on the returned server):
+
+    flaky       images whose first request fails with a 500
+    garbled     images answered without JSON unless `format` is set
+    drop_after  close streams mid-answer after this many chunks (None = never)
+    calls, max_in_flight, bodies, formats, aborted
+"""
+
+import re
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_OCR_RESPONSE = '{"bank_name": "HDFC", "closing_balance": 100.5}'
+DEFAULT_LLM_RESPONSE = "The closing balance for this account is 12,345.67 INR as of the statement end date."
+GARBLED_RESPONSE = "I could not read this statement."
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+
+        image = (body.get("images") or [""])[0]
+        with server.lock:
+            server.calls += 1
+            i = server.calls
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.bodies.append(body)
+            server.formats.append(body.get("format"))
+            fail = image in server.flaky
+            server.flaky.discard(image)
+            garbled = image in server.garbled and not body.get("format")
+
+        try:
+            if fail:
+                self._send_json({"error": "busy"}, status=500)
+                return
+
+            if image:
+                time.sleep(server.ocr_latency)
+                text = GARBLED_RESPONSE if garbled else self._response(server.ocr_response, i)
+            else:
+                time.sleep(server.llm_latency)
+                text = self._response(server.llm_response, i)
+            prompt_tokens = len(body.get("prompt", "")) // 4
+
+            if not body.get("stream"):
+                self._send_json({
+                    "model": body.get("model", ""), "response": text, "done": True,
+                    "prompt_eval_count": prompt_tokens, "eval_count": len(text.split()),
+                })
+                return
+
+            self._stream(body, text, prompt_tokens)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+    @staticmethod
+    def _response(response, i) -> str:
+        return response(i) if callable(response) else response
+
+
+    def _stream(self, body, text, prompt_tokens):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        words = re.findall(r"\S+\s*", text)
+        chunks = [{"model": body.get("model", ""), "response": word, "done": False} for word in words]
+        chunks.append({"model": body.get("model", ""), "response": "", "done": True,
+                       "prompt_eval_count": prompt_tokens, "eval_count": len(words)})
+        if self.server.drop_after is not None:
+            chunks = chunks[:self.server.drop_after]
+        try:
+            for chunk in chunks:
+                data = json.dumps(chunk).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(self.server.token_delay)
+            if self.server.drop_after is not None:
+                # Connection lost mid-answer: no terminating chunk
+                self.close_connection = True
+                return
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream: Ollama would stop generating here
+            with self.server.lock:
+                self.server.aborted += 1
+            self.close_connection = True
+
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_ollama(ocr_latency_ms=50.0, llm_latency_ms=20.0, token_delay_ms=0.0,
+                      ocr_response=DEFAULT_OCR_RESPONSE, llm_response=DEFAULT_LLM_RESPONSE) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.ocr_latency = ocr_latency_ms / 1000
+    server.llm_latency = llm_latency_ms / 1000
+    server.token_delay = token_delay_ms / 1000
+    server.ocr_response = ocr_response
+    server.llm_response = llm_response
+
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.bodies = []
+    server.formats = []
+    server.aborted = 0
+    server.flaky = set()
+    server.garbled = set()
+    server.drop_after = None
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_fake_ollama(server: ThreadingHTTPServer):
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,145 @@
+"""
+index_benchmark.py
+Recall-vs-latency benchmark for the vectorstore index types
+(flat, ivf_flat, ivf_pq, hnsw) against the exact flat baseline.
+
+Usage:
+    python -m benchmarks.index_benchmark --n 100000 --queries 1000
+    python -m benchmarks.index_benchmark --index ./data/vectorstore/faiss.index
+    python -m benchmarks.index_benchmark --json ./bench_index.json
+"""
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from src.vectorstore.index_factory import (
+    apply_search_params, build_index, extract_vectors, load_index_config, sample_vectors
+)
+
+
+# (index type, search parameter, values to sweep)
+SWEEPS = [
+    ("flat", None, [None]),
+    ("ivf_flat", "nprobe", [1, 4, 16, 64]),
+    ("ivf_pq", "nprobe", [4, 16, 64]),
+    ("hnsw", "ef_search", [16, 64, 256]),
+]
+
+
+def synthetic_vectors(n, dim, clusters=256, seed=0):
+    """
+    Clustered, L2-normalised vectors: closer to real sentence embeddings
+    than uniform noise (MiniLM output is normalised too).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=n)] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=count, replace=False)].copy()
+    queries += 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    return queries
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(vectors, queries, k, base_config, single_queries=200):
+    ids = np.arange(len(vectors), dtype=np.int64)
+    train = sample_vectors(vectors, int(base_config["train_sample_size"]))
+
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, truth = baseline.search(queries, k)
+
+    results = []
+    for index_type, param, values in SWEEPS:
+        config = {**base_config, "type": index_type, "dimension": vectors.shape[1]}
+
+        start = time.perf_counter()
+        index = build_index(config, train_vectors=train if index_type.startswith("ivf") else None)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - start
+
+        for value in values:
+            if param:
+                config[param] = value
+                apply_search_params(index, config)
+
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            batch_s = time.perf_counter() - start
+
+            latencies = []
+            for query in queries[:single_queries]:
+                start = time.perf_counter()
+                index.search(query[None, :], k)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            results.append({
+                "type": index_type,
+                "param": param,
+                "value": value,
+                "build_s": round(build_s, 3),
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "batch_qps": round(len(queries) / batch_s, 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            })
+            print_row(results[-1], k)
+
+    return results
+
+
+def print_row(row, k):
+    setting = f"{row['param']}={row['value']}" if row["param"] else "-"
+    print(
+        f"{row['type']:<9} {setting:<14} build {row['build_s']:>8.2f}s  "
+        f"recall@{k} {row[f'recall@{k}']:.4f}  {row['batch_qps']:>10.1f} qps  "
+        f"p50 {row['p50_ms']:.3f}ms  p95 {row['p95_ms']:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS index recall/latency benchmark")
+    parser.add_argument("--n", type=int, default=100000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", help="benchmark on the vectors of an existing faiss index")
+    parser.add_argument("--config", default="./configs/vectorstore.yaml")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    base_config = load_index_config(args.config)
+
+    if args.index:
+        vectors, _ = extract_vectors(faiss.read_index(args.index))
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    print(f"Corpus: {len(vectors)} x {vectors.shape[1]}, queries: {len(queries)}, k={args.k}")
+    print("=" * 60)
+
+    results = run(vectors, queries, args.k, base_config)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"corpus": len(vectors), "k": args.k, "results": results}, f, indent=4)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""
+pipeline_benchmark.py
+End-to-end benchmark of the run.py stages on a synthetic bank-statement
+corpus, against a local fake Ollama server (benchmarks/fake_ollama.py: no
+model, fixed latency):
+
+    ocr       BankStatementOCR on synthetic statement images
+    ingest    run.step_2_ingest_json over the synthetic OCR outputs
+    embed     the configured embedder (or a fast hashing stand-in)
+    index     VectorStore upserts (FAISS + docstore + BM25 + metadata)
+    search    Retriever.retrieve_batch, one query at a time
+    generate  RAGPipeline.query end to end (retrieve + pack + LLM call)
+
+Reports throughput and p50/p95/p99 latency per stage as JSON, and can
+compare a run against an earlier one to flag regressions.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --docs 10000 --json ./bench_pipeline.json
+    python -m benchmarks.pipeline_benchmark --docs 1000000 --format parquet --stages ingest embed index search
+    python -m benchmarks.pipeline_benchmark --embedder onnx_int8 --compare ./bench_pipeline.json
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import platform
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fake_ollama import start_fake_ollama, stop_fake_ollama
+
+
+STAGES = ("ocr", "ingest", "embed", "index", "search", "generate")
+
+BANKS = ["HDFC Bank", "State Bank of India", "ICICI Bank", "Axis Bank", "Kotak Mahindra Bank", "Yes Bank"]
+BRANCHES = ["Andheri West", "Connaught Place", "Koramangala", "Salt Lake", "Banjara Hills", "MG Road"]
+NAMES = ["Asha Rao", "Vikram Singh", "Meera Iyer", "Rahul Das", "Farah Khan", "Arjun Mehta"]
+
+# Throughput drop / latency rise beyond this fraction counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+def synthetic_statement(i: int, rng) -> dict:
+    """
+    One statement with the 14 fields of the OCR prompt.
+    """
+    month = 1 + i % 12
+    opening = round(float(rng.uniform(1e3, 5e5)), 2)
+    credits = round(float(rng.uniform(0, 2e5)), 2)
+    debits = round(float(rng.uniform(0, opening + credits)), 2)
+    return {
+        "bank_name": BANKS[i % len(BANKS)],
+        "account_number": str(10**10 + i * 7919 % 10**9),
+        "account_holder_name": NAMES[i % len(NAMES)],
+        "phone_number": f"+91 98{i % 10**8:08d}",
+        "statement_from_date": f"01-{month:02d}-2024",
+        "statement_to_date": f"28-{month:02d}-2024",
+        "opening_balance": opening,
+        "closing_balance": round(opening + credits - debits, 2),
+        "total_debits": debits,
+        "total_credits": credits,
+        "currency": "INR",
+        "statement_date_generated": f"01-{month % 12 + 1:02d}-2024",
+        "branch_name": BRANCHES[i % len(BRANCHES)],
+        "statement_number": f"ST{2024_000000 + i}",
+        "source_file": f"stmt_{i:07d}.png",
+    }
+
+
+def write_corpus(output_dir: Path, count: int, fmt: str = "json", seed: int = 0):
+    """
+    Synthetic OCR outputs, as BankStatementOCR writes them: one
+    *_parsed.json per statement, or a Parquet OCR dataset.
+    """
+    rng = np.random.default_rng(seed)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if fmt == "parquet":
+        from src.ingestion.preprocess.columnar import DATASET_DIR, OCRDatasetWriter
+        writer = OCRDatasetWriter(output_dir / DATASET_DIR, rows_per_file=100000)
+        for i in range(count):
+            writer.write(synthetic_statement(i, rng))
+        writer.close()
+        return
+
+    for i in range(count):
+        statement = synthetic_statement(i, rng)
+        with open(output_dir / f"stmt_{i:07d}_parsed.json", "w", encoding="utf-8") as f:
+            json.dump(statement, f, indent=4)
+
+
+def write_images(image_dir: Path, count: int, seed: int = 0):
+    """
+    Statement-like scans (text lines on a white page, with margins) when
+    Pillow is installed, tiny placeholder files otherwise.
+    """
+    rng = np.random.default_rng(seed)
+    image_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        Image = None
+
+    for i in range(count):
+        path = image_dir / f"stmt_{i:07d}.png"
+        if Image is None:
+            path.write_bytes(b"\x89PNG synthetic statement %d" % i)
+            continue
+
+        statement = synthetic_statement(i, rng)
+        page = Image.new("L", (1240, 1754), 255)
+        draw = ImageDraw.Draw(page)
+        for line, (key, value) in enumerate(statement.items()):
+            draw.text((160, 200 + 60 * line), f"{key.replace('_', ' ').title()}: {value}", fill=0)
+        page.save(path)
+
+
+def fake_ocr_response(i: int) -> str:
+    # What the vision model returns for statement image i
+    statement = synthetic_statement(i, np.random.default_rng(i))
+    statement.pop("source_file")
+    return json.dumps(statement)
+
+
+class HashEmbedder:
+    """
+    Stand-in embedder: each token adds a fixed random vector (chosen by
+    CRC-32 of the token). Near-free, so the embed / index / search stages
+    measure the pipeline rather than the model.
+    """
+
+    def __init__(self, dimension=384, buckets=4096, seed=0):
+        self.dimension = dimension
+        self.buckets = buckets
+        self.table = np.random.default_rng(seed).normal(size=(buckets, dimension)).astype(np.float32)
+
+
+    def encode(self, texts, convert_to_numpy=True):
+        rows, buckets = [], []
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                rows.append(row)
+                buckets.append(zlib.crc32(token.encode("utf-8")) % self.buckets)
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        np.add.at(vectors, np.asarray(rows, dtype=np.int64), self.table[np.asarray(buckets, dtype=np.int64)])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+
+class PrecomputedEmbedder:
+    """
+    Serves the vectors the embed stage produced, so the index stage
+    measures indexing only.
+    """
+
+    def __init__(self, texts, vectors, fallback):
+        self.vectors = {text: vector for text, vector in zip(texts, vectors)}
+        self.fallback = fallback
+
+
+    def encode(self, texts, convert_to_numpy=True):
+        missing = [text for text in texts if text not in self.vectors]
+        if missing:
+            self.vectors.update(zip(missing, self.fallback.encode(missing)))
+        return np.stack([self.vectors[text] for text in texts])
+
+
+def summarize(latencies, items, seconds) -> dict:
+    """
+    Throughput plus latency percentiles (latencies in seconds, one per
+    item or per batch).
+    """
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    summary = {
+        "items": int(items),
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(items / seconds, 2) if seconds > 0 else None,
+        "samples": int(len(latencies_ms)),
+    }
+    for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+        summary[name] = round(float(np.percentile(latencies_ms, q)), 3) if len(latencies_ms) else None
+    return summary
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_ocr(work_dir: Path, images: int, workers: int, preprocess: bool):
+    from src.ingestion.preprocess.ocr import BankStatementOCR
+
+    class TimedOCR(BankStatementOCR):
+        latencies = []
+
+        def process_image(self, *args, **kwargs):
+            result, seconds = timed(super().process_image, *args, **kwargs)
+            self.latencies.append(seconds)
+            return result
+
+    write_images(work_dir / "images", images)
+    ocr = TimedOCR(
+        input_dir=work_dir / "images", output_dir=work_dir / "ocr_output",
+        model="bench", max_workers=workers, preprocess=preprocess,
+    )
+    results, seconds = timed(ocr.process_all_images)
+    return summarize(TimedOCR.latencies, len(results), seconds)
+
+
+def bench_ingest(corpus_dir: Path):
+    import run
+
+    docs, seconds = timed(run.step_2_ingest_json, str(corpus_dir))
+    # Ingest is one pass: per-document latency is the average
+    return docs, summarize([seconds / max(len(docs), 1)] * len(docs), len(docs), seconds)
+
+
+def bench_embed(embedder, texts, batch_size: int):
+    vectors, latencies = [], []
+    start = time.perf_counter()
+    for pos in range(0, len(texts), batch_size):
+        batch_vectors, seconds = timed(embedder.encode, texts[pos:pos + batch_size])
+        vectors.append(np.asarray(batch_vectors, dtype=np.float32))
+        latencies.append(seconds)
+    seconds = time.perf_counter() - start
+    return np.concatenate(vectors) if vectors else np.zeros((0, 384), np.float32), summarize(latencies, len(texts), seconds)
+
+
+def bench_index(store, docs, batch_size: int):
+    latencies = []
+    start = time.perf_counter()
+    for pos in range(0, len(docs), batch_size):
+        _, seconds = timed(store.upsert, docs[pos:pos + batch_size])
+        latencies.append(seconds)
+    return summarize(latencies, len(docs), time.perf_counter() - start)
+
+
+def make_queries(docs, count, seed=1):
+    rng = np.random.default_rng(seed)
+    templates = [
+        "What is the closing balance for account {account_number}?",
+        "Who is the account holder of account {account_number} at {bank_name}?",
+        "Which branch issued statement {statement_number}?",
+    ]
+    queries = []
+    for pos in rng.integers(0, len(docs), size=count):
+        metadata = docs[int(pos)].metadata or {}
+        template = templates[len(queries) % len(templates)]
+        queries.append(template.format(**{key: metadata.get(key, "") for key in ("account_number", "bank_name", "statement_number")}))
+    return queries
+
+
+def bench_search(retriever, queries, top_k: int):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        _, seconds = timed(retriever.retrieve_batch, [query], top_k)
+        latencies.append(seconds)
+    return summarize(latencies, len(queries), time.perf_counter() - start)
+
+
+def bench_generate(rag, queries):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        _, seconds = timed(rag.query, query)
+        latencies.append(seconds)
+    return summarize(latencies, len(queries), time.perf_counter() - start)
+
+
+def run_benchmark(docs=1000, images=50, queries=200, stages=STAGES, fmt="json", embedder="hash",
+                  batch_size=256, index_batch_size=5000, top_k=5, ocr_workers=4, preprocess=None,
+                  ocr_latency_ms=50.0, llm_latency_ms=20.0, work_dir="./data/bench", keep=False):
+    """
+    Run the selected stages and return the machine-readable result dict.
+    Later stages reuse earlier outputs (ingested docs, embeddings, index).
+    """
+    work_dir = Path(work_dir)
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+    work_dir.mkdir(parents=True)
+
+    server = start_fake_ollama(ocr_latency_ms, llm_latency_ms, ocr_response=fake_ocr_response)
+    previous_host = os.environ.get("OLLAMA_HOST")
+    os.environ["OLLAMA_HOST"] = server.url
+
+    config = {
+        "docs": docs, "images": images, "queries": queries, "format": fmt, "embedder": embedder,
+        "batch_size": batch_size, "index_batch_size": index_batch_size, "top_k": top_k,
+        "ocr_workers": ocr_workers, "ocr_latency_ms": ocr_latency_ms, "llm_latency_ms": llm_latency_ms,
+    }
+    results = {
+        "config": config,
+        "environment": {
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": {},
+    }
+
+    def report(stage, summary):
+        results["stages"][stage] = summary
+        print_row(stage, summary)
+
+    try:
+        if "ocr" in stages:
+            if preprocess is None:
+                from src.ingestion.preprocess.ocr import preprocess_enabled
+                preprocess = preprocess_enabled()
+            report("ocr", bench_ocr(work_dir, images, ocr_workers, preprocess))
+
+        needs_docs = {"ingest", "embed", "index", "search", "generate"} & set(stages)
+        if not needs_docs:
+            return results
+
+        corpus_dir = work_dir / "corpus"
+        _, corpus_s = timed(write_corpus, corpus_dir, docs, fmt)
+        print(f"Corpus: {docs} statements ({fmt}) written in {corpus_s:.1f}s")
+
+        doc_list, summary = bench_ingest(corpus_dir)
+        if "ingest" in stages:
+            report("ingest", summary)
+
+        from src.vectorstore.embedders import load_embedder
+        fallback = HashEmbedder() if embedder == "hash" else load_embedder(
+            "sentence-transformers/all-MiniLM-L6-v2", {"backend": embedder}
+        )
+        texts = [doc.text for doc in doc_list]
+        vectors, summary = bench_embed(fallback, texts, batch_size)
+        if "embed" in stages:
+            report("embed", summary)
+
+        if not {"index", "search", "generate"} & set(stages):
+            return results
+
+        from src.vectorstore.store import VectorStore
+        store = VectorStore(
+            index_path=work_dir / "vectorstore" / "faiss.index",
+            docstore_path=work_dir / "vectorstore" / "docstore.sqlite",
+            embedding_cache_config={"enabled": False},
+            embedder_load="lazy",
+        )
+        store.embedder = PrecomputedEmbedder(texts, vectors, fallback)
+        summary = bench_index(store, doc_list, index_batch_size)
+        if "index" in stages:
+            report("index", summary)
+
+        from src.retriever.retriever import Retriever
+        retriever = Retriever(vectorstore=store, top_k=top_k)
+        query_list = make_queries(doc_list, queries)
+        store.embedder = fallback
+        if "search" in stages:
+            report("search", bench_search(retriever, query_list, top_k))
+
+        if "generate" in stages:
+            from src.pipeline.rag_pipeline import RAGPipeline
+            rag = RAGPipeline(retriever=retriever, model_name="bench", top_k=top_k, response_cache=False)
+            report("generate", bench_generate(rag, query_list))
+
+        return results
+
+    finally:
+        stop_fake_ollama(server)
+        if previous_host is None:
+            os.environ.pop("OLLAMA_HOST", None)
+        else:
+            os.environ["OLLAMA_HOST"] = previous_host
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Stages that got slower than `baseline` (an earlier result dict) by
+    more than `tolerance`: lower throughput or higher p95 latency.
+    """
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        if previous.get("throughput_per_s") and current.get("throughput_per_s") is not None:
+            if current["throughput_per_s"] < previous["throughput_per_s"] * (1 - tolerance):
+                regressions.append(
+                    f"{stage}: throughput {current['throughput_per_s']}/s < {previous['throughput_per_s']}/s"
+                )
+        if previous.get("p95_ms") and current.get("p95_ms") is not None:
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{stage}: p95 {current['p95_ms']}ms > {previous['p95_ms']}ms")
+    return regressions
+
+
+def print_row(stage, summary):
+    print(
+        f"{stage:<9} {summary['items']:>9} items  {summary['throughput_per_s'] or 0:>11.1f}/s  "
+        f"p50 {summary['p50_ms'] or 0:>9.3f}ms  p95 {summary['p95_ms'] or 0:>9.3f}ms  "
+        f"p99 {summary['p99_ms'] or 0:>9.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark on a synthetic corpus")
+    parser.add_argument("--docs", type=int, default=1000, help="synthetic statements (1k to 1M)")
+    parser.add_argument("--images", type=int, default=50, help="synthetic images for the OCR stage")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--format", default="json", choices=["json", "parquet"], help="OCR output format to ingest")
+    parser.add_argument("--embedder", default="hash", choices=["hash", "torch", "onnx", "onnx_int8"],
+                        help="hash = near-free stand-in that isolates pipeline cost")
+    parser.add_argument("--batch-size", type=int, default=256, help="embedding batch size")
+    parser.add_argument("--index-batch-size", type=int, default=5000, help="documents per upsert")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ocr-workers", type=int, default=4)
+    parser.add_argument("--no-preprocess", action="store_true", help="send original images to OCR")
+    parser.add_argument("--ocr-latency-ms", type=float, default=50.0, help="fake Ollama latency per image")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="fake Ollama latency per answer")
+    parser.add_argument("--work-dir", default="./data/bench")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpus and index")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="earlier results JSON; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    print(f"Stages: {' '.join(args.stages)}")
+    print("=" * 60)
+    results = run_benchmark(
+        docs=args.docs, images=args.images, queries=args.queries, stages=args.stages, fmt=args.format,
+        embedder=args.embedder, batch_size=args.batch_size, index_batch_size=args.index_batch_size,
+        top_k=args.top_k, ocr_workers=args.ocr_workers, preprocess=False if args.no_preprocess else None,
+        ocr_latency_ms=args.ocr_latency_ms, llm_latency_ms=args.llm_latency_ms,
+        work_dir=args.work_dir, keep=args.keep,
+    )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results written to {args.json}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
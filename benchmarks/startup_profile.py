@@ -0,0 +1,117 @@
+"""
+startup_profile.py
+Import-time profile of the entry points: per-module import times from
+`python -X importtime`, each entry point in a fresh interpreter.
+
+Fails (exit code 1) when an entry point imports a module it should load
+lazily, or exceeds its time budget, so CI can catch startup regressions.
+
+Usage:
+    python -m benchmarks.startup_profile
+    python -m benchmarks.startup_profile --modules run src.api.server --top 20
+    python -m benchmarks.startup_profile --budget-ms 800 --json ./bench_startup.json
+"""
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Entry points, and the heavy modules each must not import at startup
+ENTRY_POINTS = {
+    "run": ["torch", "sentence_transformers", "faiss", "ollama", "pyarrow", "PIL"],
+    "src.api.server": ["torch", "sentence_transformers", "faiss"],
+    "src.vectorstore.store": ["torch", "sentence_transformers"],
+    "src.retriever.retriever": ["torch", "sentence_transformers", "faiss"],
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_imports(module):
+    """
+    Import `module` in a fresh interpreter. Returns one row per imported
+    module: {"module", "self_us", "cumulative_us", "depth"}, in import order.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": len(indent) // 2,
+            })
+    return rows
+
+
+def check(module, rows, forbidden, budget_ms=None):
+    """
+    Problems found for one entry point (empty when it passes).
+    """
+    problems = []
+    imported = {row["module"].split(".")[0] for row in rows}
+    for name in forbidden:
+        if name in imported:
+            problems.append(f"{module} imports {name} at startup")
+
+    total_ms = sum(row["self_us"] for row in rows) / 1000
+    if budget_ms is not None and total_ms > budget_ms:
+        problems.append(f"{module} takes {total_ms:.0f}ms to import (budget {budget_ms:.0f}ms)")
+    return problems
+
+
+def print_profile(module, rows, top):
+    total_ms = sum(row["self_us"] for row in rows) / 1000
+    print(f"{module}: {total_ms:.1f}ms, {len(rows)} modules")
+
+    # Self time summed per top-level package: where the startup cost comes from
+    packages = {}
+    for row in rows:
+        package = row["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + row["self_us"]
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {package:<32} {self_us / 1000:>9.1f}ms")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the entry points")
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS), help="modules to import")
+    parser.add_argument("--top", type=int, default=10, help="packages to list per module")
+    parser.add_argument("--budget-ms", type=float, help="fail when an import takes longer than this")
+    parser.add_argument("--json", help="write the per-module import times to this file")
+    args = parser.parse_args()
+
+    results, problems = {}, []
+    for module in args.modules:
+        rows = profile_imports(module)
+        results[module] = rows
+        print_profile(module, rows, args.top)
+        problems.extend(check(module, rows, ENTRY_POINTS.get(module, []), args.budget_ms))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,17 +9,18 @@ Orchestrates the full pipeline:
 
 import os
 from pathlib import Path
+from itertools import chain, islice
 
-from src.ingestion.preprocess.ocr import BankStatementOCR
-from src.vectorstore.ingest import JSONIngestor
-from src.vectorstore.store import VectorStore
-from src.retriever.retriever import Retriever
-from src.pipeline.rag_pipeline import RAGPipeline
 from src.utils.logger import Logger
 
+# Pipeline modules are imported inside each step: ollama, faiss and
+# sentence_transformers (torch) are only loaded by the steps that use them,
+# so OCR-only jobs start fast (see benchmarks/startup_profile.py)
+
 
 PROJECT_ROOT = Path(__file__).parent.resolve()
 DATA_OUTPUT = PROJECT_ROOT / "data" / "output"
+METRICS_PATH = "./logs/metrics.json"
 
 logger = Logger("RUN_ALL", "./logs/run_all.log").get_logger()
 logger.info(f"Project root: {PROJECT_ROOT}")
@@ -28,36 +29,115 @@ logger.info(f"Project root: {PROJECT_ROOT}")
 # -------------------------------------------------
 # STEP 1: Run OCR on images
 # -------------------------------------------------
-def step_1_process_images(input_dir="./data/extracted/images", output_dir="./data/output", model=None):
+def step_1_process_images(input_dir="./data/extracted/images", output_dir="./data/output", model=None,
+                          manifest_path="./data/cache/ocr_manifest.json", batch_size=500):
     """
-    Run OCR ONLY if output JSON files do NOT already exist.
-    Otherwise skip LLM OCR to save time and compute.
+    Run OCR ONLY for new or changed images.
+    The OCR manifest tracks image content hash + model + prompt hash;
+    outputs of deleted images are pruned.
     """
-    logger.info("STEP 1: Checking for existing JSON output files...")
+    from src.ingestion.preprocess.ocr import BankStatementOCR
+    from src.ingestion.preprocess.cache import OCRCache
+
+    logger.info("STEP 1: Checking OCR manifest for new or changed images...")
 
-    output_dir = Path(output_dir)
-    json_files = list(output_dir.glob("*.json"))
+    parser = BankStatementOCR(input_dir=input_dir, output_dir=output_dir, model=model)
+    cache = OCRCache(manifest_path=manifest_path, model=parser.model, preprocess=parser.preprocess_settings())
 
-    if json_files:
-        logger.info(f"Skipped OCR: Found {len(json_files)} existing JSON files in {output_dir}")
+    image_files = parser.list_images()
+    cache.prune(image_files, parser.output_dir)
+    to_process = cache.plan(image_files, parser.output_dir, parser.output_path_for)
+
+    if not to_process:
+        cache.save()
+        logger.info(f"Skipped OCR: all {len(image_files)} images are up to date in {output_dir}")
         return []  # Return empty because OCR was skipped
 
-    # No JSON files found → run OCR
-    logger.info("No JSON files found. Running OCR with LLM...")
-    parser = BankStatementOCR(input_dir=input_dir, output_dir=output_dir, model=model)
-    results = parser.process_all_images()
+    logger.info(f"Running OCR with LLM on {len(to_process)} new/changed images...")
+    results = []
+
+    # Save the manifest after every batch so an interrupted run resumes where it stopped
+    for start in range(0, len(to_process), batch_size):
+        batch = to_process[start:start + batch_size]
+        by_name = {image_file.name: image_file for image_file in batch}
+
+        batch_results = parser.process_all_images(image_files=batch)
+        for result in batch_results:
+            image_file = by_name.get(result.get("source_file"))
+            if image_file is not None:
+                cache.record(image_file, parser.output_path_for(image_file))
+
+        cache.save()
+        results.extend(batch_results)
+
     logger.info(f"OCR completed. Parsed {len(results)} files.")
     return results
 
 
+# -------------------------------------------------
+# STEP 1 (streaming): OCR straight from the zip
+# -------------------------------------------------
+def step_1_stream_zip(download_path="./data/raw/", output_dir="./data/output", model=None,
+                      manifest_path="./data/cache/ocr_manifest.json", batch_size=500):
+    """
+    Same as step 1, but images are read from the downloaded zip one
+    member at a time and fed to OCR as bytes: no extraction, and the
+    first image reaches OCR right away. Members the OCR manifest already
+    covers are skipped before they are even decompressed.
+    """
+    from src.ingestion.loaders.image_loader import KaggleLoader
+    from src.ingestion.preprocess.ocr import BankStatementOCR
+    from src.ingestion.preprocess.cache import OCRCache
+
+    logger.info("STEP 1: Streaming images from the dataset zip into OCR...")
+
+    loader = KaggleLoader(download_path=download_path)
+    parser = BankStatementOCR(output_dir=output_dir, model=model)
+    cache = OCRCache(manifest_path=manifest_path, model=parser.model, preprocess=parser.preprocess_settings())
+
+    cache.prune([Path(Path(info.filename).name) for info in loader.image_members()], parser.output_dir)
+
+    def members():
+        for name, data in loader.iter_images(skip=lambda info: cache.is_member_current(info, parser.output_dir)):
+            # Stored with the member's CRC, so the next run skips it without reading it
+            fingerprint = cache.member_fingerprint(name, data)
+            if cache.is_current(name, fingerprint, parser.output_dir):
+                cache.record(Path(name), parser.output_path_for(Path(name)))
+                continue
+            yield name, data
+
+    stream = members()
+    results = []
+
+    # Save the manifest after every batch so an interrupted run resumes where it stopped
+    while True:
+        first = next(stream, None)
+        if first is None:
+            break
+
+        batch_results = parser.process_stream(chain([first], islice(stream, batch_size - 1)))
+        for result in batch_results:
+            source_file = Path(result["source_file"])
+            cache.record(source_file, parser.output_path_for(source_file))
+
+        cache.save()
+        results.extend(batch_results)
+
+    cache.save()
+    logger.info(f"Streamed OCR completed. Parsed {len(results)} files.")
+    return results
+
+
 
 # -------------------------------------------------
 # STEP 2: Load JSON files → convert to text docs
 # -------------------------------------------------
 def step_2_ingest_json(output_dir="./data/output"):
+    from src.vectorstore.ingest import JSONIngestor
+
     logger.info("STEP 2: Ingesting JSON files...")
     ingestor = JSONIngestor(input_dir=output_dir)
-    docs = ingestor.load_json_files()
+    docs = ingestor.load_documents()
     logger.info(f"Ingested {len(docs)} documents.")
     return docs
 
@@ -66,20 +146,33 @@ def step_2_ingest_json(output_dir="./data/output"):
 # STEP 3: Build VectorStore (FAISS)
 # -------------------------------------------------
 def step_3_build_vectorstore(docs, index_path="./data/vectorstore/faiss.index",
-                             docstore_path="./data/vectorstore/docstore.json",
+                             docstore_path="./data/vectorstore/docstore.sqlite",
                              embedding_model="sentence-transformers/all-MiniLM-L6-v2"):
 
+    from src.vectorstore.sharded import open_vectorstore
+    from src.vectorstore.snapshots import SnapshotVectorStore
+
     logger.info("STEP 3: Building/Updating VectorStore...")
 
-    # 🔥 Only ONE VectorStore instance is created here
-    vectorstore = VectorStore(
+    # 🔥 Only ONE VectorStore instance is created here (sharded / snapshotted if configs/vectorstore.yaml says so)
+    vectorstore = open_vectorstore(
         index_path=index_path,
         docstore_path=docstore_path,
         embedding_model=embedding_model
     )
 
-    if docs:
-        vectorstore.add_documents(docs)
+    if docs and isinstance(vectorstore, SnapshotVectorStore) and len(vectorstore.docstore):
+        # Answer from the current snapshot right away; the update swaps in when built
+        future = vectorstore.refresh_async(docs)
+        future.add_done_callback(lambda done: logger.info(
+            f"Vectorstore snapshot {done.result()['version']} is live." if done.exception() is None
+            else f"Vectorstore snapshot build failed: {done.exception()}"
+        ))
+        logger.info(f"Serving snapshot {vectorstore.version} while the update builds in the background.")
+    elif docs:
+        # Upserts by stable doc ID: unchanged statements are not re-embedded,
+        # and statements whose JSON was pruned are removed.
+        vectorstore.sync_documents(docs)
         logger.info("Vectorstore updated.")
     else:
         logger.info("No documents found to add.")
@@ -92,6 +185,9 @@ def step_3_build_vectorstore(docs, index_path="./data/vectorstore/faiss.index",
 # -------------------------------------------------
 def step_4_start_rag_interactive(vectorstore, model_name=None, top_k=5):
 
+    from src.retriever.retriever import Retriever
+    from src.pipeline.rag_pipeline import RAGPipeline
+
     logger.info("STEP 4: Initializing Retriever + RAG Pipeline...")
 
     # 🔥 Retriever uses existing VectorStore (no reload!)
@@ -108,8 +204,20 @@ def step_4_start_rag_interactive(vectorstore, model_name=None, top_k=5):
             print("Exiting RAG console...")
             break
 
-        response = rag.query(query)
-        print("\nANSWER:\n", response)
+        # Stream tokens as they arrive; Ctrl+C stops the current answer only
+        stream = rag.query_stream(query)
+        print("\nANSWER:\n", end=" ", flush=True)
+        try:
+            for token in stream:
+                print(token, end="", flush=True)
+        except KeyboardInterrupt:
+            stream.close()
+            print("\n[answer cancelled]", end="")
+        except Exception as e:
+            # e.g. the Ollama connection dropped: never pass a partial answer off as complete
+            logger.error(f"Answer failed: {str(e)}")
+            print(f"\n[answer failed: {e}]", end="")
+        print()
         print("-" * 40)
 
 
@@ -117,6 +225,10 @@ def step_4_start_rag_interactive(vectorstore, model_name=None, top_k=5):
 # MAIN ORCHESTRATION
 # -------------------------------------------------
 def main():
+    from dotenv import load_dotenv
+
+    # Loaded here because the step modules (which used to load it) are now imported lazily
+    load_dotenv()
     model_name = os.getenv("MODEL_NAME")
 
     if not model_name:
@@ -124,8 +236,12 @@ def main():
     else:
         logger.info(f"Using model: {model_name}")
 
-    # 1) OCR: images → JSON
-    step_1_process_images(model=model_name)
+    # 1) OCR: images → JSON (straight from the zip if it was never extracted)
+    raw_dir = Path("./data/raw")
+    if not Path("./data/extracted/images").exists() and any(raw_dir.glob("*.zip")):
+        step_1_stream_zip(download_path=str(raw_dir), model=model_name)
+    else:
+        step_1_process_images(model=model_name)
 
     # 2) JSON → text docs
     docs = step_2_ingest_json()
@@ -136,6 +252,11 @@ def main():
         embedding_model="sentence-transformers/all-MiniLM-L6-v2"
     )
 
+    # Where the indexing run spent its time (OCR, encode, index saves, tokens)
+    from src.utils.metrics import metrics
+    metrics.write_json(METRICS_PATH)
+    logger.info(f"Pipeline metrics written to {METRICS_PATH}")
+
     # 4) Start RAG console using the SAME vectorstore
     step_4_start_rag_interactive(
         vectorstore=vectorstore,
@@ -143,6 +264,9 @@ def main():
         top_k=5
     )
 
+    # ...now including the console session's searches and generations
+    metrics.write_json(METRICS_PATH)
+
 
 if __name__ == "__main__":
     main()
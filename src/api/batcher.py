@@ -0,0 +1,120 @@
+import time
+import asyncio
+from typing import List, Optional
+from src.utils.logger import Logger
+
+
+class QueryBatcher:
+    """
+    Micro-batches concurrent retrieval requests.
+
+    Queries arriving within `max_wait_ms` of each other (up to
+    `max_batch_size`) are embedded and searched together through
+    Retriever.retrieve_batch (vector or hybrid), in a worker thread so the
+    event loop never blocks on the model, FAISS or the BM25 index.
+    """
+
+    def __init__(self, retriever, top_k=5, max_batch_size=64, max_wait_ms=5.0):
+        self.retriever = retriever
+        self.top_k = top_k
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.logger = Logger("QUERY_BATCHER", "./logs/api.log").get_logger()
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight = []         # batch being searched, resolved by _run
+
+        self.batches = 0
+        self.queries = 0
+
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+
+    async def stop(self):
+        """
+        Stop the worker and cancel every search still waiting on it
+        (queued or in the batch being searched), so no caller hangs.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        pending = list(self._inflight)
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._inflight = []
+        for _, _, future in pending:
+            if not future.done():
+                future.cancel()
+        if pending:
+            self.logger.info(f"Batcher stopped, cancelled {len(pending)} pending searches.")
+
+
+    async def search(self, query: str, top_k: Optional[int] = None) -> List[dict]:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k or self.top_k, future))
+        return await future
+
+
+    async def _collect(self):
+        # Kept as in flight while it fills, so stop() can cancel what was taken off the queue
+        self._inflight = batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that went away (client disconnect) are dropped here
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                continue
+
+            queries = [query for query, _, _ in batch]
+            top_k = max(k for _, k, _ in batch)
+
+            try:
+                results = await asyncio.to_thread(self.retriever.retrieve_batch, queries, top_k)
+            except Exception as e:
+                self.logger.error(f"Batched search failed: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+
+            for (_, k, future), hits in zip(batch, results):
+                if not future.done():
+                    future.set_result(hits[:k])
+
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,303 @@
+"""
+server.py
+Async HTTP API around ONE shared VectorStore, Retriever and RAGPipeline.
+
+Run:
+    python -m src.api.server --host 0.0.0.0 --port 8000
+
+Endpoints:
+    POST /query     {"query": "...", "stream": false, "filters": {...}}
+    POST /retrieve  {"queries": ["...", ...], "top_k": 5, "filters": {...}}
+
+`filters` are metadata predicates, e.g. {"bank_name": "HDFC",
+"period": ["2024-03-01", "2024-03-31"]} (see MetadataIndex.where_clause).
+    POST /refresh   re-ingest ./data/output into a new snapshot (snapshots enabled)
+    GET  /health
+    GET  /metrics   (JSON; ?format=prometheus for the Prometheus text format)
+"""
+
+import os
+import json
+import asyncio
+import argparse
+from aiohttp import web
+from dotenv import load_dotenv
+
+from src.api.batcher import QueryBatcher
+from src.utils.config import load_config
+from src.vectorstore.metadata import MetadataIndex
+from src.utils.logger import Logger
+from src.utils.metrics import metrics
+
+
+DEFAULT_SERVER_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 8000,
+    "top_k": 5,
+    "max_batch_size": 64,
+    "max_batch_wait_ms": 5,
+    "max_concurrent_generations": 4,    # match OLLAMA_NUM_PARALLEL
+    "max_pending_requests": 256,        # beyond this, answer 503 instead of queueing
+    "max_top_k": 100,                   # largest top_k /retrieve accepts
+}
+
+
+class RAGServer:
+
+    def __init__(self, rag, batcher: QueryBatcher, max_pending_requests=256, max_top_k=100):
+        self.rag = rag
+        self.batcher = batcher
+        self.max_pending_requests = max_pending_requests
+        self.max_top_k = max_top_k
+        self.pending = 0
+        self.rejected = 0
+        # Last POST /refresh build, reported on /health
+        self.refresh_future = None
+
+        self.logger = Logger("RAG_API", "./logs/api.log").get_logger()
+
+
+    async def _retrieve_hits(self, query: str):
+        return await self.batcher.search(query)
+
+
+    def _admit(self):
+        if self.pending >= self.max_pending_requests:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(text="Server busy, retry later.")
+        self.pending += 1
+
+
+    @staticmethod
+    async def _read_body(request: web.Request) -> dict:
+        try:
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise web.HTTPBadRequest(text=f"Request body is not valid JSON: {e}")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="Request body must be a JSON object")
+        return body
+
+
+    @staticmethod
+    def _read_filters(body: dict):
+        filters = body.get("filters")
+        if filters:
+            try:
+                MetadataIndex.where_clause(filters)
+            except (ValueError, TypeError, AttributeError) as e:
+                raise web.HTTPBadRequest(text=f"Invalid filters: {e}")
+        return filters
+
+
+    def _read_top_k(self, body: dict):
+        top_k = body.get("top_k")
+        if top_k is None:
+            return None
+        # bool is an int subclass: reject true/false as well
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= self.max_top_k:
+            raise web.HTTPBadRequest(text=f"'top_k' must be an integer between 1 and {self.max_top_k}")
+        return top_k
+
+
+    async def handle_query(self, request: web.Request):
+        body = await self._read_body(request)
+        query = body.get("query")
+        query = query.strip() if isinstance(query, str) else ""
+        if not query:
+            raise web.HTTPBadRequest(text="'query' is required")
+
+        filters = self._read_filters(body)
+        # Filtered queries skip the micro-batcher, whose batches share one candidate set
+        retrieve = None if filters else self._retrieve_hits
+
+        self._admit()
+        try:
+            if not body.get("stream"):
+                answer = await self.rag.aquery(query, retrieve=retrieve, filters=filters)
+                return web.json_response({"query": query, "answer": answer})
+
+            response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+            await response.prepare(request)
+
+            stream = self.rag.aquery_stream(query, retrieve=retrieve, filters=filters)
+            try:
+                async for token in stream:
+                    await response.write(token.encode("utf-8"))
+            except (ConnectionResetError, asyncio.CancelledError):
+                # Client went away: stop generating instead of finishing the answer
+                self.logger.info("Client disconnected, cancelling generation.")
+                raise
+            finally:
+                await stream.aclose()
+
+            await response.write_eof()
+            return response
+
+        finally:
+            self.pending -= 1
+
+
+    async def handle_retrieve(self, request: web.Request):
+        body = await self._read_body(request)
+        queries = body.get("queries") or ([body["query"]] if body.get("query") else [])
+        if not queries:
+            raise web.HTTPBadRequest(text="'queries' (or 'query') is required")
+        if not isinstance(queries, list) or not all(isinstance(query, str) and query.strip() for query in queries):
+            raise web.HTTPBadRequest(text="'queries' must be a list of non-empty strings")
+
+        top_k = self._read_top_k(body)
+        filters = self._read_filters(body)
+        self._admit()
+        try:
+            if filters:
+                results = await asyncio.to_thread(self.rag.retriever.retrieve_batch, queries, top_k, filters)
+            else:
+                # Concurrent searches land in the same micro-batch
+                results = await asyncio.gather(*(self.batcher.search(query, top_k) for query in queries))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        finally:
+            self.pending -= 1
+
+        return web.json_response({"results": [
+            {"query": query, "hits": hits} for query, hits in zip(queries, results)
+        ]})
+
+
+    async def handle_refresh(self, request: web.Request):
+        """
+        Re-ingest the OCR output into a new snapshot built in the background;
+        queries keep being answered from the live one until it is swapped in.
+        """
+        from src.vectorstore.ingest import JSONIngestor
+
+        vectorstore = self.rag.retriever.vectorstore
+        if not hasattr(vectorstore, "refresh_async"):
+            raise web.HTTPConflict(text="Refresh needs snapshots (configs/vectorstore.yaml: snapshots.enabled)")
+
+        docs = await asyncio.to_thread(JSONIngestor(input_dir="./data/output").load_documents)
+        self.refresh_future = vectorstore.refresh_async(docs)
+        self.refresh_future.add_done_callback(self._log_refresh)
+        self.logger.info(f"Snapshot refresh started with {len(docs)} documents.")
+        return web.json_response({"documents": len(docs), "live_version": vectorstore.version}, status=202)
+
+
+    def _log_refresh(self, future):
+        if future.exception() is None:
+            self.logger.info(f"Snapshot {future.result()['version']} is live.")
+        else:
+            self.logger.error(f"Snapshot refresh failed: {future.exception()}")
+
+
+    def _refresh_status(self):
+        future = self.refresh_future
+        if future is None:
+            return None
+        if not future.done():
+            return {"state": "running"}
+        if future.exception() is not None:
+            return {"state": "failed", "error": str(future.exception())}
+        return {"state": "done", "version": future.result()["version"]}
+
+
+    async def handle_health(self, request: web.Request):
+        vectorstore = self.rag.retriever.vectorstore
+        return web.json_response({
+            "status": "ok",
+            "documents": len(vectorstore.docstore),
+            "store_version": vectorstore.version,
+            "refresh": self._refresh_status(),
+        })
+
+
+    async def handle_metrics(self, request: web.Request):
+        if request.query.get("format") == "prometheus":
+            text = metrics.to_prometheus() + "\n".join([
+                "# TYPE finsight_pending_requests gauge",
+                f"finsight_pending_requests {self.pending}",
+                "# TYPE finsight_rejected_requests counter",
+                f"finsight_rejected_requests {self.rejected}",
+            ]) + "\n"
+            return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+        vectorstore = self.rag.retriever.vectorstore
+        stats = {
+            "pending_requests": self.pending,
+            "rejected_requests": self.rejected,
+            "batcher": self.batcher.stats(),
+            **metrics.snapshot(),
+        }
+        if vectorstore.embedding_cache is not None:
+            stats["embedding_cache"] = vectorstore.embedding_cache.stats()
+        if self.rag.response_cache is not None:
+            stats["response_cache"] = self.rag.response_cache.stats()
+        return web.json_response(stats)
+
+
+    async def _on_startup(self, app):
+        self.batcher.start()
+
+
+    async def _on_cleanup(self, app):
+        await self.batcher.stop()
+        await self.rag.llm.aclose()
+
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/query", self.handle_query),
+            web.post("/retrieve", self.handle_retrieve),
+            web.post("/refresh", self.handle_refresh),
+            web.get("/health", self.handle_health),
+            web.get("/metrics", self.handle_metrics),
+        ])
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def create_server(vectorstore, model_name=None, config=None) -> RAGServer:
+    from src.retriever.retriever import Retriever
+    from src.pipeline.rag_pipeline import RAGPipeline
+
+    config = config or load_config("./configs/model_config.yaml", "server", DEFAULT_SERVER_CONFIG)
+
+    retriever = Retriever(vectorstore=vectorstore, top_k=config["top_k"])
+    rag = RAGPipeline(retriever=retriever, model_name=model_name or "qwen3:0.6b", top_k=config["top_k"])
+    rag.llm.max_concurrency = int(config["max_concurrent_generations"])
+
+    batcher = QueryBatcher(
+        retriever,
+        top_k=config["top_k"],
+        max_batch_size=int(config["max_batch_size"]),
+        max_wait_ms=float(config["max_batch_wait_ms"])
+    )
+    return RAGServer(
+        rag, batcher,
+        max_pending_requests=int(config["max_pending_requests"]),
+        max_top_k=int(config.get("max_top_k", DEFAULT_SERVER_CONFIG["max_top_k"]))
+    )
+
+
+def main():
+    from src.vectorstore.sharded import open_vectorstore
+
+    load_dotenv()
+    config = load_config("./configs/model_config.yaml", "server", DEFAULT_SERVER_CONFIG)
+
+    parser = argparse.ArgumentParser(description="FinSight-OCR RAG API server")
+    parser.add_argument("--host", default=config["host"])
+    parser.add_argument("--port", type=int, default=config["port"])
+    args = parser.parse_args()
+
+    # Loaded once and shared by every request; mmap keeps startup fast
+    vectorstore = open_vectorstore(mmap_index=True)
+    server = create_server(vectorstore, model_name=os.getenv("MODEL_NAME"), config=config)
+
+    web.run_app(server.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import os
 import zipfile
 import subprocess
+from pathlib import Path
 from dotenv import load_dotenv
 
 
 load_dotenv()
 
 DATASET = os.getenv("DATASET_LINK")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.bmp', '.gif', '.webp')
 
 class KaggleLoader:
     def __init__(self, dataset=DATASET, download_path='./data/raw/', extract_path='./data/extracted/'):
@@ -31,12 +33,16 @@ class KaggleLoader:
         print("Download completed.")
 
     
-    def extract(self):
-        zip_files = [f for f in os.listdir(self.download_path) if f.endswith('.zip')]
+    def zip_path(self):
+        zip_files = sorted(f for f in os.listdir(self.download_path) if f.endswith('.zip'))
         if not zip_files:
             raise FileNotFoundError("No zip files found in the download path.")
 
-        zip_path = os.path.join(self.download_path, zip_files[0])
+        return os.path.join(self.download_path, zip_files[0])
+
+    
+    def extract(self):
+        zip_path = self.zip_path()
         extract_to = os.path.join(self.extract_path)
 
         print(f'Extracting {zip_path} to {extract_to}...')
@@ -49,3 +55,40 @@ class KaggleLoader:
         print("Extraction completed.")
         return extract_to
     
+
+    
+    def image_members(self):
+        """
+        Image entries of the downloaded zip, read from its central
+        directory only (nothing is decompressed).
+        """
+        with zipfile.ZipFile(self.zip_path(), 'r') as zip_ref:
+            return [
+                info for info in zip_ref.infolist()
+                if not info.is_dir() and Path(info.filename).suffix.lower() in IMAGE_EXTENSIONS
+            ]
+
+    
+    def iter_images(self, skip=None):
+        """
+        Stream (file name, image bytes) for every image in the zip without
+        extracting it. `skip(info)` can reject members before they are
+        decompressed, e.g. images the OCR cache has already processed.
+        Folder names inside the archive are dropped, as with the
+        extracted images directory.
+        """
+        zip_path = self.zip_path()
+        print(f'Streaming images from {zip_path}...')
+
+        skipped = 0
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir() or Path(info.filename).suffix.lower() not in IMAGE_EXTENSIONS:
+                    continue
+                if skip is not None and skip(info):
+                    skipped += 1
+                    continue
+
+                yield Path(info.filename).name, zip_ref.read(info)
+
+        print(f"Streaming completed ({skipped} images skipped).")
@@ -0,0 +1,283 @@
+import os
+import json
+import zlib
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from src.utils.logger import Logger
+from src.llm.prompt_template import prompt
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(path, chunk_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OCRCache:
+    """
+    Persistent manifest of OCR results, keyed by image content hash,
+    model name, prompt hash and the image preprocessing settings.
+
+    Only new or changed images are sent to OCR. The file size and mtime
+    are kept next to the hash, so unchanged images are never re-read and
+    a re-run over a large, unchanged corpus costs one stat() per image.
+    """
+
+    VERSION = 1
+
+    def __init__(self, manifest_path="./data/cache/ocr_manifest.json", model=None, prompt_text=prompt,
+                 preprocess: Optional[Dict[str, Any]] = None):
+        self.manifest_path = Path(manifest_path)
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.model = model
+        self.prompt_hash = hash_text(prompt_text)
+        # Preprocessed images give different OCR results: None = originals were sent
+        self.preprocess_hash = hash_text(json.dumps(preprocess, sort_keys=True)) if preprocess else None
+
+        self.logger = Logger("OCR_CACHE", "./logs/ocr_cache.log").get_logger()
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._fingerprints: Dict[str, Dict[str, Any]] = {}
+        # Parquet datasets plan() appends reused results to, closed at its end
+        self._dataset_writers: Dict[Path, Any] = {}
+        self._load()
+
+
+    def _load(self):
+        if not self.manifest_path.exists():
+            self.logger.info("No OCR manifest found, starting a new one.")
+            return
+
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.entries = manifest.get("entries", {})
+            self.logger.info(f"Loaded OCR manifest with {len(self.entries)} entries.")
+        except (json.JSONDecodeError, OSError) as e:
+            self.logger.error(f"Failed to read OCR manifest, starting a new one: {e}")
+            self.entries = {}
+
+
+    def save(self):
+        manifest = {"version": self.VERSION, "entries": self.entries}
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        # Atomic on POSIX and Windows: readers never see a half-written manifest
+        os.replace(tmp_path, self.manifest_path)
+        self.logger.info(f"OCR manifest saved ({len(self.entries)} entries).")
+
+
+    def _cache_key(self, sha256: str) -> tuple:
+        return (sha256, self.model, self.prompt_hash, self.preprocess_hash)
+
+
+    def fingerprint(self, image_file: Path) -> Dict[str, Any]:
+        stat = image_file.stat()
+        entry = self.entries.get(image_file.name)
+
+        # Fast path: same size and mtime as last time -> reuse the stored hash
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            sha256 = entry["sha256"]
+        else:
+            sha256 = hash_file(image_file)
+
+        fingerprint = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self._fingerprints[image_file.name] = fingerprint
+        return fingerprint
+
+
+    def member_fingerprint(self, name: str, data: bytes) -> Dict[str, Any]:
+        """
+        Fingerprint of a zip member streamed by KaggleLoader.iter_images.
+        Its CRC-32 (the same value the zip directory stores) is kept too,
+        so later runs can skip the member without decompressing it.
+        """
+        fingerprint = {
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "mtime_ns": None,
+            "crc32": zlib.crc32(data),
+        }
+        self._fingerprints[name] = fingerprint
+        return fingerprint
+
+
+    def is_member_current(self, info, output_dir) -> bool:
+        """
+        True when this zip member (same CRC and size) was already OCR'd
+        with the current model and prompt, and its output still exists.
+        """
+        entry = self.entries.get(Path(info.filename).name)
+        return bool(
+            entry
+            and entry.get("crc32") == info.CRC
+            and entry.get("size") == info.file_size
+            and self._is_current(entry, self._cache_key(entry["sha256"]), Path(output_dir))
+        )
+
+
+    def is_current(self, name: str, fingerprint: Dict[str, Any], output_dir) -> bool:
+        entry = self.entries.get(name)
+        return bool(entry) and self._is_current(entry, self._cache_key(fingerprint["sha256"]), Path(output_dir))
+
+
+    def _is_current(self, entry: Dict[str, Any], key: tuple, output_dir: Path) -> bool:
+        return self._entry_key(entry) == key and (output_dir / entry["output"]).exists()
+
+
+    def plan(self, image_files: List[Path], output_dir, output_path_for: Optional[Callable[[Path], Path]] = None) -> List[Path]:
+        """
+        Return the images that still need OCR. Images whose content was
+        already processed under another file name reuse that result.
+
+        `output_path_for` is BankStatementOCR.output_path_for: a
+        *_parsed.json per image by default, or the Parquet dataset root.
+        """
+        output_dir = Path(output_dir)
+        output_path_for = output_path_for or (lambda image_file: output_dir / f"{image_file.stem}_parsed.json")
+
+        by_key = {}
+        for name, entry in self.entries.items():
+            if (output_dir / entry["output"]).exists():
+                by_key[self._entry_key(entry)] = name
+
+        to_process = []
+        adopted = reused = 0
+        stored_sources = None
+
+        for image_file in image_files:
+            fingerprint = self.fingerprint(image_file)
+            key = self._cache_key(fingerprint["sha256"])
+            entry = self.entries.get(image_file.name)
+            output_path = Path(output_path_for(image_file))
+
+            if entry and self._is_current(entry, key, output_dir):
+                continue
+
+            if entry is None:
+                # Output from a run that predates the manifest: adopt it as-is
+                if output_path.is_dir():
+                    if stored_sources is None:
+                        from src.ingestion.preprocess.columnar import latest_sources
+                        stored_sources = latest_sources(output_path)
+                    legacy = image_file.name in stored_sources
+                else:
+                    legacy = output_path.exists()
+                if legacy:
+                    self.record(image_file, output_path)
+                    adopted += 1
+                    continue
+
+            if key in by_key and by_key[key] != image_file.name:
+                if self._reuse(by_key[key], output_dir, image_file, output_path):
+                    reused += 1
+                    continue
+
+            to_process.append(image_file)
+
+        for writer in self._dataset_writers.values():
+            writer.close()
+        self._dataset_writers = {}
+
+        self.logger.info(
+            f"OCR cache: {len(image_files) - len(to_process)} up to date "
+            f"({adopted} adopted, {reused} reused), {len(to_process)} to process"
+        )
+        return to_process
+
+
+    def _entry_key(self, entry: Dict[str, Any]) -> tuple:
+        return (entry["sha256"], entry.get("model"), entry.get("prompt_hash"), entry.get("preprocess_hash"))
+
+
+    def _reuse(self, source_name: str, output_dir: Path, image_file: Path, output_path: Path) -> bool:
+        """
+        Copy the result OCR'd for `source_name` (same content) to `image_file`:
+        a new JSON file, or a new row in the Parquet dataset.
+        """
+        source_output = output_dir / self.entries[source_name]["output"]
+        try:
+            if source_output.is_dir():
+                from src.ingestion.preprocess.columnar import read_result
+                result = read_result(source_output, source_name)
+                if result is None:
+                    raise ValueError(f"no row for {source_name} in {source_output}")
+            else:
+                with open(source_output, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+
+            result["source_file"] = image_file.name
+            if output_path.is_dir():
+                from src.ingestion.preprocess.columnar import OCRDatasetWriter
+                # A fresh timestamp, so the copy outranks older rows of this image
+                result["processing_timestamp"] = datetime.now().isoformat()
+                writer = self._dataset_writers.get(output_path)
+                if writer is None:
+                    writer = self._dataset_writers[output_path] = OCRDatasetWriter(output_path)
+                writer.write(result)
+            else:
+                with open(output_path, "w", encoding="utf-8") as f:
+                    json.dump(result, f, indent=4, ensure_ascii=False)
+        except Exception as e:
+            self.logger.warning(f"Could not reuse the OCR result of {source_name} for {image_file.name}, re-running OCR: {e}")
+            return False
+
+        self.record(image_file, output_path)
+        return True
+
+
+    def record(self, image_file: Path, output_path: Path):
+        fingerprint = self._fingerprints.get(image_file.name) or self.fingerprint(image_file)
+
+        self.entries[image_file.name] = {
+            **fingerprint,
+            "model": self.model,
+            "prompt_hash": self.prompt_hash,
+            "preprocess_hash": self.preprocess_hash,
+            "output": Path(output_path).name,
+            "updated": datetime.now().isoformat(),
+        }
+
+
+    def prune(self, image_files: List[Path], output_dir) -> int:
+        """
+        Drop manifest entries (and their JSON outputs or Parquet rows) for
+        images that no longer exist in the input directory.
+        """
+        output_dir = Path(output_dir)
+        current = {image_file.name for image_file in image_files}
+        removed = 0
+        dataset_rows: Dict[Path, List[str]] = {}
+
+        for name in [name for name in self.entries if name not in current]:
+            entry = self.entries.pop(name)
+            output_path = output_dir / entry["output"]
+            if output_path.is_dir():
+                # Parquet dataset: rows are append-only, so write tombstones
+                dataset_rows.setdefault(output_path, []).append(name)
+            elif output_path.exists():
+                output_path.unlink()
+            removed += 1
+
+        if dataset_rows:
+            from src.ingestion.preprocess.columnar import OCRDatasetWriter
+            for dataset_path, names in dataset_rows.items():
+                writer = OCRDatasetWriter(dataset_path)
+                writer.delete(names)
+                writer.close()
+
+        if removed:
+            self.logger.info(f"Pruned {removed} outputs for deleted images.")
+        return removed
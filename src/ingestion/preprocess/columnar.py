@@ -0,0 +1,198 @@
+import os
+import json
+import uuid
+import threading
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+from src.ingestion.preprocess.ocr_schema import OCR_FIELDS
+from src.utils.logger import Logger
+from src.vectorstore.metadata import normalise_amount
+
+
+DATASET_DIR = "ocr_dataset"
+
+# One column per field requested in src/llm/prompt_template.prompt, in prompt order
+PROMPT_FIELDS = tuple(OCR_FIELDS)
+AMOUNT_FIELDS = tuple(name for name, kind in OCR_FIELDS.items() if kind == "number")
+
+OCR_SCHEMA = pa.schema(
+    [
+        ("source_file", pa.string()),
+        ("processing_timestamp", pa.string()),      # ISO 8601, sorts chronologically
+    ]
+    + [(name, pa.float64() if name in AMOUNT_FIELDS else pa.string()) for name in PROMPT_FIELDS]
+    + [
+        ("extra", pa.string()),                     # JSON of keys the model added outside the schema
+        ("deleted", pa.bool_()),                    # tombstone for images removed from the input dir
+    ]
+)
+FIELDS = OCR_SCHEMA.names
+# Hive-style partition column, derived from processing_timestamp
+PARTITIONING = ds.partitioning(pa.schema([("ocr_date", pa.string())]), flavor="hive")
+
+
+def to_record(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fit one OCR result dict into OCR_SCHEMA: amounts become floats, other
+    fields strings, unknown keys go to `extra`.
+    """
+    record = {"deleted": False}
+    for name in FIELDS[:-2]:
+        value = result.get(name)
+        if name in AMOUNT_FIELDS:
+            record[name] = normalise_amount(value)
+        else:
+            record[name] = None if value is None else str(value)
+
+    record["processing_timestamp"] = record["processing_timestamp"] or datetime.now().isoformat()
+    extra = {key: value for key, value in result.items() if key not in FIELDS}
+    record["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return record
+
+
+def from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inverse of to_record: the OCR result dict as JSONIngestor expects it.
+    """
+    result = {name: record.get(name) for name in FIELDS if name not in ("extra", "deleted")}
+    if record.get("extra"):
+        result.update(json.loads(record["extra"]))
+    return result
+
+
+class OCRDatasetWriter:
+    """
+    Buffers OCR results and appends them to a Hive-partitioned Parquet
+    dataset (ocr_date=YYYY-MM-DD/part-*.parquet) with OCR_SCHEMA.
+
+    Rows are only appended, never rewritten: a re-OCR'd image simply gets
+    a newer row, and removed images get a tombstone. Readers keep the
+    latest row per source_file (see iter_results).
+    """
+
+    def __init__(self, root, rows_per_file=10000):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.rows_per_file = rows_per_file
+
+        self.logger = Logger("OCR_DATASET", "./logs/ocr.log").get_logger()
+
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+
+
+    def write(self, result: Dict[str, Any]):
+        with self._lock:
+            self._buffer.append(to_record(result))
+            if len(self._buffer) >= self.rows_per_file:
+                self._flush_locked()
+
+
+    def delete(self, source_files: Iterable[str]):
+        now = datetime.now().isoformat()
+        with self._lock:
+            for source_file in source_files:
+                self._buffer.append({
+                    **{name: None for name in FIELDS},
+                    "source_file": source_file, "processing_timestamp": now, "deleted": True
+                })
+
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self._buffer:
+            by_date.setdefault(record["processing_timestamp"][:10], []).append(record)
+
+        for ocr_date, records in by_date.items():
+            partition = self.root / f"ocr_date={ocr_date}"
+            partition.mkdir(parents=True, exist_ok=True)
+
+            name = f"part-{datetime.now().strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+            # Dot-prefixed files are ignored by dataset discovery until renamed
+            tmp_path = partition / f".{name}.tmp"
+            pq.write_table(pa.Table.from_pylist(records, schema=OCR_SCHEMA), tmp_path, compression="zstd")
+            os.replace(tmp_path, partition / name)
+
+        self.logger.info(f"Wrote {len(self._buffer)} OCR rows to {self.root}")
+        self._buffer = []
+
+
+    def close(self):
+        self.flush()
+
+
+def _open_dataset(root):
+    return ds.dataset(root, format="parquet", schema=OCR_SCHEMA, partitioning=PARTITIONING)
+
+
+def latest_sources(root, batch_size=4096) -> Set[str]:
+    """
+    source_file of every image whose latest row is not a tombstone,
+    reading only three narrow columns.
+    """
+    root = Path(root)
+    if not root.exists():
+        return set()
+
+    latest: Dict[str, tuple] = {}
+    columns = ["source_file", "processing_timestamp", "deleted"]
+    for batch in _open_dataset(root).to_batches(columns=columns, batch_size=batch_size):
+        for source_file, timestamp, deleted in zip(*(column.to_pylist() for column in batch.columns)):
+            if source_file is not None and timestamp > latest.get(source_file, ("",))[0]:
+                latest[source_file] = (timestamp, deleted)
+    return {source_file for source_file, (_, deleted) in latest.items() if not deleted}
+
+
+def read_result(root, source_file: str) -> Optional[Dict[str, Any]]:
+    """
+    The latest OCR result for one image, or None if it has none (or was deleted).
+    """
+    root = Path(root)
+    if not root.exists():
+        return None
+
+    rows = _open_dataset(root).to_table(columns=FIELDS, filter=ds.field("source_file") == source_file).to_pylist()
+    if not rows:
+        return None
+    latest = max(rows, key=lambda record: record["processing_timestamp"])
+    return None if latest["deleted"] else from_record(latest)
+
+
+def iter_results(root, batch_size=4096) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the latest, non-deleted OCR result per source_file from a
+    dataset written by OCRDatasetWriter, one record batch at a time.
+    """
+    root = Path(root)
+    if not root.exists():
+        return
+
+    dataset = _open_dataset(root)
+
+    # Pass 1 reads only two narrow columns to find each image's latest row
+    latest: Dict[str, str] = {}
+    for batch in dataset.to_batches(columns=["source_file", "processing_timestamp"], batch_size=batch_size):
+        for source_file, timestamp in zip(*(column.to_pylist() for column in batch.columns)):
+            if source_file is not None and timestamp > latest.get(source_file, ""):
+                latest[source_file] = timestamp
+
+    # Pass 2 streams full rows and yields only the winners
+    for batch in dataset.to_batches(columns=FIELDS, batch_size=batch_size):
+        for record in batch.to_pylist():
+            if latest.get(record["source_file"]) != record["processing_timestamp"] or record["deleted"]:
+                continue
+            # Equal timestamps (should not happen) would otherwise yield twice
+            latest.pop(record["source_file"])
+            yield from_record(record)
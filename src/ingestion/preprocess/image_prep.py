@@ -0,0 +1,235 @@
+import io
+import os
+import time
+import numpy as np
+from pathlib import Path
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, ImageSequence
+from src.utils.config import load_config
+from src.utils.logger import Logger
+
+
+DEFAULT_PREPROCESS_CONFIG = {
+    "enabled": False,           # opt-in: it changes what the OCR model sees
+    "max_side": 1600,           # longest side in pixels after downscaling
+    "grayscale": True,
+    "autocrop": True,
+    "crop_threshold": 240,      # pixels brighter than this count as blank margin
+    "crop_padding": 12,
+    "deskew": True,
+    "max_skew_degrees": 5.0,
+    "workers": 0,               # process pool size, 0 = cpu_count - 1
+    "output_dir": "./data/cache/preprocessed",
+    "keep_outputs": False,      # delete prepared pages once OCR has used them
+}
+# Settings that change the prepared image, and so the OCR result (see settings())
+OUTPUT_SETTINGS = ("max_side", "grayscale", "autocrop", "crop_threshold", "crop_padding", "deskew", "max_skew_degrees")
+
+
+def autocrop(image: Image.Image, threshold: int = 240, padding: int = 12) -> Image.Image:
+    """
+    Crop blank (near-white) margins, keeping `padding` pixels around the content.
+    """
+    pixels = np.asarray(image.convert("L"))
+    rows = np.flatnonzero((pixels < threshold).any(axis=1))
+    cols = np.flatnonzero((pixels < threshold).any(axis=0))
+    if not len(rows) or not len(cols):
+        return image
+
+    top, bottom = max(rows[0] - padding, 0), min(rows[-1] + padding + 1, pixels.shape[0])
+    left, right = max(cols[0] - padding, 0), min(cols[-1] + padding + 1, pixels.shape[1])
+    return image.crop((left, top, right, bottom))
+
+
+def estimate_skew(image: Image.Image, max_degrees: float = 5.0, step: float = 0.5) -> float:
+    """
+    Projection-profile skew estimate: text lines give the sharpest row
+    profile (highest variance of row sums) when they are horizontal.
+    Runs on a small thumbnail, so it costs a few milliseconds.
+    """
+    thumb = image.convert("L")
+    thumb.thumbnail((800, 800))
+    ink = Image.fromarray(((np.asarray(thumb) < 160) * 255).astype(np.uint8))
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_degrees, max_degrees + step / 2, step):
+        profile = np.asarray(ink.rotate(angle, fillcolor=0)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def prepare_page(page: Image.Image, config: Dict[str, Any]) -> Image.Image:
+    page = ImageOps.exif_transpose(page)
+    page = page.convert("L") if config["grayscale"] else page.convert("RGB")
+
+    # Downscale first so crop / deskew work on fewer pixels
+    max_side = int(config["max_side"])
+    if max_side and max(page.size) > max_side:
+        page.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    if config["deskew"]:
+        angle = estimate_skew(page, float(config["max_skew_degrees"]))
+        if abs(angle) >= 0.25:
+            fill = 255 if page.mode == "L" else (255, 255, 255)
+            page = page.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=fill)
+
+    if config["autocrop"]:
+        page = autocrop(page, int(config["crop_threshold"]), int(config["crop_padding"]))
+
+    return page
+
+
+def preprocess_image(image_path, config: Dict[str, Any], data: Optional[bytes] = None) -> Dict[str, Any]:
+    """
+    Prepare one input image for the vision model; multi-page TIFFs are
+    split into one PNG per page. `data` holds the image bytes when it is
+    streamed (e.g. from a zip) rather than read from `image_path`. Runs
+    in a worker process, so it only takes and returns picklable values.
+    """
+    image_path = Path(image_path)
+    output_dir = Path(config["output_dir"])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+
+    pages, before_pixels, after_pixels = [], 0, 0
+    with Image.open(io.BytesIO(data) if data is not None else image_path) as image:
+        frames = list(ImageSequence.Iterator(image))
+        for number, frame in enumerate(frames, 1):
+            before_pixels += frame.size[0] * frame.size[1]
+            page = prepare_page(frame.copy(), config)
+            after_pixels += page.size[0] * page.size[1]
+
+            # Full name keeps stmt.jpg and stmt.png apart
+            suffix = f"_p{number}" if len(frames) > 1 else ""
+            page_path = output_dir / f"{image_path.name}{suffix}.png"
+            page.save(page_path, optimize=True)
+            pages.append(str(page_path))
+
+    return {
+        "source": image_path.name,
+        "pages": pages,
+        "before_bytes": len(data) if data is not None else image_path.stat().st_size,
+        "after_bytes": sum(os.path.getsize(page) for page in pages),
+        "before_pixels": before_pixels,
+        "after_pixels": after_pixels,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+class ImagePreprocessor:
+    """
+    Downscale, grayscale, auto-crop and deskew statement images (and split
+    multi-page TIFFs) in a process pool, ahead of the OCR workers.
+
+    Keeps running before/after size and latency totals in `self.totals`.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = config or load_config("./configs/ocr.yaml", "preprocess", DEFAULT_PREPROCESS_CONFIG)
+        self.workers = int(self.config["workers"]) or max(1, (os.cpu_count() or 2) - 1)
+        # Sums, not per-image records: constant memory however many images a run has
+        self.totals: Dict[str, float] = dict.fromkeys(
+            ("images", "pages", "before_bytes", "after_bytes", "before_pixels", "after_pixels", "seconds"), 0
+        )
+
+        self.logger = Logger("IMAGE_PREP", "./logs/ocr.log").get_logger()
+
+
+    def settings(self) -> Dict[str, Any]:
+        """
+        The settings that shape the prepared image, for the OCR cache key.
+        """
+        return {key: self.config[key] for key in OUTPUT_SETTINGS}
+
+
+    def iter_prepared(self, image_files: List[Path]) -> Iterator[Tuple[Path, Optional[List[str]]]]:
+        """
+        Yield (image_file, prepared page paths) in input order as soon as
+        each image is ready. A failed image yields None pages, meaning
+        "send the original".
+        """
+        return self._iter_pool((image_file, None) for image_file in image_files)
+
+
+    def iter_prepared_bytes(self, members: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[Path, List]]:
+        """
+        Same for streamed (name, image bytes) pairs. A failed image yields
+        its original bytes as the only page.
+        """
+        for image_file, pages, data in self._iter_pool_with_data(
+            (Path(name), data) for name, data in members
+        ):
+            yield image_file, pages if pages is not None else [data]
+
+
+    def _iter_pool(self, items):
+        for image_file, pages, _ in self._iter_pool_with_data(items):
+            yield image_file, pages
+
+
+    def _iter_pool_with_data(self, items):
+        if self.workers == 1:
+            for image_file, data in items:
+                yield image_file, self._collect(image_file, preprocess_image, str(image_file), self.config, data), data
+            return
+
+        # At most 2 * workers images in flight: streamed inputs stay bounded in memory
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for image_file, data in items:
+                pending.append((image_file, data, pool.submit(preprocess_image, str(image_file), self.config, data)))
+                if len(pending) >= 2 * self.workers:
+                    image_file, data, future = pending.popleft()
+                    yield image_file, self._collect(image_file, future.result), data
+
+            while pending:
+                image_file, data, future = pending.popleft()
+                yield image_file, self._collect(image_file, future.result), data
+
+
+    def _collect(self, image_file: Path, get_result, *args) -> Optional[List[str]]:
+        try:
+            stats = get_result(*args)
+        except Exception as e:
+            self.logger.warning(f"Preprocessing failed for {image_file.name}, using original: {str(e)}")
+            return None
+
+        self.totals["images"] += 1
+        self.totals["pages"] += len(stats["pages"])
+        for key in ("before_bytes", "after_bytes", "before_pixels", "after_pixels", "seconds"):
+            self.totals[key] += stats[key]
+        self.logger.info(
+            f"Prepared {stats['source']}: {len(stats['pages'])} page(s), "
+            f"{stats['before_bytes'] / 1024:.0f}KB -> {stats['after_bytes'] / 1024:.0f}KB, "
+            f"{stats['before_pixels'] / 1e6:.1f}MP -> {stats['after_pixels'] / 1e6:.1f}MP "
+            f"in {stats['seconds']:.2f}s"
+        )
+        return stats["pages"]
+
+
+    def cleanup(self, pages: Optional[List[str]]):
+        if self.config["keep_outputs"]:
+            return
+        for page in pages or []:
+            # Streamed originals are bytes, only prepared pages are files
+            if isinstance(page, str):
+                Path(page).unlink(missing_ok=True)
+
+
+    def summary(self) -> Dict[str, Any]:
+        totals = self.totals
+        if not totals["images"]:
+            return {"images": 0}
+
+        return {
+            "images": totals["images"],
+            "pages": totals["pages"],
+            "before_bytes": totals["before_bytes"],
+            "after_bytes": totals["after_bytes"],
+            "pixel_ratio": round(totals["after_pixels"] / max(totals["before_pixels"], 1), 4),
+            "avg_seconds": round(totals["seconds"] / totals["images"], 4),
+        }
@@ -1,13 +1,18 @@
 from ollama import Client
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pathlib import Path
+from collections import deque
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.ingestion.preprocess.ocr_schema import OCR_JSON_SCHEMA, coerce_result, extract_json, filled_fields
+from src.utils.config import load_config
 from src.utils.logger import Logger
+from src.utils.metrics import metrics
 from src.llm.prompt_template import prompt
 import os
-import re
 import json
+import time
 
 
 load_dotenv()
@@ -15,6 +20,24 @@ load_dotenv()
 
 OLLAMA_API_KEY = os.getenv('OLLAMA_API_KEY')
 MODEL_NAME = os.getenv('MODEL_NAME')
+OCR_MAX_WORKERS = int(os.getenv('OCR_MAX_WORKERS', '1'))
+OCR_OUTPUT_FORMAT = os.getenv('OCR_OUTPUT_FORMAT', 'json')
+OCR_PREPROCESS = os.getenv('OCR_PREPROCESS')
+
+DEFAULT_PARSING_CONFIG = {
+    "min_fields": 1,            # fewer readable statement fields counts as a failed parse
+    "retry_format": "schema",   # schema | json | none: how failed parses are retried
+}
+
+def preprocess_enabled() -> bool:
+    """
+    Image preprocessing is opt-in, since it changes the OCR input: the
+    OCR_PREPROCESS env var (1/true/yes) if set, else configs/ocr.yaml.
+    """
+    if OCR_PREPROCESS is not None:
+        return OCR_PREPROCESS.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(load_config("./configs/ocr.yaml", "preprocess", {"enabled": False})["enabled"])
+
 
 class BankStatementOCR:
 
@@ -22,33 +45,90 @@ class BankStatementOCR:
             self, 
             input_dir='./data/extracted/images/', 
             output_dir='./data/output/', 
-            model=MODEL_NAME
+            model=MODEL_NAME,
+            max_workers=OCR_MAX_WORKERS,
+            max_retries=2,
+            retry_backoff=1.0,
+            host=None,
+            output_format=OCR_OUTPUT_FORMAT,
+            preprocess=None
             ):
         
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True,exist_ok=True)
         self.model = model
+
+        # max_workers = number of requests kept in flight against Ollama.
+        # Match it to OLLAMA_NUM_PARALLEL on the server side.
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
         self.logger = Logger("OCR", "./logs/ocr.log").get_logger()
         self.logger.info("OCR Class initialized")
+
+        # json    : one *_parsed.json per image (default)
+        # parquet : rows appended to a partitioned Parquet dataset in output_dir/ocr_dataset
+        self.output_format = output_format.lower()
+        if self.output_format not in ('json', 'parquet'):
+            raise ValueError(f"Unknown OCR output format '{output_format}', expected 'json' or 'parquet'")
+
+        self.dataset_writer = None
+        if self.output_format == 'parquet':
+            from src.ingestion.preprocess.columnar import DATASET_DIR, OCRDatasetWriter
+            self.dataset_writer = OCRDatasetWriter(self.output_dir / DATASET_DIR)
+
+        # Downscale / grayscale / crop / deskew in a process pool before OCR
+        # (configs/ocr.yaml). None = env / config (off by default), False = send originals.
+        if preprocess is None:
+            preprocess = preprocess_enabled()
+        self.preprocessor = None
+        if preprocess:
+            try:
+                from src.ingestion.preprocess.image_prep import ImagePreprocessor
+                self.preprocessor = ImagePreprocessor()
+            except ImportError as e:
+                self.logger.warning(f"Image preprocessing disabled (install Pillow): {str(e)}")
     
-        self.client = Client()
+        # Images whose response has no usable JSON are queued and retried after
+        # the main pass with Ollama's `format` option (configs/ocr.yaml)
+        parsing = load_config("./configs/ocr.yaml", "parsing", DEFAULT_PARSING_CONFIG)
+        self.min_fields = int(parsing["min_fields"])
+        retry_format = str(parsing["retry_format"] or "none").lower()
+        if retry_format not in ('schema', 'json', 'none'):
+            raise ValueError(f"Unknown retry_format '{retry_format}', expected 'schema', 'json' or 'none'")
+        self.retry_format = {'schema': OCR_JSON_SCHEMA, 'json': 'json', 'none': None}[retry_format]
+        self.retry_queue = deque()
+
+        # httpx-backed client: thread-safe and keeps a connection pool,
+        # so one instance is shared by all OCR workers.
+        self.client = Client(host=host)
 
     
-    def parse_llm(self, image_path):
+    def parse_llm(self, image_path, pages=None, format=None):
 
         self.logger.info('LLM : QWEN2.5-vl:7b Parsing Started')
     
-        response = self.client.generate(
-                model=self.model,
-                prompt=prompt,
-                images=[image_path],
-                stream=False,
-        )
+        # `pages` are the preprocessed page images (several for a multi-page TIFF).
+        # `format` ('json' or a JSON schema) constrains generation on retries.
+        with metrics.span("parse_llm", model=self.model, retry=bool(format)):
+            response = self.client.generate(
+                    model=self.model,
+                    prompt=prompt,
+                    images=pages or [image_path],
+                    stream=False,
+                    format=format or '',
+            )
+        metrics.inc("llm_prompt_tokens", response.get('prompt_eval_count') or 0, model=self.model)
+        metrics.inc("llm_output_tokens", response.get('eval_count') or 0, model=self.model)
 
         response_text = response['response']
         self.logger.info('LLM Parsing Completed, Sending to JSON Decoder')
         extracted_data = self.parse_json(response_text)
+        if extracted_data is None:
+            metrics.inc("ocr_parse_failures", retry=bool(format))
+            return None
 
         extracted_data["source_file"] = os.path.basename(image_path)
         extracted_data["processing_timestamp"] = datetime.now().isoformat()
@@ -57,24 +137,52 @@ class BankStatementOCR:
         return extracted_data
     
 
-    def parse_json(self, response_text:str) -> Dict[str, Any]:
+    def parse_json(self, response_text:str) -> Optional[Dict[str, Any]]:
+        """
+        Extract the statement JSON from a model response and coerce it to
+        OCR_FIELDS. Returns None when there is no JSON, or fewer than
+        `min_fields` fields could be read, so the image is retried instead
+        of being saved as an empty document.
+        """
         self.logger.info('Started JSON Parsing')
-        json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response_text, re.DOTALL)
+        data = extract_json(response_text)
+
+        if data is None:
+            self.logger.error(f'No JSON object in model response: {response_text[:200]!r}')
+            return None
+
+        result, problems = coerce_result(data)
+        for problem in problems:
+            self.logger.warning(f'Schema coercion: {problem}')
+
+        if filled_fields(result) < self.min_fields:
+            self.logger.error(f'Only {filled_fields(result)} statement fields in model response: {response_text[:200]!r}')
+            return None
 
-        if json_match:
-            json_str = json_match.group(0)
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                self.logger.error('JSON DECODE ERROR')
-                pass
         self.logger.info('JSON Parsing Completed and returned to LLM Parser')
-        return {}
+        return result
 
 
-    def process_all_images(self):
-        self.logger.info("Starting OCR...")
-        
+    def parse_with_retry(self, image_path, pages=None, format=None):
+        """
+        Call parse_llm, retrying with exponential backoff on failure.
+        The last error is re-raised once all retries are used up.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.parse_llm(image_path, pages, format)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                self.logger.warning(
+                    f'Retry {attempt + 1}/{self.max_retries} for {os.path.basename(image_path)} '
+                    f'in {delay:.1f}s: {str(e)}'
+                )
+                time.sleep(delay)
+
+
+    def list_images(self):
         image_extensions = ['.jpg', '.jpeg', '.png', '.tiff', '.bmp', '.gif', '.webp']
         image_files = []
         
@@ -82,47 +190,202 @@ class BankStatementOCR:
             image_files.extend(self.input_dir.glob(f'*{ext}'))
             image_files.extend(self.input_dir.glob(f'*{ext.upper()}'))
         
+        # Remove duplicates
+        image_files = list(set(image_files))
+        image_files.sort()
+        return image_files
+
+
+    def preprocess_settings(self) -> Optional[Dict[str, Any]]:
+        """
+        Preprocessing settings the OCR results depend on (None when images
+        are sent as-is), part of the OCR cache key.
+        """
+        return self.preprocessor.settings() if self.preprocessor is not None else None
+
+
+    def output_path_for(self, image_file: Path) -> Path:
+        if self.dataset_writer is not None:
+            return self.dataset_writer.root
+        return self.output_dir / f"{Path(image_file).stem}_parsed.json"
+
+
+    def save_result(self, image_file: Path, result: Dict[str, Any]) -> Path:
+        output_path = self.output_path_for(image_file)
+
+        if self.dataset_writer is not None:
+            # Buffered; flushed as Parquet files at the end of process_all_images
+            self.dataset_writer.write(result)
+            return output_path
+
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+
+        return output_path
+
+
+    def process_image(self, idx, total, image_file: Path, pages=None, format=None):
+        """
+        OCR one image and save its JSON. Returns None on failure so a
+        single bad image never stops the batch. A response without usable
+        JSON queues the image for a constrained retry (see _retry_queued).
+        """
+        print(f"[{idx}/{total}] Processing: {image_file.name}")
+        self.logger.info(f'[{idx}/{total}] Processing: {image_file.name}')
+        start = time.perf_counter()
+        queued = False
+        try:
+            result = self.parse_with_retry(str(image_file), pages, format)
+
+            if result:
+                # Save individual JSON file
+                output_path = self.save_result(image_file, result)
+
+                print(f"  → Saved: {output_path.name}\n")
+                self.logger.info(f'→ Saved: {output_path.name} (OCR {time.perf_counter() - start:.2f}s)\n')
+
+            elif format is None and self.retry_format is not None:
+                # Pages are kept until the retry has used them
+                self.retry_queue.append((idx, image_file, pages))
+                queued = True
+                print(f"  ↻ No valid JSON for {image_file.name}, queued for retry\n")
+                self.logger.warning(f'↻ No valid JSON for {image_file.name}, queued for retry\n')
+
+            else:
+                print(f"  ✗ No valid JSON for {image_file.name}\n")
+                self.logger.error(f'✗ No valid JSON for {image_file.name}\n')
+
+            return result
+
+        except Exception as e:
+            print(f"  ✗ Error processing {image_file.name}: {str(e)}\n")
+            self.logger.error(f'✗ Error processing {image_file.name}: {str(e)}\n')
+            return None
+
+        finally:
+            if self.preprocessor is not None and not queued:
+                self.preprocessor.cleanup(pages)
+
+
+    def _prepared(self, image_files):
+        """
+        (image_file, pages) pairs in order. With preprocessing on, images are
+        prepared in the process pool while earlier ones are already in OCR.
+        """
+        if self.preprocessor is None:
+            return ((image_file, None) for image_file in image_files)
+        return self.preprocessor.iter_prepared(image_files)
+
+
+    def process_all_images(self, image_files=None):
+        self.logger.info("Starting OCR...")
+        
+        if image_files is None:
+            image_files = self.list_images()
+        
         if not image_files:
             print(f"No images found in {self.input_dir}")
             self.logger.info(f'No images found in {self.input_dir}')
             return []
         
-        # Remove duplicates
-        image_files = list(set(image_files))
-        image_files.sort()
-        
         print(f"Found {len(image_files)} images to process")
         print("=" * 60)
         self.logger.info(f'Found {len(image_files)} images to process')
 
-        all_results = []
-        
-        for idx, image_file in enumerate(image_files, 1):
-            print(f"[{idx}/{len(image_files)}] Processing: {image_file.name}")
-            self.logger.info(f'[{idx}/{len(image_files)}] Processing: {image_file.name}')
-            try:
-                result = self.parse_llm(str(image_file))
-                
-                if result:
-                    all_results.append(result)
-                    
-                    # Save individual JSON file
-                    output_filename = f"{image_file.stem}_parsed.json"
-                    output_path = self.output_dir / output_filename
-                    
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(result, f, indent=4, ensure_ascii=False)
-                    
-                    print(f"  → Saved: {output_filename}\n")
-                    self.logger.info(f'→ Saved: {output_filename}\n')
-                
-            
-            except Exception as e:
-                print(f"  ✗ Error processing {image_file.name}: {str(e)}\n")
-                self.logger.error(f'✗ Error processing {image_file.name}: {str(e)}\n')
+        return self._run(self._prepared(image_files), len(image_files))
+
+
+    def process_stream(self, members, total='?'):
+        """
+        OCR (name, image bytes) pairs as they arrive, e.g. straight from
+        KaggleLoader.iter_images, without extracting anything to disk.
+        """
+        self.logger.info("Starting streamed OCR...")
+
+        if self.preprocessor is not None:
+            work = self.preprocessor.iter_prepared_bytes(members)
+        else:
+            work = ((Path(name), [data]) for name, data in members)
+
+        return self._run(work, total)
+
+
+    def _run(self, work, total):
+        if self.max_workers > 1:
+            results = self._process_concurrently(work, total)
+        else:
+            results = [
+                self.process_image(idx, total, image_file, pages)
+                for idx, (image_file, pages) in enumerate(work, 1)
+            ]
+
+        results = self._retry_queued(results, total)
+
+        all_results = [result for result in results if result]
+
+        if self.preprocessor is not None:
+            self.logger.info(f'Preprocessing stats: {self.preprocessor.summary()}')
+
+        if self.dataset_writer is not None:
+            self.dataset_writer.flush()
         
         self.logger.info('OCR Parsing Completed Successfully.')
 
         return all_results
 
 
+    def _process_concurrently(self, work, total):
+        """
+        Keep at most max_workers requests in flight and at most
+        2 * max_workers images queued, so memory stays flat on large
+        batches. Results come back in the same (sorted) order as the images.
+        """
+        max_pending = self.max_workers * 2
+        # Grown as work arrives: streamed input has no known total
+        results = []
+        pending = {}
+
+        self.logger.info(f'Running OCR with {self.max_workers} concurrent workers')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocr") as pool:
+            for pos, (image_file, pages) in enumerate(work):
+                # Backpressure: wait for a slot before queueing more work
+                if len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[pending.pop(future)] = future.result()
+
+                results.append(None)
+                future = pool.submit(self.process_image, pos + 1, total, image_file, pages)
+                pending[future] = pos
+
+            for future in list(pending):
+                results[pending.pop(future)] = future.result()
+
+        return results
+
+
+    def _retry_queued(self, results, total):
+        """
+        Second pass over the retry queue: the same images again, with
+        generation constrained to the OCR schema (or plain JSON mode).
+        """
+        if not self.retry_queue:
+            return results
+
+        queued = list(self.retry_queue)
+        self.retry_queue.clear()
+        self.logger.info(f'Retrying {len(queued)} images with constrained JSON output')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocr-retry") as pool:
+            futures = [
+                (idx, pool.submit(self.process_image, idx, total, image_file, pages, self.retry_format))
+                for idx, image_file, pages in queued
+            ]
+            for idx, future in futures:
+                results[idx - 1] = future.result()
+
+        failed = sum(1 for idx, _ in futures if not results[idx - 1])
+        if failed:
+            self.logger.warning(f'{failed} images still have no valid JSON after the retry')
+        return results
@@ -0,0 +1,140 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from src.vectorstore.metadata import normalise_amount
+
+
+# The 14 fields requested in src/llm/prompt_template.prompt, in prompt order
+OCR_FIELDS = {
+    "bank_name": "string",
+    "account_number": "digits",
+    "account_holder_name": "string",
+    "phone_number": "string",
+    "statement_from_date": "string",
+    "statement_to_date": "string",
+    "opening_balance": "number",
+    "closing_balance": "number",
+    "total_debits": "number",
+    "total_credits": "number",
+    "currency": "string",
+    "statement_date_generated": "string",
+    "branch_name": "string",
+    "statement_number": "string",
+}
+
+# Passed as Ollama's `format` option to constrain generation to OCR_FIELDS
+OCR_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        name: {"type": ["number", "null"] if kind == "number" else ["string", "null"]}
+        for name, kind in OCR_FIELDS.items()
+    },
+    "required": list(OCR_FIELDS),
+}
+
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "not available", "not found", "-"}
+FENCE_RE = re.compile(r"```(?:json|JSON)?[ \t]*\n?(.*?)```", re.DOTALL)
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _balanced_objects(text: str):
+    """
+    Yield every top-level {...} span in `text`, in one left-to-right pass.
+    Braces inside JSON strings (and escaped quotes) are ignored.
+    """
+    depth, start, in_string, escaped = 0, -1, False, False
+    for pos, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = depth > 0
+        elif char == "{":
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield text[start:pos + 1]
+
+
+def _loads(candidate: str) -> Optional[Dict[str, Any]]:
+    for text in (candidate, TRAILING_COMMA_RE.sub(r"\1", candidate)):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the first JSON object in a model response, or None. Fenced
+    ```json blocks are tried first, then any balanced {...} in the text,
+    so chatty preambles, trailing notes and nested objects all work.
+    Linear in the length of the response.
+    """
+    if not text:
+        return None
+
+    for block in FENCE_RE.findall(text):
+        for candidate in _balanced_objects(block):
+            value = _loads(candidate)
+            if value is not None:
+                return value
+
+    for candidate in _balanced_objects(text):
+        value = _loads(candidate)
+        if value is not None:
+            return value
+    return None
+
+
+def coerce_result(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Fit an extracted dict to OCR_FIELDS: every field present (None when
+    missing), amounts as floats, account numbers as digits, the rest as
+    strings. Keys outside the schema are kept as they are.
+
+    Returns (result, problems) where problems lists values that could
+    not be coerced and were set to None.
+    """
+    result, problems = {}, []
+
+    for name, kind in OCR_FIELDS.items():
+        value = data.get(name)
+        if isinstance(value, str) and value.strip().lower() in NULL_STRINGS:
+            value = None
+        if value is None:
+            result[name] = None
+            continue
+
+        if isinstance(value, (dict, list)):
+            problems.append(f"{name}: expected a {kind}, got {type(value).__name__}")
+            result[name] = None
+        elif kind == "number":
+            amount = normalise_amount(value)
+            if amount is None:
+                problems.append(f"{name}: '{value}' is not a number")
+            result[name] = amount
+        elif kind == "digits":
+            result[name] = re.sub(r"\D", "", str(value)) or None
+        else:
+            result[name] = str(value).strip()
+
+    for key, value in data.items():
+        if key not in OCR_FIELDS:
+            result[key] = value
+
+    return result, problems
+
+
+def filled_fields(result: Dict[str, Any]) -> int:
+    return sum(1 for name in OCR_FIELDS if result.get(name) is not None)
@@ -1,18 +1,28 @@
-from ollama import Client
+import time
+import asyncio
+from ollama import AsyncClient, Client
 from src.utils.logger import Logger
+from src.utils.metrics import metrics
 
 
 class LLMModel:
 
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, host: str = None, max_concurrency: int = 4):
         self.model_name = model_name
-        
-        
+        self.host = host
+
+        # Async path (API server): one pooled AsyncClient and at most
+        # max_concurrency generations in flight against Ollama
+        self.max_concurrency = max_concurrency
+        self._async_client = None
+        self._async_slots = None
+
+
         self.logger = Logger("LLM_MODEL", "./logs/llm.log").get_logger()
         self.logger.info(f"Initializing LLMModel with: {model_name}")
 
         
-        self.client = Client()
+        self.client = Client(host=host)
 
 
     def generate(self, prompt: str, image_path: str = None):
@@ -33,10 +43,12 @@ class LLMModel:
             self.logger.debug(f"Prompt sent to LLM:\n{prompt[:300]}...\n")
 
            
-            response = self.client.generate(**payload)
+            with metrics.span("llm_generate", model=self.model_name):
+                response = self.client.generate(**payload)
 
             
             output = response.get("response", "")
+            self._log_usage(response)
 
             self.logger.debug(f"Raw LLM Output: {output[:300]}...")
             return output
@@ -44,3 +56,173 @@ class LLMModel:
         except Exception as e:
             self.logger.error(f"LLM Generation Error: {str(e)}")
             return ""
+
+
+    def generate_stream(self, prompt: str, image_path: str = None, cancel_event=None, stats: dict = None):
+        """
+        Yield response tokens as Ollama produces them.
+
+        Setting `cancel_event` (a threading.Event) or closing the generator
+        stops reading and closes the HTTP stream, which makes Ollama abort
+        the generation. Timings (ttft_s, total_s, chunks, prompt_tokens,
+        cancelled, error) are written into the caller's `stats` dict, one
+        per call, so concurrent streams never mix them up. A failed stream
+        raises after the tokens it did yield.
+        """
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"temperature": 0}
+        }
+
+        if image_path:
+            payload["images"] = [image_path]
+            self.logger.info(f"Sending image to model: {image_path}")
+
+        self.logger.debug(f"Prompt sent to LLM (stream):\n{prompt[:300]}...\n")
+
+        start = time.perf_counter()
+        stats = {} if stats is None else stats
+        stats.update({"ttft_s": None, "total_s": None, "chunks": 0, "prompt_tokens": None, "cancelled": False, "error": False})
+        stream = None
+
+        try:
+            stream = self.client.generate(**payload)
+
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    stats["cancelled"] = True
+                    self.logger.info("LLM stream cancelled.")
+                    break
+
+                if chunk.get("done"):
+                    stats["prompt_tokens"] = self._log_usage(chunk)
+
+                token = chunk.get("response", "")
+                if not token:
+                    continue
+
+                if stats["ttft_s"] is None:
+                    stats["ttft_s"] = time.perf_counter() - start
+                    metrics.observe("llm_ttft", stats["ttft_s"], model=self.model_name)
+                    self.logger.info(f"Time to first token: {stats['ttft_s'] * 1000:.0f} ms")
+
+                stats["chunks"] += 1
+                yield token
+
+        except GeneratorExit:
+            stats["cancelled"] = True
+            raise
+
+        except Exception as e:
+            # Re-raised so callers never mistake a truncated answer for a full one
+            stats["error"] = True
+            self.logger.error(f"LLM Streaming Error: {str(e)}")
+            raise
+
+        finally:
+            # Closing the response iterator releases the HTTP connection
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            stats["total_s"] = time.perf_counter() - start
+            metrics.observe("llm_generate_stream", stats["total_s"], error=stats["error"], model=self.model_name)
+            self.logger.debug(f"LLM stream finished: {stats}")
+
+
+    def _log_usage(self, response):
+        """
+        Log the prompt size Ollama actually evaluated (and how long that
+        took), so context budgets can be tuned against latency, and count
+        prompt / output tokens in the metrics.
+        """
+        prompt_tokens = response.get("prompt_eval_count")
+        metrics.inc("llm_prompt_tokens", prompt_tokens or 0, model=self.model_name)
+        metrics.inc("llm_output_tokens", response.get("eval_count") or 0, model=self.model_name)
+        if prompt_tokens is not None:
+            eval_ms = (response.get("prompt_eval_duration") or 0) / 1e6
+            self.logger.info(
+                f"Prompt tokens: {prompt_tokens} (eval {eval_ms:.0f} ms), "
+                f"output tokens: {response.get('eval_count')}"
+            )
+        return prompt_tokens
+
+
+    def _async(self):
+        # Created lazily so they bind to the running event loop
+        if self._async_client is None:
+            self._async_client = AsyncClient(host=self.host)
+            self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client, self._async_slots
+
+
+    async def agenerate(self, prompt: str) -> str:
+        client, slots = self._async()
+
+        try:
+            async with slots:
+                with metrics.span("llm_generate", model=self.model_name):
+                    response = await client.generate(
+                        model=self.model_name,
+                        prompt=prompt,
+                        stream=False,
+                        options={"temperature": 0}
+                    )
+            self._log_usage(response)
+            return response.get("response", "")
+
+        except Exception as e:
+            self.logger.error(f"LLM Generation Error: {str(e)}")
+            return ""
+
+
+    async def agenerate_stream(self, prompt: str):
+        """
+        Async twin of generate_stream. Cancel by cancelling the consuming
+        task or closing the async generator (aclose).
+        """
+        client, slots = self._async()
+        start = time.perf_counter()
+        first_token = True
+
+        async with slots:
+            stream = None
+            try:
+                stream = await client.generate(
+                    model=self.model_name,
+                    prompt=prompt,
+                    stream=True,
+                    options={"temperature": 0}
+                )
+                async for chunk in stream:
+                    if chunk.get("done"):
+                        self._log_usage(chunk)
+                    token = chunk.get("response", "")
+                    if not token:
+                        continue
+                    if first_token:
+                        first_token = False
+                        metrics.observe("llm_ttft", time.perf_counter() - start, model=self.model_name)
+                        self.logger.info(f"Time to first token: {(time.perf_counter() - start) * 1000:.0f} ms")
+                    yield token
+
+            except (asyncio.CancelledError, GeneratorExit):
+                self.logger.info("LLM stream cancelled.")
+                raise
+
+            except Exception as e:
+                # Re-raised so callers never mistake a truncated answer for a full one
+                self.logger.error(f"LLM Streaming Error: {str(e)}")
+                raise
+
+            finally:
+                # Closing the response stream makes Ollama stop generating
+                if stream is not None:
+                    await stream.aclose()
+
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
@@ -0,0 +1,338 @@
+import re
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+from src.utils.logger import Logger
+
+
+DEFAULT_AGGREGATES_CONFIG = {
+    "enabled": True,            # answer recognised aggregate questions without the LLM
+}
+
+AGGREGATE_METRICS = ("sum", "count", "mean", "min", "max")
+AMOUNT_FIELDS = ("total_credits", "total_debits", "opening_balance", "closing_balance")
+GROUP_BY_KEYS = ("bank", "account", "currency", "year", "quarter", "month")
+
+METRIC_PATTERNS = [
+    ("count", re.compile(r"\b(how many|number of|count)\b")),
+    ("mean", re.compile(r"\b(average|avg|mean)\b")),
+    ("max", re.compile(r"\b(highest|maximum|max|largest|biggest)\b")),
+    ("min", re.compile(r"\b(lowest|minimum|min|smallest)\b")),
+    ("sum", re.compile(r"\b(total|sum|overall|combined|altogether|across)\b")),
+]
+FIELD_PATTERNS = [
+    ("opening_balance", re.compile(r"\bopening balances?\b")),
+    ("closing_balance", re.compile(r"\b(closing )?balances?\b")),
+    ("total_credits", re.compile(r"\b(credits?|credited|deposits?|income)\b")),
+    ("total_debits", re.compile(r"\b(debits?|debited|withdrawals?|spent|spending|expenses?)\b")),
+]
+GROUP_BY_RE = re.compile(r"\b(?:by|per|for each|each|group(?:ed)? by|broken down by)\s+(bank|account|currency|year|quarter|month)s?\b")
+QUARTER_RE = re.compile(r"\bq([1-4])(?:\s*(?:of\s*)?(20\d{2}))?\b")
+MONTH_RE = re.compile(
+    r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?(?:\s*,?\s*(20\d{2}))?"
+)
+YEAR_RE = re.compile(r"\b(20\d{2})\b")
+# An aggregate must be explicitly corpus-wide ("across all accounts", "how many
+# statements") or grouped; "largest debit for Ramesh" is about one statement
+SCOPE_RE = re.compile(
+    r"\b(?:all|every|each|across(?:\s+(?:all|the|my))?)\s+(?:of\s+)?(?:the\s+|my\s+)?(?:accounts?|statements?|banks?)\b"
+    r"|\b(?:how many|number of|count of)\s+statements?\b"
+)
+# Capitalised or possessive words name an entity (a person, a bank) the question is about
+ENTITY_RE = re.compile(r"\b([A-Za-z][A-Za-z0-9]*)(['\u2019]s)?\b")
+COMMON_POSSESSIVES = {"account", "bank", "holder", "statement", "customer", "month", "year", "quarter", "today"}
+ACCOUNT_RE = re.compile(r"\baccount(?:\s+(?:number|no\.?))?\s*[:#]?\s*(\d[\d\- ]{2,}\d)\b")
+# Too generic to identify a bank on their own
+BANK_STOPWORDS = {"the", "bank", "state", "of"}
+
+METRIC_TITLES = {"sum": "Total", "mean": "Average", "min": "Lowest", "max": "Highest"}
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+@dataclass
+class AggregateQuery:
+    """
+    A parsed aggregate question: `metric` over the `amount` field (None
+    for count), optionally grouped, restricted by metadata `filters` and
+    by the period a statement starts in: `months` of the year, within
+    `year` when one is given ("Q1 2024") or of any year ("Q1").
+    """
+
+    metric: str
+    amount: Optional[str] = None
+    group_by: Optional[str] = None
+    filters: Dict[str, Any] = field(default_factory=dict)
+    months: Optional[Set[int]] = None
+    year: Optional[str] = None
+
+
+class StatementAnalytics:
+    """
+    Vectorized sum / count / mean / min / max (optionally grouped by bank,
+    account, currency or period) over the statement fields in the
+    vector store's MetadataIndex.
+
+    Columns are loaded into NumPy arrays once per store version; every
+    question after that is a mask plus a bincount / ufunc reduction.
+    """
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        self.logger = Logger("STATEMENT_ANALYTICS", "./logs/rag_pipeline.log").get_logger()
+
+        self._lock = threading.Lock()
+        self._columns = None
+        self._columns_version = None
+
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            version = self.vectorstore.version
+            if self._columns is None or self._columns_version != version:
+                columns = self.vectorstore.metadata_index.columns()
+
+                # Chunks of one statement share its fields: keep one row per statement
+                statements = columns.pop("statement")
+                chunked = statements != ""
+                _, first = np.unique(statements[chunked], return_index=True)
+                keep = ~chunked
+                keep[np.flatnonzero(chunked)[first]] = True
+                columns = {name: column[keep] for name, column in columns.items()}
+
+                # Period keys come from the statement start date (end date as fallback)
+                dates = np.where(columns["statement_from_date"] != "",
+                                 columns["statement_from_date"], columns["statement_to_date"])
+                columns["year"] = dates.astype("<U4")
+                columns["month"] = dates.astype("<U7")
+                month_of_year = np.array([int(d[5:7]) if d else 0 for d in dates], dtype=np.int64)
+                columns["month_of_year"] = month_of_year
+                columns["quarter"] = np.where(
+                    month_of_year > 0,
+                    np.char.add(np.char.add(columns["year"], "-Q"), ((month_of_year + 2) // 3).astype(str)),
+                    ""
+                )
+                columns["bank"] = columns["bank_name"]
+                columns["account"] = columns["account_number"]
+
+                self._columns, self._columns_version = columns, version
+                self.logger.info(f"Loaded analytics columns for {len(columns['id'])} statements")
+            return self._columns
+
+
+    def parse(self, question: str, filters: Optional[dict] = None) -> Optional[AggregateQuery]:
+        """
+        Recognise aggregate questions ("total credits across all accounts
+        for Q1", "how many statements per bank"). Quarters are calendar
+        quarters, matched on the month a statement starts in. Questions without an explicit corpus-wide scope or
+        grouping, or naming someone we cannot filter on, give None and go
+        to the normal RAG path.
+        """
+        text = question.lower()
+
+        metric = next((name for name, pattern in METRIC_PATTERNS if pattern.search(text)), None)
+        amount_field = next((name for name, pattern in FIELD_PATTERNS if pattern.search(text)), None)
+        if metric is None:
+            return None
+        if metric == "count":
+            if not re.search(r"\bstatements?\b", text):
+                return None
+            amount_field = None
+        elif amount_field is None:
+            return None
+
+        group = GROUP_BY_RE.search(text)
+        if group is None and not SCOPE_RE.search(text):
+            return None
+        query = AggregateQuery(metric=metric, amount=amount_field, group_by=group.group(1) if group else None)
+        query.filters.update(filters or {})
+
+        self._parse_period(text, query)
+        self._parse_entities(text, query)
+
+        # A name we cannot turn into a filter would be silently ignored: leave it to RAG
+        unresolved = self._unresolved_entities(question, query)
+        if unresolved:
+            self.logger.info(f"Not answering as an aggregate, unresolved entities: {unresolved}")
+            return None
+        return query
+
+
+    def _parse_period(self, text: str, query: AggregateQuery):
+        quarter = QUARTER_RE.search(text)
+        month = MONTH_RE.search(text)
+        year = YEAR_RE.search(text)
+
+        # "may" is usually the verb unless a year follows
+        if month and month.group(1) == "may" and not month.group(2):
+            month = None
+
+        if quarter:
+            first = 3 * int(quarter.group(1)) - 2
+            months = range(first, first + 3)
+            year_text = quarter.group(2) or (year.group(1) if year else None)
+        elif month:
+            months = [MONTHS.index(month.group(1)[:3]) + 1]
+            year_text = month.group(2) or (year.group(1) if year else None)
+        elif year:
+            months, year_text = range(1, 13), year.group(1)
+        else:
+            return
+
+        # Matched on the statement's start month, like the period group-by keys,
+        # so a statement spanning two quarters is counted in exactly one
+        query.months = set(months)
+        query.year = year_text
+
+
+    def _parse_entities(self, text: str, query: AggregateQuery):
+        columns = self.columns()
+
+        # Bank names are matched against the banks actually in the corpus
+        banks = []
+        for bank in np.unique(columns["bank_name"]):
+            words = [word for word in re.findall(r"[a-z0-9]+", bank.lower()) if word not in BANK_STOPWORDS]
+            if words and re.search(rf"\b{re.escape(words[0])}\b", text):
+                banks.append(str(bank))
+        if banks and "bank_name" not in query.filters:
+            query.filters["bank_name"] = banks
+
+        account = ACCOUNT_RE.search(text)
+        if account and "account_number" not in query.filters:
+            query.filters["account_number"] = re.sub(r"\D", "", account.group(1))
+
+
+    def _unresolved_entities(self, question: str, query: AggregateQuery) -> List[str]:
+        """
+        Capitalised (not sentence-initial) or possessive words that are not
+        a resolved bank, a period, a currency or a generic word.
+        """
+        banks = query.filters.get("bank_name") or []
+        known = set(BANK_STOPWORDS) | {"i"}
+        for bank in [banks] if isinstance(banks, str) else banks:
+            known.update(re.findall(r"[a-z0-9]+", str(bank).lower()))
+        known.update(str(currency).lower() for currency in np.unique(self.columns()["currency"]))
+
+        unresolved = []
+        for match in ENTITY_RE.finditer(question.strip()):
+            word, possessive = match.group(1), match.group(2)
+            lower = word.lower()
+            if possessive:
+                if lower in COMMON_POSSESSIVES:
+                    continue
+            elif match.start() == 0 or not word[0].isupper():
+                continue
+            if lower in known or MONTH_RE.fullmatch(lower) or QUARTER_RE.fullmatch(lower):
+                continue
+            unresolved.append(word)
+        return unresolved
+
+
+    def run(self, query: AggregateQuery) -> List[Dict[str, Any]]:
+        """
+        Returns [{"group", "currency", "value", "statements"}], one row per
+        group and currency (group None when ungrouped; currency "" for
+        counts and statements without one).
+        """
+        if query.metric not in AGGREGATE_METRICS:
+            raise ValueError(f"Unknown metric '{query.metric}', expected one of {AGGREGATE_METRICS}")
+        if query.group_by is not None and query.group_by not in GROUP_BY_KEYS:
+            raise ValueError(f"Cannot group by '{query.group_by}', expected one of {GROUP_BY_KEYS}")
+
+        columns = self.columns()
+        mask = np.ones(len(columns["id"]), dtype=bool)
+
+        if query.filters:
+            ids = self.vectorstore.metadata_index.filter_ids(query.filters)
+            mask &= np.isin(columns["id"], ids)
+        if query.months:
+            mask &= np.isin(columns["month_of_year"], list(query.months))
+        if query.year:
+            mask &= columns["year"] == query.year
+
+        values = columns[query.amount][mask] if query.amount else np.ones(int(mask.sum()))
+        present = ~np.isnan(values)
+        values = values[present]
+        if len(values) == 0:
+            return []
+
+        if query.group_by is None:
+            group_labels, group_keys = np.array([None], dtype=object), np.zeros(len(values), dtype=np.int64)
+        else:
+            group_labels, group_keys = np.unique(columns[query.group_by][mask][present], return_inverse=True)
+
+        # Amounts in different currencies are never added up: one row per (group, currency)
+        if query.metric == "count":
+            currency_labels, currency_keys = np.array([""]), np.zeros(len(values), dtype=np.int64)
+        else:
+            currency_labels, currency_keys = np.unique(columns["currency"][mask][present], return_inverse=True)
+        pairs, keys = np.unique(group_keys * len(currency_labels) + currency_keys, return_inverse=True)
+        keys = keys.reshape(-1)
+
+        groups = len(pairs)
+        counts = np.bincount(keys, minlength=groups)
+        if query.metric in ("sum", "count"):
+            result = np.bincount(keys, weights=values, minlength=groups)
+        elif query.metric == "mean":
+            result = np.bincount(keys, weights=values, minlength=groups) / np.maximum(counts, 1)
+        elif query.metric == "min":
+            result = np.full(groups, np.inf)
+            np.minimum.at(result, keys, values)
+        else:
+            result = np.full(groups, -np.inf)
+            np.maximum.at(result, keys, values)
+
+        rows = []
+        for pos in np.flatnonzero(counts):
+            label = group_labels[pairs[pos] // len(currency_labels)]
+            rows.append({
+                "group": None if label is None else (label or "unknown"),
+                "currency": str(currency_labels[pairs[pos] % len(currency_labels)]),
+                "value": float(result[pos]),
+                "statements": int(counts[pos]),
+            })
+        return rows
+
+
+    def format(self, query: AggregateQuery, rows: List[Dict[str, Any]]) -> str:
+        if not rows:
+            return "No statements match this question."
+
+        if query.metric == "count":
+            title = "Statements"
+        else:
+            title = f"{METRIC_TITLES[query.metric]} {query.amount.replace('total_', '').replace('_', ' ')}"
+
+        def amount(row):
+            if query.metric == "count":
+                return f"{int(row['value'])}"
+            return f"{row['value']:,.2f} {row['currency']}".rstrip() + f" over {row['statements']} statements"
+
+        if query.group_by is None:
+            if len(rows) == 1:
+                return f"{title}: {amount(rows[0])}"
+            lines = [f"{title} per currency:"]
+            lines.extend(f"- {amount(row)}" for row in rows)
+            return "\n".join(lines)
+
+        lines = [f"{title} by {query.group_by}:"]
+        lines.extend(f"- {row['group']}: {amount(row)}" for row in rows)
+        return "\n".join(lines)
+
+
+    def answer(self, question: str, filters: Optional[dict] = None) -> Optional[str]:
+        """
+        Exact answer for an aggregate question, or None if `question` is
+        not one (or the store has no metadata yet).
+        """
+        if getattr(self.vectorstore, "metadata_index", None) is None:
+            return None
+
+        query = self.parse(question, filters)
+        if query is None:
+            return None
+
+        self.logger.info(f"Aggregate query: {query}")
+        return self.format(query, self.run(query))
@@ -0,0 +1,116 @@
+import re
+import math
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+
+DEFAULT_CONTEXT_CONFIG = {
+    "max_tokens": 1500,         # budget for the <context> block of the prompt
+    "chars_per_token": 4.0,     # token estimate without loading the model's tokenizer
+    "drop_null_fields": True,
+    "dedupe": True,
+}
+
+# "field name: None" lines written by JSONIngestor.json_to_text for empty fields
+NULL_LINE_RE = re.compile(r"^[^:\n]+:\s*(none|null|n/a|nan|)\s*$", re.IGNORECASE)
+
+
+class ContextPacker:
+    """
+    Assemble retrieved chunks into a prompt context under a token budget.
+
+    Chunks are ranked by retrieval score, null-valued fields are stripped,
+    duplicates dropped, and whole chunks packed until the budget is spent.
+    Only a chunk that alone exceeds the budget is cut, and only at a line
+    boundary.
+    """
+
+    def __init__(self, max_tokens=1500, chars_per_token=4.0, drop_null_fields=True, dedupe=True):
+        self.max_tokens = int(max_tokens)
+        self.chars_per_token = float(chars_per_token)
+        self.drop_null_fields = drop_null_fields
+        self.dedupe = dedupe
+
+
+    def count_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+    @staticmethod
+    def rank(chunks: Sequence[Union[str, Dict[str, Any]]]) -> List[str]:
+        """
+        Chunk texts best first. Hits from Retriever.retrieve_batch sort by
+        fused score (high first) or distance (low first); plain strings
+        keep their retrieval order.
+        """
+        def key(item):
+            pos, chunk = item
+            if isinstance(chunk, dict):
+                if chunk.get("score") is not None:
+                    return (-chunk["score"], pos)
+                if chunk.get("distance") is not None:
+                    return (chunk["distance"], pos)
+            return (0, pos)
+
+        ranked = sorted(enumerate(chunks), key=key)
+        return [chunk["text"] if isinstance(chunk, dict) else chunk for _, chunk in ranked]
+
+
+    def compress(self, text: str) -> str:
+        if not self.drop_null_fields:
+            return text.strip()
+        return "\n".join(line for line in text.strip().splitlines() if not NULL_LINE_RE.match(line))
+
+
+    def pack(self, chunks: Sequence[Union[str, Dict[str, Any]]], max_tokens=None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Returns (context text, stats) where stats has the chunk counts at
+        each stage and the estimated context tokens.
+        """
+        budget = self.max_tokens if max_tokens is None else int(max_tokens)
+        stats = {"chunks": len(chunks), "duplicates": 0, "packed": 0, "dropped": 0, "truncated": False}
+
+        packed, seen, used = [], set(), 0
+        for text in self.rank(chunks):
+            text = self.compress(text)
+            if not text:
+                continue
+
+            if self.dedupe:
+                key = " ".join(text.lower().split())
+                if key in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+
+            # Blank line between chunks
+            tokens = self.count_tokens(text) + (1 if packed else 0)
+            if used + tokens <= budget:
+                packed.append(text)
+                used += tokens
+                continue
+
+            if not packed:
+                text = self._truncate(text, budget)
+                if text:
+                    packed.append(text)
+                    used += self.count_tokens(text)
+                    stats["truncated"] = True
+                    continue
+
+            # A smaller, lower-ranked chunk may still fit
+            stats["dropped"] += 1
+
+        stats["packed"] = len(packed)
+        stats["tokens"] = used
+        return "\n\n".join(packed), stats
+
+
+    def _truncate(self, text: str, budget: int) -> str:
+        lines, used = [], 0
+        for line in text.splitlines():
+            tokens = self.count_tokens(line) + (1 if lines else 0)
+            if used + tokens > budget:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(lines)
@@ -1,38 +1,237 @@
-from src.retriever.retriever import Retriever
+import asyncio
 from src.llm.model import LLMModel
 from src.llm.prompt_template import FIN_DOMAIN_PROMPT
+from src.pipeline.context import DEFAULT_CONTEXT_CONFIG, ContextPacker
+from src.pipeline.aggregates import DEFAULT_AGGREGATES_CONFIG, StatementAnalytics
+from src.pipeline.response_cache import DEFAULT_RESPONSE_CACHE_CONFIG, ResponseCache
+from src.utils.config import load_config
 from src.utils.logger import Logger
 
 
+NO_CONTEXT_RESPONSE = "No relevant information found in your knowledge base."
+
+
 class RAGPipeline:
 
-    def __init__(self, retriever, model_name="qwen3:0.6b", top_k=5):
+    def __init__(self, retriever, model_name="qwen3:0.6b", top_k=5, response_cache=None):
         self.logger = Logger("RAG_PIPELINE", "./logs/rag_pipeline.log").get_logger()
 
         self.retriever = retriever
         self.llm = LLMModel(model_name)
         self.top_k = top_k
 
+        if response_cache is None:
+            cache_config = load_config(
+                "./configs/model_config.yaml", "response_cache", DEFAULT_RESPONSE_CACHE_CONFIG
+            )
+            if cache_config["enabled"]:
+                response_cache = ResponseCache(
+                    similarity_threshold=float(cache_config["similarity_threshold"]),
+                    ttl_seconds=float(cache_config["ttl_seconds"]),
+                    max_entries=int(cache_config["max_entries"])
+                )
+        # False disables the cache explicitly
+        self.response_cache = response_cache or None
 
-    def query(self, user_query: str):
+        # Retrieved chunks are ranked, deduplicated and packed under a token budget
+        context_config = load_config("./configs/model_config.yaml", "context", DEFAULT_CONTEXT_CONFIG)
+        self.context_packer = ContextPacker(**context_config)
+
+        # Sums / counts / min / max over statement fields never reach the LLM
+        aggregates_config = load_config("./configs/model_config.yaml", "aggregates", DEFAULT_AGGREGATES_CONFIG)
+        self.analytics = StatementAnalytics(retriever.vectorstore) if aggregates_config["enabled"] else None
+
+
+    def _aggregate_answer(self, user_query: str, filters=None):
+        if self.analytics is None:
+            return None
+        try:
+            answer = self.analytics.answer(user_query, filters)
+        except Exception as e:
+            self.logger.error(f"Aggregate query failed, falling back to RAG: {str(e)}")
+            return None
+        if answer is not None:
+            self.logger.info("Answered by the aggregate query engine.")
+        return answer
+
+
+    def _cached_answer(self, user_query: str, filters=None):
+        """
+        Returns (cached answer or None, query embedding, store version).
+        Filtered queries bypass the cache: the same question over a
+        different filter has a different answer.
+        """
+        vectorstore = self.retriever.vectorstore
+        store_version = vectorstore.version
+
+        if self.response_cache is None or filters:
+            return None, None, store_version
+
+        query_embedding = vectorstore.embed([user_query])[0]
+        cached = self.response_cache.get(user_query, query_embedding, store_version)
+        if cached is not None:
+            self.logger.info("Answer served from response cache.")
+        return cached, query_embedding, store_version
+
+
+    def _cache_answer(self, user_query, query_embedding, answer, store_version):
+        # Empty output means the LLM call failed, and a store update during
+        # generation makes the answer stale: never cache either
+        if self.response_cache is not None and query_embedding is not None and answer and self.retriever.vectorstore.version == store_version:
+            self.response_cache.put(user_query, query_embedding, answer, store_version)
 
-        self.logger.info(f"User Query: {user_query}")
-        context_chunks = self.retriever.retrieve(user_query)
+
+    def _build_prompt(self, user_query: str, context_chunks=None, filters=None):
+        """
+        `context_chunks` are retrieval hits (or plain texts, best first);
+        by default they are retrieved here.
+        """
+        if context_chunks is None:
+            context_chunks = self.retriever.retrieve_batch([user_query], filters=filters)[0]
 
         if not context_chunks:
             self.logger.warning("No context found! Returning fallback response.")
-            return "No relevant information found in your knowledge base."
+            return None
 
-        
-        context_text = "\n".join(context_chunks)
+        context_text, stats = self.context_packer.pack(context_chunks)
         rag_prompt = FIN_DOMAIN_PROMPT.format(
             context=context_text,
             query=user_query
         )
 
+        self.logger.info(
+            f"Prompt ~{self.context_packer.count_tokens(rag_prompt)} tokens: context {stats['tokens']}/"
+            f"{self.context_packer.max_tokens} tokens, {stats['packed']}/{stats['chunks']} chunks "
+            f"({stats['duplicates']} duplicate, {stats['dropped']} over budget"
+            f"{', first truncated' if stats['truncated'] else ''})"
+        )
         self.logger.debug(f"RAG Prompt Sent to LLM:\n{rag_prompt[:500]}...")
+        return rag_prompt
+
+
+    def query(self, user_query: str, filters=None):
+
+        self.logger.info(f"User Query: {user_query}")
+
+        aggregate = self._aggregate_answer(user_query, filters)
+        if aggregate is not None:
+            return aggregate
+
+        cached, query_embedding, store_version = self._cached_answer(user_query, filters)
+        if cached is not None:
+            return cached
+
+        rag_prompt = self._build_prompt(user_query, filters=filters)
+        if rag_prompt is None:
+            return NO_CONTEXT_RESPONSE
 
         answer = self.llm.generate(prompt=rag_prompt)
         self.logger.info("RAG Response generated.")
+
+        self._cache_answer(user_query, query_embedding, answer, store_version)
         
         return answer
+
+
+    def query_stream(self, user_query: str, cancel_event=None, filters=None):
+        """
+        Same as query(), but yields answer tokens as the LLM produces them.
+        Set `cancel_event` or close the generator to stop generation early;
+        a cancelled answer is never cached. If the LLM stream fails, the
+        error is raised after the tokens already yielded.
+        """
+        self.logger.info(f"User Query (stream): {user_query}")
+
+        aggregate = self._aggregate_answer(user_query, filters)
+        if aggregate is not None:
+            yield aggregate
+            return
+
+        cached, query_embedding, store_version = self._cached_answer(user_query, filters)
+        if cached is not None:
+            yield cached
+            return
+
+        rag_prompt = self._build_prompt(user_query, filters=filters)
+        if rag_prompt is None:
+            yield NO_CONTEXT_RESPONSE
+            return
+
+        tokens, stats = [], {}
+        for token in self.llm.generate_stream(prompt=rag_prompt, cancel_event=cancel_event, stats=stats):
+            tokens.append(token)
+            yield token
+
+        self.logger.info(
+            f"RAG Response streamed: ttft={stats.get('ttft_s')}, total={stats.get('total_s')}, "
+            f"prompt_tokens={stats.get('prompt_tokens')}"
+        )
+
+        if not stats.get("cancelled"):
+            self._cache_answer(user_query, query_embedding, "".join(tokens), store_version)
+
+
+    async def _aprepare(self, user_query: str, retrieve=None, filters=None):
+        """
+        Async cache lookup + retrieval. `retrieve` is an optional coroutine
+        function (e.g. the API server's micro-batcher) returning retrieval
+        hits; by default the blocking retriever runs in a worker thread.
+        The cache is checked first, so a hit skips retrieval; on a miss the
+        lookup's query embedding is already in the embedding cache.
+        """
+        cached, query_embedding, store_version = await asyncio.to_thread(self._cached_answer, user_query, filters)
+        if cached is not None:
+            return cached, None, query_embedding, store_version
+
+        if retrieve is not None:
+            context_chunks = await retrieve(user_query)
+        else:
+            context_chunks = (await asyncio.to_thread(self.retriever.retrieve_batch, [user_query], None, filters))[0]
+
+        return None, self._build_prompt(user_query, context_chunks), query_embedding, store_version
+
+
+    async def aquery(self, user_query: str, retrieve=None, filters=None):
+        self.logger.info(f"User Query (async): {user_query}")
+
+        aggregate = await asyncio.to_thread(self._aggregate_answer, user_query, filters)
+        if aggregate is not None:
+            return aggregate
+
+        cached, rag_prompt, query_embedding, store_version = await self._aprepare(user_query, retrieve, filters)
+        if cached is not None:
+            return cached
+        if rag_prompt is None:
+            return NO_CONTEXT_RESPONSE
+
+        answer = await self.llm.agenerate(prompt=rag_prompt)
+        self.logger.info("RAG Response generated.")
+
+        self._cache_answer(user_query, query_embedding, answer, store_version)
+        return answer
+
+
+    async def aquery_stream(self, user_query: str, retrieve=None, filters=None):
+        self.logger.info(f"User Query (async stream): {user_query}")
+
+        aggregate = await asyncio.to_thread(self._aggregate_answer, user_query, filters)
+        if aggregate is not None:
+            yield aggregate
+            return
+
+        cached, rag_prompt, query_embedding, store_version = await self._aprepare(user_query, retrieve, filters)
+        if cached is not None:
+            yield cached
+            return
+        if rag_prompt is None:
+            yield NO_CONTEXT_RESPONSE
+            return
+
+        tokens = []
+        async for token in self.llm.agenerate_stream(prompt=rag_prompt):
+            tokens.append(token)
+            yield token
+
+        # Only reached when the stream ran to completion (not cancelled)
+        self._cache_answer(user_query, query_embedding, "".join(tokens), store_version)
+
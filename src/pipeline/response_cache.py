@@ -0,0 +1,148 @@
+import re
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+from src.utils.metrics import metrics
+
+
+DEFAULT_RESPONSE_CACHE_CONFIG = {
+    "enabled": True,
+    "similarity_threshold": 0.95,   # cosine similarity between query embeddings
+    "ttl_seconds": 3600,
+    "max_entries": 1000,
+}
+
+# Account numbers, amounts and dates barely move a sentence embedding, so
+# they must match exactly for a cached answer to be reused
+NUMBER_RE = re.compile(r"\d+(?:[,./\-]\d+)*")
+PERIOD_RE = re.compile(
+    r"\b(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|q[1-4])\b"
+)
+
+
+def query_identifiers(query: str) -> Tuple[str, ...]:
+    """
+    Numbers (separators other than the decimal point removed, so
+    "1234-5678" == "12345678"), month names and quarters, in query order.
+    """
+    text = query.lower()
+    tokens = [(m.start(), re.sub(r"[,/\-]", "", m.group())) for m in NUMBER_RE.finditer(text)]
+    tokens += [(m.start(), m.group(1)[:3]) for m in PERIOD_RE.finditer(text)]
+    return tuple(token for _, token in sorted(tokens))
+
+
+class ResponseCache:
+    """
+    Semantic answer cache for RAGPipeline.
+
+    A cached answer is returned when a new query embedding is at least
+    `similarity_threshold` (cosine) close to a cached one, both queries
+    name exactly the same numbers and periods (query_identifiers), the
+    entry is younger than `ttl_seconds`, and the vector store has not
+    changed since the answer was generated.
+    """
+
+    def __init__(self, similarity_threshold=0.95, ttl_seconds=3600, max_entries=1000):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._vectors = None        # (n, dim) normalised query embeddings
+        self._entries = []          # [{"query", "identifiers", "answer", "created"}] aligned with _vectors
+        self._store_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+    def _check_version(self, store_version):
+        # Any ingest/delete bumps the store version: drop every cached answer
+        if store_version != self._store_version:
+            if self._entries:
+                self.invalidations += 1
+            self._vectors = None
+            self._entries = []
+            self._store_version = store_version
+
+
+    def get(self, query: str, query_embedding, store_version) -> Optional[str]:
+        with self._lock:
+            self._check_version(store_version)
+
+            if not self._entries:
+                self.misses += 1
+                metrics.inc("response_cache_misses")
+                return None
+
+            similarities = self._vectors @ self._normalise(query_embedding)
+            identifiers = query_identifiers(query)
+            now = time.time()
+
+            for pos in np.argsort(-similarities):
+                if similarities[pos] < self.similarity_threshold:
+                    break
+                entry = self._entries[pos]
+                if entry["identifiers"] == identifiers and now - entry["created"] <= self.ttl_seconds:
+                    self.hits += 1
+                    metrics.inc("response_cache_hits")
+                    return entry["answer"]
+
+            self.misses += 1
+            metrics.inc("response_cache_misses")
+            return None
+
+
+    def put(self, query: str, query_embedding, answer: str, store_version):
+        with self._lock:
+            self._check_version(store_version)
+            self._evict_expired()
+
+            vector = self._normalise(query_embedding)[None, :]
+            self._vectors = vector if self._vectors is None else np.vstack([self._vectors, vector])
+            self._entries.append({
+                "query": query, "identifiers": query_identifiers(query), "answer": answer, "created": time.time()
+            })
+
+            # Oldest entries go first once the cache is full
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._vectors = self._vectors[overflow:]
+                self._entries = self._entries[overflow:]
+
+
+    def _evict_expired(self):
+        if not self._entries:
+            return
+        now = time.time()
+        keep = [pos for pos, entry in enumerate(self._entries) if now - entry["created"] <= self.ttl_seconds]
+        if len(keep) != len(self._entries):
+            self._vectors = self._vectors[keep] if keep else None
+            self._entries = [self._entries[pos] for pos in keep]
+
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
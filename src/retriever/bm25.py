@@ -0,0 +1,218 @@
+import re
+import math
+import threading
+from pathlib import Path
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+from src.utils.sqlite import connect, table_columns
+
+
+DEFAULT_LEXICAL_CONFIG = {
+    "enabled": True,
+    "path": None,               # None = <index name>.bm25.sqlite next to the FAISS index
+    "k1": 1.2,
+    "b": 0.75,
+    # Terms in more than this share of documents carry ~no IDF; skip them
+    "max_df_ratio": 0.5,
+    # BM25F-style boosts: a hit in these fields counts as `weight` occurrences
+    "field_weights": {
+        "account_number": 3.0,
+        "statement_number": 3.0,
+        "phone_number": 2.0,
+        "branch_name": 2.0,
+        "bank_name": 2.0,
+        "account_holder_name": 2.0,
+    },
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+DIGIT_GROUPS_RE = re.compile(r"\d+(?:[\-/. ]\d+)+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased alphanumeric tokens. Digit groups written with separators
+    ("1234-5678", "1234 5678") also yield their joined form, so account
+    and statement numbers match however they were typed.
+    """
+    text = text.lower()
+    tokens = TOKEN_RE.findall(text)
+
+    for match in DIGIT_GROUPS_RE.findall(text):
+        tokens.append(re.sub(r"\D", "", match))
+
+    return tokens
+
+
+class BM25Index:
+    """
+    Incremental inverted index with BM25 scoring, stored in SQLite next to
+    the FAISS index.
+
+    Documents are the "field: value" text produced by JSONIngestor; tokens
+    from boosted fields (account_number, statement_number, ...) get a
+    higher term frequency, so exact identifiers outrank boilerplate.
+    """
+
+    def __init__(self, path="./data/vectorstore/faiss.bm25.sqlite", k1=1.2, b=0.75,
+                 max_df_ratio=0.5, field_weights=None, read_only=False):
+        self.path = Path(path)
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.field_weights = field_weights or {}
+
+        self._lock = threading.Lock()
+        self._db = connect(self.path, read_only)
+        self.outdated = False
+        if read_only:
+            # Schema upgrades wait for a writable open
+            self.outdated = not all(table_columns(self._db, table) for table in ("postings", "doc_lengths", "meta"))
+        else:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL, doc_id INTEGER NOT NULL, tf REAL NOT NULL,"
+                " PRIMARY KEY (term, doc_id)) WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS doc_lengths (doc_id INTEGER PRIMARY KEY, length REAL NOT NULL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+            self._db.commit()
+
+        # Corpus statistics are kept in `meta` so opening stays O(1)
+        meta = {} if self.outdated else dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self.doc_count = int(meta.get("doc_count", 0))
+        self.total_length = float(meta.get("total_length", 0.0))
+
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+
+    def term_frequencies(self, text: str) -> Counter:
+        counts = Counter()
+
+        for line in text.splitlines():
+            field, sep, value = line.partition(":")
+            if sep:
+                weight = self.field_weights.get(field.strip().lower().replace(" ", "_"), 1.0)
+                for token in tokenize(value):
+                    counts[token] += weight
+                # Field names are still searchable, at normal weight
+                counts.update(tokenize(field))
+            else:
+                counts.update(tokenize(line))
+
+        return counts
+
+
+    def add_many(self, docs: Dict[int, str]):
+        postings, lengths = [], []
+
+        for doc_id, text in docs.items():
+            counts = self.term_frequencies(text)
+            postings.extend((term, int(doc_id), float(tf)) for term, tf in counts.items())
+            lengths.append((int(doc_id), float(sum(counts.values()))))
+
+        with self._lock:
+            existing = self._existing([doc_id for doc_id, _ in lengths])
+            self._db.executemany("INSERT OR REPLACE INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings)
+            self._db.executemany("INSERT OR REPLACE INTO doc_lengths (doc_id, length) VALUES (?, ?)", lengths)
+
+            for doc_id, length in lengths:
+                if doc_id in existing:
+                    self.total_length -= existing[doc_id]
+                else:
+                    self.doc_count += 1
+                self.total_length += length
+            self._write_meta()
+
+
+    def delete_many(self, doc_ids: Iterable[int]):
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+
+        with self._lock:
+            existing = self._existing(doc_ids)
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                self._db.execute(f"DELETE FROM postings WHERE doc_id IN ({marks})", chunk)
+                self._db.execute(f"DELETE FROM doc_lengths WHERE doc_id IN ({marks})", chunk)
+
+            self.doc_count -= len(existing)
+            self.total_length -= sum(existing.values())
+            self._write_meta()
+
+
+    def _existing(self, doc_ids: List[int]) -> Dict[int, float]:
+        found = {}
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT doc_id, length FROM doc_lengths WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(rows)
+        return found
+
+
+    def _write_meta(self):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("doc_count", self.doc_count), ("total_length", self.total_length)]
+        )
+
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+
+    def search(self, query: str, top_k: int = 5, doc_ids: Optional[Collection[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Return [(doc_id, bm25 score)] best first, optionally only among `doc_ids`.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_count:
+            return []
+
+        avg_length = self.total_length / self.doc_count
+        max_df = max(1, int(self.max_df_ratio * self.doc_count))
+        scores: Dict[int, float] = {}
+        term_postings = []
+
+        with self._lock:
+            dfs = {}
+            for term in terms:
+                df = self._db.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if df:
+                    dfs[term] = df
+
+            # Common terms only cost time; drop them unless nothing else is left
+            selective = {term: df for term, df in dfs.items() if df <= max_df}
+            for term, df in (selective or dfs).items():
+                rows = self._db.execute("SELECT doc_id, tf FROM postings WHERE term = ?", (term,)).fetchall()
+                if doc_ids is not None:
+                    rows = [row for row in rows if row[0] in doc_ids]
+                term_postings.append((df, rows))
+
+            doc_ids = list({doc_id for _, rows in term_postings for doc_id, _ in rows})
+            lengths = self._existing(doc_ids)
+
+        for df, rows in term_postings:
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            for doc_id, tf in rows:
+                length = lengths.get(doc_id)
+                if length is None:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,26 +1,159 @@
-from src.vectorstore.store import VectorStore
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.utils.config import load_config
 from src.utils.logger import Logger
 
 
+DEFAULT_RETRIEVAL_CONFIG = {
+    "hybrid": True,             # fuse BM25 with vector hits when a lexical index exists
+    "rrf_k": 60,
+    # Each ranker contributes top_k * candidate_multiplier candidates to the fusion
+    "candidate_multiplier": 4,
+    # Chunked statements: return the matching chunks, or the whole statements they came from
+    "expand_parents": False,
+}
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse ranked doc ID lists: score(d) = sum(1 / (k + rank)), best first.
+    Only ranks are used, so BM25 scores and L2 distances need no scaling.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
 class Retriever:
 
-    def __init__(self, vectorstore, top_k=5):
+    def __init__(self, vectorstore, top_k=5, hybrid=None, rrf_k=None, candidate_multiplier=None, expand_parents=None):
         self.top_k = top_k
         self.logger = Logger("RETRIEVER", "./logs/retriever.log").get_logger()
 
         # Use existing vectorstore (no new load!)
         self.vectorstore = vectorstore
 
-        self.logger.info("Retriever initialized.")
+        config = load_config("./configs/vectorstore.yaml", "retrieval", DEFAULT_RETRIEVAL_CONFIG)
+        hybrid = config["hybrid"] if hybrid is None else hybrid
+        self.hybrid = bool(hybrid) and getattr(vectorstore, "lexical_index", None) is not None
+        self.rrf_k = int(rrf_k or config["rrf_k"])
+        self.candidate_multiplier = int(candidate_multiplier or config["candidate_multiplier"])
+        self.expand_parents = bool(config["expand_parents"] if expand_parents is None else expand_parents)
 
+        self.logger.info(f"Retriever initialized (hybrid={self.hybrid}).")
 
-    def retrieve(self, query: str):
 
-        self.logger.info(f"Retrieving context for query: {query}")
+    def retrieve(self, query: str, filters: Optional[dict] = None):
+        """
+        `filters` are metadata predicates, e.g. {"bank_name": "HDFC",
+        "period": ["2024-03-01", "2024-03-31"]}; only matching statements
+        are searched.
+        """
+        self.logger.debug(f"Retrieving context for query: {query}")
 
-        results = self.vectorstore.search(query, top_k=self.top_k)
+        if self.hybrid or self.expand_parents:
+            results = [hit["text"] for hit in self.retrieve_batch([query], filters=filters)[0]]
+        else:
+            results = self.vectorstore.search(query, top_k=self.top_k, filters=filters)
 
         if not results:
             self.logger.warning("No relevant documents retrieved.")
 
         return results
+
+
+    def retrieve_batch(self, queries, top_k: Optional[int] = None, filters: Optional[dict] = None,
+                       expand_parents: Optional[bool] = None):
+        """
+        Retrieve for many queries with one batched embed + search.
+        Returns one list of hits (id, distance, text, source, parent) per
+        query; hybrid hits also carry their fused "score".
+
+        With expand_parents, chunk hits are replaced by the full statement
+        they were cut from (best chunk per statement, in rank order).
+        """
+        top_k = top_k or self.top_k
+        expand = self.expand_parents if expand_parents is None else expand_parents
+        self.logger.debug(f"Retrieving context for {len(queries)} queries")
+
+        # Resolve the filters once; both rankers search only these IDs
+        ids = self.vectorstore.filter_ids(filters)
+
+        # Several chunks of one statement may rank: fetch extra so top_k statements remain
+        fetch_k = top_k * self.candidate_multiplier if expand else top_k
+
+        if self.hybrid:
+            results = self._hybrid_search(queries, fetch_k, ids)
+        else:
+            results = self.vectorstore.search_batch(queries, top_k=fetch_k, ids=ids)
+
+        if expand:
+            results = self._expand_parents(results, top_k)
+
+        empty = sum(1 for hits in results if not hits)
+        if empty:
+            self.logger.warning(f"No relevant documents retrieved for {empty} queries.")
+
+        return results
+
+
+    def _hybrid_search(self, queries, top_k: int, ids=None):
+        candidates = top_k * self.candidate_multiplier
+        vector_results = self.vectorstore.search_batch(queries, top_k=candidates, ids=ids)
+        lexical_index = self.vectorstore.lexical_index
+        allowed = None if ids is None else set(ids.tolist())
+
+        fused_results = []
+        for query, vector_hits in zip(queries, vector_results):
+            lexical_hits = lexical_index.search(query, top_k=candidates, doc_ids=allowed)
+            fused = reciprocal_rank_fusion(
+                [[hit["id"] for hit in vector_hits], [doc_id for doc_id, _ in lexical_hits]],
+                k=self.rrf_k
+            )[:top_k]
+            fused_results.append((fused, {hit["id"]: hit for hit in vector_hits}))
+
+        # Lexical-only winners were never fetched by search_batch: one lookup for all
+        missing = {doc_id for fused, by_id in fused_results for doc_id, _ in fused if doc_id not in by_id}
+        docs = self.vectorstore.docstore.get_many(missing) if missing else {}
+
+        results = []
+        for fused, by_id in fused_results:
+            hits = []
+            for doc_id, score in fused:
+                hit = by_id.get(doc_id)
+                if hit is None:
+                    doc = docs.get(doc_id)
+                    if doc is None:
+                        continue
+                    hit = {
+                        "id": doc_id, "distance": None, "text": doc["text"],
+                        "source": doc["source"], "parent": doc.get("parent"),
+                    }
+                hits.append({**hit, "score": round(score, 6)})
+            results.append(hits)
+
+        return results
+
+
+    def _expand_parents(self, results, top_k: int):
+        parents = {hit["parent"] for hits in results for hit in hits if hit.get("parent")}
+        texts = self.vectorstore.docstore.get_parents(parents) if parents else {}
+
+        expanded = []
+        for hits in results:
+            seen, kept = set(), []
+            for hit in hits:
+                parent = hit.get("parent")
+                key = parent or hit["source"]
+                if key in seen:
+                    continue
+                seen.add(key)
+                if parent and parent in texts:
+                    hit = {**hit, "text": texts[parent], "source": parent, "chunk": hit["source"]}
+                kept.append(hit)
+                if len(kept) == top_k:
+                    break
+            expanded.append(kept)
+        return expanded
@@ -0,0 +1,19 @@
+import yaml
+from pathlib import Path
+from typing import Any, Dict
+
+
+def load_config(config_path, section: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return `defaults` overlaid with one top-level section of a YAML file.
+    A missing file, empty file or missing section gives the defaults.
+    """
+    config = dict(defaults)
+    config_path = Path(config_path)
+
+    if config_path.exists():
+        with open(config_path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        config.update(data.get(section) or {})
+
+    return config
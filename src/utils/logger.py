@@ -1,5 +1,37 @@
+import atexit
+import queue
 import logging
 from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener
+
+
+# All loggers enqueue records; one listener thread does the formatting and
+# file/console writes, so logging never blocks the calling thread on I/O
+_queue = queue.SimpleQueue()
+_routes = {}
+_listener = None
+
+
+class _RouteHandler(logging.Handler):
+    """
+    Runs on the listener thread: hands each record to the handlers of the
+    logger that emitted it.
+    """
+
+    def handle(self, record):
+        for handler in _routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_queue, _RouteHandler())
+        _listener.start()
+        # Drain what is still queued before the process exits
+        atexit.register(_listener.stop)
 
 
 class Logger:
@@ -29,11 +61,10 @@ class Logger:
             file_handler.setFormatter(formatter)
             console_handler.setFormatter(formatter)
 
-            self.logger.addHandler(file_handler)
-            self.logger.addHandler(console_handler)
+            _routes[self.name] = (file_handler, console_handler)
+            _start_listener()
+            self.logger.addHandler(QueueHandler(_queue))
+
 
-        
     def get_logger(self):
         return self.logger
-    
-
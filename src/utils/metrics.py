@@ -0,0 +1,200 @@
+import json
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Dict, Optional, Tuple
+
+
+# Histogram upper bounds in seconds (Prometheus "le" buckets)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class Span:
+    """
+    Times a block into a Metrics histogram:
+
+        with metrics.span("index_search", index="ivf"):
+            ...
+    """
+
+    __slots__ = ("metrics", "name", "labels", "start", "seconds")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.seconds = None
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.metrics.observe(self.name, self.seconds, error=exc_type is not None, **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    In-process counters and latency histograms, exported as JSON or in
+    the Prometheus text format. Recording is a dict update under a lock,
+    cheap enough for the hot path; disable with `enabled = False`.
+    """
+
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled or not value:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+
+    def observe(self, name: str, seconds: float, error: bool = False, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = {
+                    "count": 0, "errors": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(self.buckets) + 1)
+                }
+            timer["count"] += 1
+            timer["errors"] += error
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            timer["buckets"][bucket] += 1
+
+
+    def span(self, name: str, **labels) -> Span:
+        return Span(self, name, labels)
+
+
+    def timed(self, name: str, **labels):
+        """
+        Decorator form of span().
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        {"counters": {name: [{"labels", "value"}]}, "timers": {name: [{"labels",
+        "count", "errors", "sum_s", "mean_ms", "max_ms", "p50_ms", "p95_ms", "p99_ms"}]}}.
+        Percentiles are bucket upper bounds, so they are estimates.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {key: {**timer, "buckets": list(timer["buckets"])} for key, timer in self._timers.items()}
+
+        snapshot = {"counters": {}, "timers": {}}
+        for (name, labels), value in sorted(counters.items()):
+            snapshot["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+
+        for (name, labels), timer in sorted(timers.items()):
+            count = timer["count"]
+            snapshot["timers"].setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": count,
+                "errors": timer["errors"],
+                "sum_s": round(timer["sum"], 6),
+                "mean_ms": round(timer["sum"] / count * 1000, 3) if count else None,
+                "max_ms": round(timer["max"] * 1000, 3),
+                "p50_ms": self._quantile_ms(timer, 0.50),
+                "p95_ms": self._quantile_ms(timer, 0.95),
+                "p99_ms": self._quantile_ms(timer, 0.99),
+            })
+        return snapshot
+
+
+    def _quantile_ms(self, timer, q: float) -> Optional[float]:
+        if not timer["count"]:
+            return None
+        rank, seen = q * timer["count"], 0
+        for bound, count in zip(self.buckets, timer["buckets"]):
+            seen += count
+            if seen >= rank:
+                # Never report more than the slowest observation
+                return round(min(bound, timer["max"]) * 1000, 3)
+        return round(timer["max"] * 1000, 3)
+
+
+    def to_json(self, indent=4) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+
+    def to_prometheus(self, prefix: str = "finsight") -> str:
+        """
+        Counters as <prefix>_<name>_total, timers as <prefix>_<name>_seconds
+        histograms.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {key: {**timer, "buckets": list(timer["buckets"])} for key, timer in self._timers.items()}
+
+        def render(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}"
+
+        lines, typed = [], set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{prefix}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{render(labels)} {value}")
+
+        for (name, labels), timer in sorted(timers.items()):
+            metric = f"{prefix}_{name}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, timer["buckets"]):
+                cumulative += count
+                lines.append(f"{metric}_bucket{render(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{metric}_bucket{render(labels, [('le', '+Inf')])} {timer['count']}")
+            lines.append(f"{metric}_sum{render(labels)} {timer['sum']:.6f}")
+            lines.append(f"{metric}_count{render(labels)} {timer['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the pipeline modules
+metrics = Metrics()
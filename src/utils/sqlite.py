@@ -0,0 +1,24 @@
+import sqlite3
+from pathlib import Path
+
+
+def connect(path, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Open a SQLite file shared by several threads (callers hold their own
+    lock). Writable connections use WAL; read-only ones open the file with
+    mode=ro and set no pragmas, so they can never write it.
+    """
+    if read_only:
+        return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+
+    db = sqlite3.connect(str(path), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+def table_columns(db: sqlite3.Connection, table: str) -> set:
+    """
+    Column names of `table` (empty if it does not exist).
+    """
+    return {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
@@ -0,0 +1,161 @@
+import math
+from typing import Dict, List, Optional, Sequence
+
+from src.vectorstore.document import Document
+
+
+DEFAULT_CHUNKING_CONFIG = {
+    "enabled": False,
+    "strategy": "fields",       # fields | window
+    # all-MiniLM-L6-v2 truncates at 256 word pieces: stay under it with headroom
+    "max_tokens": 200,
+    "overlap_tokens": 32,       # tokens repeated between consecutive window chunks
+    "chars_per_token": 4.0,     # token estimate without loading the tokenizer
+    # Repeated at the top of every chunk so each one says which statement it is from
+    "header_fields": ["bank_name", "account_number", "statement_from_date", "statement_to_date"],
+    # fields strategy: one chunk per group; anything else (e.g. transaction lists) is windowed
+    "field_groups": {
+        "account": ["bank_name", "account_number", "account_holder_name", "phone_number", "branch_name"],
+        "period": ["statement_from_date", "statement_to_date", "statement_date_generated", "statement_number"],
+        "balances": ["opening_balance", "closing_balance", "total_debits", "total_credits", "currency"],
+    },
+}
+
+# Bookkeeping written by BankStatementOCR, not statement content
+SKIP_FIELDS = ("source_file", "processing_timestamp")
+
+
+def field_line(key: str, value) -> str:
+    return f"{key.replace('_', ' ')}: {value}"
+
+
+def value_lines(key: str, value) -> List[str]:
+    """
+    One line per list item (transaction rows), so windows split between
+    rows instead of inside one huge line.
+    """
+    if isinstance(value, list) and value:
+        lines = []
+        for item in value:
+            if isinstance(item, dict):
+                item = ", ".join(f"{k.replace('_', ' ')}: {v}" for k, v in item.items())
+            lines.append(field_line(key, item))
+        return lines
+    return [field_line(key, value)]
+
+
+class StatementChunker:
+    """
+    Split a parsed statement into chunks that fit the embedding model.
+
+    fields : one chunk per field group (account, period, balances), plus
+             windows over the remaining fields such as transaction lists
+    window : sliding windows over all lines, with `overlap_tokens` repeated
+
+    A statement that fits `max_tokens` stays one document. Otherwise each
+    chunk starts with the header fields and points back to the statement
+    through Document.parent / parent_text.
+    """
+
+    def __init__(self, strategy="fields", max_tokens=200, overlap_tokens=32, chars_per_token=4.0,
+                 header_fields: Optional[Sequence[str]] = None, field_groups: Optional[Dict[str, List[str]]] = None):
+        if strategy not in ("fields", "window"):
+            raise ValueError(f"Unknown chunking strategy '{strategy}', expected fields or window")
+        self.strategy = strategy
+        self.max_tokens = int(max_tokens)
+        self.overlap_tokens = int(overlap_tokens)
+        self.chars_per_token = float(chars_per_token)
+        self.header_fields = list(DEFAULT_CHUNKING_CONFIG["header_fields"] if header_fields is None else header_fields)
+        self.field_groups = dict(DEFAULT_CHUNKING_CONFIG["field_groups"] if field_groups is None else field_groups)
+
+
+    def count_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+    def chunk(self, document: Document) -> List[Document]:
+        """
+        `document.metadata` holds the parsed statement fields (as written by
+        JSONIngestor.to_document); they are copied to every chunk so
+        metadata filters still match.
+        """
+        data = document.metadata
+        if not isinstance(data, dict) or not data or self.count_tokens(document.text) <= self.max_tokens:
+            return [document]
+
+        header = [field_line(key, data[key]) for key in self.header_fields if data.get(key) is not None]
+        budget = max(self.max_tokens - self.count_tokens("\n".join(header)), 1)
+
+        if self.strategy == "window":
+            lines = [line for key, value in data.items() if key not in SKIP_FIELDS for line in value_lines(key, value)]
+            bodies = self.windows(lines, budget)
+        else:
+            bodies, grouped = [], set()
+            for fields in self.field_groups.values():
+                lines = [field_line(key, data[key]) for key in fields if data.get(key) is not None]
+                grouped.update(fields)
+                # Lines already in the header carry no new information on their own
+                if any(line not in header for line in lines):
+                    bodies.extend(self.windows(lines, budget))
+            rest = [
+                line for key, value in data.items()
+                if key not in grouped and key not in SKIP_FIELDS and value is not None
+                for line in value_lines(key, value)
+            ]
+            bodies.extend(self.windows(rest, budget))
+
+        chunks = []
+        for body in bodies:
+            lines = header + [line for line in body if line not in header]
+            chunks.append(Document(
+                text="\n".join(lines),
+                source=f"{document.source}#{len(chunks)}",
+                metadata=data,
+                parent=document.source,
+                parent_text=document.text,
+            ))
+        return chunks
+
+
+    def windows(self, lines: List[str], budget: int) -> List[List[str]]:
+        """
+        Pack lines into windows of at most `budget` tokens; each window
+        after the first repeats up to `overlap_tokens` of the previous one's
+        trailing lines. A line longer than the budget is split at words.
+        """
+        pieces = []
+        for line in lines:
+            if self.count_tokens(line) <= budget:
+                pieces.append(line)
+                continue
+            words, piece = line.split(), []
+            for word in words:
+                if piece and self.count_tokens(" ".join(piece + [word])) > budget:
+                    pieces.append(" ".join(piece))
+                    piece = []
+                piece.append(word)
+            if piece:
+                pieces.append(" ".join(piece))
+
+        windows, window, used = [], [], 0
+        for piece in pieces:
+            tokens = self.count_tokens(piece) + (1 if window else 0)
+            if window and used + tokens > budget:
+                windows.append(window)
+                overlap, overlap_used = [], 0
+                for previous in reversed(window):
+                    cost = self.count_tokens(previous) + 1
+                    if overlap_used + cost > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_used += cost
+                # The overlap must leave room for the new line
+                while overlap and overlap_used + self.count_tokens(piece) > budget:
+                    overlap_used -= self.count_tokens(overlap.pop(0)) + 1
+                window, used = overlap, overlap_used
+                tokens = self.count_tokens(piece) + (1 if window else 0)
+            window.append(piece)
+            used += tokens
+        if window:
+            windows.append(window)
+        return windows
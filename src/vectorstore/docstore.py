@@ -0,0 +1,235 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from src.utils.sqlite import connect, table_columns
+
+
+class DocStore:
+    """
+    SQLite-backed document store keyed by the stable doc IDs in the FAISS index.
+
+    Opening it is O(1): nothing is parsed up front. Writes append or delete
+    only the affected rows, and search fetches just the top-k texts it
+    returns. A legacy docstore.json (list or {"documents": ...}) can be
+    imported once with import_json().
+    """
+
+    def __init__(self, path="./data/vectorstore/docstore.sqlite", read_only=False):
+        self.path = Path(path)
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Shared by the API server's worker threads, so guard with a lock
+        self._lock = threading.Lock()
+        self._db = connect(self.path, read_only)
+        if read_only:
+            # Schema upgrades wait for a writable open
+            self.outdated = not (
+                "parent" in table_columns(self._db, "documents")
+                and table_columns(self._db, "parents") and table_columns(self._db, "meta")
+            )
+            return
+
+        self.outdated = False
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY,"
+            " source TEXT,"
+            " hash TEXT NOT NULL,"
+            " text TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_source ON documents (source)")
+
+        # Chunked statements: each chunk names its parent, whose full text is kept once
+        if "parent" not in table_columns(self._db, "documents"):
+            self._db.execute("ALTER TABLE documents ADD COLUMN parent TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_parent ON documents (parent)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS parents (source TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        # Store-level facts saved with the documents, e.g. the IVF training size
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value NOT NULL)")
+        self._db.commit()
+
+
+    @staticmethod
+    def _chunks(items: List, size: int = 500):
+        # SQLite caps the number of bound parameters per statement
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+    def __contains__(self, doc_id: int) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM documents WHERE id = ?", (int(doc_id),)).fetchone() is not None
+
+
+    def existing_ids(self, doc_ids: Iterable[int]) -> Set[int]:
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        found = set()
+        with self._lock:
+            for chunk in self._chunks(doc_ids):
+                rows = self._db.execute(
+                    f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+
+    def get(self, doc_id: int) -> Optional[dict]:
+        return self.get_many([doc_id]).get(int(doc_id))
+
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, dict]:
+        doc_ids = list({int(doc_id) for doc_id in doc_ids if doc_id >= 0})
+        docs = {}
+        with self._lock:
+            for chunk in self._chunks(doc_ids):
+                rows = self._db.execute(
+                    f"SELECT id, source, hash, text, parent FROM documents WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for doc_id, source, text_hash, text, parent in rows:
+                    docs[doc_id] = {"text": text, "source": source, "hash": text_hash}
+                    if parent is not None:
+                        docs[doc_id]["parent"] = parent   # only chunks of a longer statement
+        return docs
+
+
+    def get_parents(self, sources: Iterable[str]) -> Dict[str, str]:
+        """
+        Full statement text per parent source (for expanding chunk hits).
+        """
+        sources = list(set(sources))
+        parents = {}
+        with self._lock:
+            for chunk in self._chunks(sources):
+                rows = self._db.execute(
+                    f"SELECT source, text FROM parents WHERE source IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                parents.update(rows)
+        return parents
+
+
+    def id_for_source(self, source: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute("SELECT id FROM documents WHERE source = ? LIMIT 1", (source,)).fetchone()
+        return row[0] if row else None
+
+
+    def ids_for_statement(self, source: str) -> List[int]:
+        """
+        IDs stored for a statement: the document with that source, or its chunks.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM documents WHERE source = ? OR parent = ?", (source, source)).fetchall()
+        return [row[0] for row in rows]
+
+
+    def sources(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT source, id FROM documents WHERE source IS NOT NULL").fetchall()
+        return dict(rows)
+
+
+    def ids(self) -> Iterator[int]:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM documents").fetchall()
+        return (row[0] for row in rows)
+
+
+    def iter_texts(self, batch_size: int = 1000) -> Iterator[Dict[int, str]]:
+        """
+        Yield {doc_id: text} batches over the whole store (for backfills).
+        """
+        last_id = None
+        while True:
+            with self._lock:
+                if last_id is None:
+                    rows = self._db.execute(
+                        "SELECT id, text FROM documents ORDER BY id LIMIT ?", (batch_size,)
+                    ).fetchall()
+                else:
+                    rows = self._db.execute(
+                        "SELECT id, text FROM documents WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                    ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield dict(rows)
+
+
+    def add_many(self, docs: Dict[int, dict]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO documents (id, source, hash, text, parent) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (int(doc_id), doc.get("source"), doc["hash"], doc["text"], doc.get("parent"))
+                    for doc_id, doc in docs.items()
+                ]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO parents (source, text) VALUES (?, ?)",
+                {(doc["parent"], doc["parent_text"]) for doc in docs.values() if doc.get("parent_text")}
+            )
+
+
+    def delete_many(self, doc_ids: Iterable[int]) -> Dict[int, dict]:
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        removed = self.get_many(doc_ids)
+        parents = list({doc["parent"] for doc in removed.values() if doc.get("parent")})
+        with self._lock:
+            for chunk in self._chunks(doc_ids):
+                self._db.execute(f"DELETE FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            # A parent goes with its last chunk
+            for chunk in self._chunks(parents):
+                self._db.execute(
+                    f"DELETE FROM parents WHERE source IN ({','.join('?' * len(chunk))}) "
+                    "AND NOT EXISTS (SELECT 1 FROM documents WHERE documents.parent = parents.source)",
+                    chunk
+                )
+        return removed
+
+
+    def get_meta(self, key: str, default=None):
+        if self.outdated:
+            return default
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+
+    def import_json(self, json_path) -> int:
+        """
+        Import a docstore.json written by older versions. Returns the number
+        of documents imported; list-style (row-aligned) files are skipped
+        because they need the FAISS migration in VectorStore.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if isinstance(data, list):
+            return 0
+
+        self.add_many({int(doc_id): doc for doc_id, doc in data["documents"].items()})
+        self.commit()
+        return len(data["documents"])
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
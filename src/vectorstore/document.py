@@ -0,0 +1,40 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_doc_id(source: Optional[str], text_hash: str) -> int:
+    """
+    Stable 63-bit document ID derived from the source file and content hash.
+    FAISS stores IDs as signed int64, so the top bit is always cleared.
+    """
+    key = f"{source or ''}\0{text_hash}".encode("utf-8")
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+@dataclass
+class Document:
+    """
+    A text chunk ready to be embedded, with the file it came from.
+    Chunks of a longer statement (see StatementChunker) also carry the
+    statement's source and full text as `parent` / `parent_text`.
+    """
+
+    text: str
+    source: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    parent: Optional[str] = None
+    parent_text: Optional[str] = None
+
+    @property
+    def hash(self) -> str:
+        return content_hash(self.text)
+
+    @property
+    def doc_id(self) -> int:
+        return make_doc_id(self.source, self.hash)
@@ -0,0 +1,238 @@
+import os
+import json
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+from src.utils.logger import Logger
+
+
+DEFAULT_EMBEDDER_CONFIG = {
+    # eager: load before the index is read
+    # background: load in a thread while the index and docstore are read
+    # lazy: load on the first embed (never, if every text is in the embedding cache)
+    "load": "background",
+    "backend": "torch",         # torch | onnx | onnx_int8
+    # Local model directory for the ONNX backends (tokenizer, pooling config, .onnx files)
+    "model_path": "./sentece-transformers/all-MiniLM-L6-v2",
+    "onnx_dir": None,           # None = <model_path>/onnx
+    "batch_size": 64,
+    "max_batch_tokens": 16384,  # padded tokens per batch (batch rows x longest text)
+    "threads": 0,               # intra-op threads, 0 = runtime default
+}
+
+EMBEDDER_BACKENDS = ("torch", "onnx", "onnx_int8")
+
+
+def plan_batches(lengths: Sequence[int], batch_size: int, max_batch_tokens: int) -> List[List[int]]:
+    """
+    Group text positions into batches of similar token length, longest
+    first, so little compute is spent on padding. A batch holds at most
+    `batch_size` texts and `max_batch_tokens` padded tokens.
+    """
+    order = sorted(range(len(lengths)), key=lambda pos: lengths[pos], reverse=True)
+    batches, batch = [], []
+    for pos in order:
+        # Sorted longest first: the batch's first text sets its padded width
+        width = lengths[batch[0]] if batch else lengths[pos]
+        if batch and (len(batch) >= batch_size or (len(batch) + 1) * width > max_batch_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(pos)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class SentenceTransformerEmbedder:
+    """
+    The full-precision PyTorch SentenceTransformer (the original path).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 64, threads: int = 0):
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            import torch
+            torch.set_num_threads(int(threads))
+
+        self.model = SentenceTransformer(model_name)
+        self.batch_size = int(batch_size)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True)
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime version of a SentenceTransformer read from a local model
+    directory: the HF tokenizer, then the transformer graph, then the
+    pooling / normalisation described by the directory's module configs.
+    Nothing is downloaded.
+
+    With `quantize=True` the int8 graph (model_int8.onnx) is used, made
+    once from model.onnx with dynamic quantization if it is missing.
+    model.onnx itself is exported from local PyTorch weights when absent.
+    """
+
+    def __init__(self, model_path, onnx_dir=None, quantize=False, batch_size=64,
+                 max_batch_tokens=16384, threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_path = Path(model_path)
+        self.onnx_dir = Path(onnx_dir) if onnx_dir else self.model_path / "onnx"
+        self.batch_size = int(batch_size)
+        self.max_batch_tokens = int(max_batch_tokens)
+
+        self.logger = Logger("EMBEDDER", "./logs/vectorstore.log").get_logger()
+
+        bert_config = self._read_json("sentence_bert_config.json", {"max_seq_length": 256})
+        pooling = self._read_json("1_Pooling/config.json", {"pooling_mode_mean_tokens": True})
+        modules = self._read_json("modules.json", [])
+        self.pooling = "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+        self.normalize = any(module["type"].endswith("Normalize") for module in modules)
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_path / "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=int(bert_config["max_seq_length"]))
+        self.pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+
+        model_file = self._quantized_model() if quantize else self._model()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.dimension = int(pooling.get("word_embedding_dimension") or self.session.get_outputs()[0].shape[-1])
+
+        self.logger.info(f"ONNX embedder ready: {model_file} ({self.pooling} pooling, normalize={self.normalize})")
+
+
+    def _read_json(self, name: str, default):
+        path = self.model_path / name
+        if not path.exists():
+            return default
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    def _model(self) -> Path:
+        model_file = self.onnx_dir / "model.onnx"
+        if not model_file.exists():
+            self._export(model_file)
+        return model_file
+
+
+    def _quantized_model(self) -> Path:
+        model_file = self.onnx_dir / "model_int8.onnx"
+        if model_file.exists():
+            return model_file
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        source = self._model()
+        self.logger.info(f"Quantizing {source} to int8...")
+        tmp_path = model_file.with_suffix(".onnx.tmp")
+        quantize_dynamic(str(source), str(tmp_path), weight_type=QuantType.QInt8)
+        os.replace(tmp_path, model_file)
+        return model_file
+
+
+    def _export(self, model_file: Path):
+        """
+        One-off export of the local PyTorch weights to ONNX.
+        """
+        try:
+            import torch
+            from transformers import AutoModel
+            model = AutoModel.from_pretrained(str(self.model_path), local_files_only=True)
+        except (ImportError, OSError) as e:
+            raise FileNotFoundError(
+                f"No ONNX model at {model_file} and no local PyTorch weights to export from "
+                f"{self.model_path}: copy the model's onnx/model.onnx there, or its weights "
+                f"with torch and transformers installed ({str(e)})"
+            ) from e
+
+        self.logger.info(f"Exporting {self.model_path} to {model_file}...")
+        model.eval()
+        self.onnx_dir.mkdir(parents=True, exist_ok=True)
+        sample = self.tokenizer.encode("export sample")
+        inputs = {
+            "input_ids": torch.tensor([sample.ids]),
+            "attention_mask": torch.tensor([sample.attention_mask]),
+            "token_type_ids": torch.tensor([sample.type_ids]),
+        }
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in inputs}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        tmp_path = model_file.with_suffix(".onnx.tmp")
+        torch.onnx.export(
+            model, (inputs,), str(tmp_path),
+            input_names=list(inputs), output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14,
+        )
+        os.replace(tmp_path, model_file)
+
+
+    def encode(self, texts: List[str], convert_to_numpy: bool = True) -> np.ndarray:
+        texts = list(texts)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        encodings = self.tokenizer.encode_batch(texts)
+        lengths = [len(encoding.ids) for encoding in encodings]
+
+        for batch in plan_batches(lengths, self.batch_size, self.max_batch_tokens):
+            width = max(lengths[pos] for pos in batch)
+            input_ids = np.full((len(batch), width), self.pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            token_type_ids = np.zeros((len(batch), width), dtype=np.int64)
+            for row, pos in enumerate(batch):
+                encoding = encodings[pos]
+                input_ids[row, :lengths[pos]] = encoding.ids
+                attention_mask[row, :lengths[pos]] = 1
+                token_type_ids[row, :lengths[pos]] = encoding.type_ids
+
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+            hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+            embeddings[batch] = self._pool(hidden, attention_mask)
+
+        return embeddings
+
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+
+def load_embedder(embedding_model: str, config: Optional[Dict[str, Any]] = None):
+    """
+    Build the embedder selected by `config["backend"]`. Every backend has
+    encode(texts, convert_to_numpy=True) -> (n, dim) float32 and `dimension`.
+    """
+    config = {**DEFAULT_EMBEDDER_CONFIG, **(config or {})}
+    backend = config["backend"]
+
+    if backend == "torch":
+        return SentenceTransformerEmbedder(embedding_model, config["batch_size"], config["threads"])
+    if backend in ("onnx", "onnx_int8"):
+        return OnnxEmbedder(
+            config["model_path"],
+            onnx_dir=config["onnx_dir"],
+            quantize=backend == "onnx_int8",
+            batch_size=config["batch_size"],
+            max_batch_tokens=config["max_batch_tokens"],
+            threads=config["threads"],
+        )
+    raise ValueError(f"Unknown embedder backend '{backend}', expected one of {EMBEDDER_BACKENDS}")
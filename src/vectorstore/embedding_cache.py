@@ -0,0 +1,168 @@
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from src.utils.metrics import metrics
+
+
+DEFAULT_EMBEDDING_CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 10000,           # query embeddings kept in memory
+    "document_max_entries": 10000,  # document embeddings, in their own LRU
+    "path": None,               # SQLite file for the on-disk tier, None = memory only
+}
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by (model name, text hash).
+
+    Tier 1 is in memory: an LRU of `max_entries` query vectors and a
+    separate LRU of `document_max_entries` document vectors, so a large
+    ingest cannot evict the hot queries. Tier 2 is an optional SQLite file,
+    so embeddings survive restarts. Vectors found on disk are promoted into
+    the LRU of the kind that asked for them.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 10000, path: Optional[str] = None,
+                 document_max_entries: int = 10000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = Path(path) if path else None
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._documents: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._limits = {"query": max_entries, "document": document_max_entries}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+
+    def key(self, text: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+
+    def _lru(self, kind: str) -> "OrderedDict[bytes, np.ndarray]":
+        if kind not in self._limits:
+            raise ValueError(f"Unknown embedding kind '{kind}', expected query or document")
+        return self._memory if kind == "query" else self._documents
+
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray], kind: str = "query") -> np.ndarray:
+        """
+        Return embeddings for `texts` in order. Only cache misses are sent
+        to `encode_fn`, in one call, with duplicates collapsed. `kind`
+        (query | document) picks the in-memory LRU new vectors go to.
+        """
+        self._lru(kind)
+        keys = [self.key(text) for text in texts]
+        found = self._lookup(keys, kind)
+        metrics.inc("embedding_cache_lookups", len(keys))
+        metrics.inc("embedding_cache_hits", sum(key in found for key in keys))
+
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            new = dict(zip(missing.keys(), vectors))
+            self._store(new, kind)
+            found.update(new)
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+
+    def _lookup(self, keys: List[bytes], kind: str = "query") -> Dict[bytes, np.ndarray]:
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                for lru in (self._memory, self._documents):
+                    vector = lru.get(key)
+                    if vector is not None:
+                        lru.move_to_end(key)
+                        found[key] = vector
+                        break
+
+            pending = [key for key in dict.fromkeys(keys) if key not in found]
+
+            if pending and self._db is not None:
+                for start in range(0, len(pending), 500):
+                    chunk = pending[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector, kind)
+                        self.disk_hits += 1
+
+            for key in keys:
+                if key in found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+
+        return found
+
+
+    def _store(self, vectors: Dict[bytes, np.ndarray], kind: str = "query"):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector, kind)
+
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in vectors.items()]
+                )
+                self._db.commit()
+
+
+    def _remember(self, key: bytes, vector: np.ndarray, kind: str = "query"):
+        lru = self._lru(kind)
+        lru[key] = vector
+        lru.move_to_end(key)
+        while len(lru) > self._limits[kind]:
+            lru.popitem(last=False)
+
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "document_memory_entries": len(self._documents),
+        }
+
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
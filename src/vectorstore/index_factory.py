@@ -0,0 +1,181 @@
+import faiss
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+from src.utils.config import load_config
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+DEFAULT_INDEX_CONFIG: Dict[str, Any] = {
+    "type": "flat",
+    "dimension": 384,           # all-MiniLM-L6-v2
+    "nlist": 1024,
+    "nprobe": 16,
+    "pq_m": 48,
+    "pq_bits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "min_train_size": 10000,
+    "train_sample_size": 100000,
+    "retrain_growth": 8,
+}
+
+
+def load_index_config(config_path="./configs/vectorstore.yaml") -> Dict[str, Any]:
+    """
+    Read the `index:` section of configs/vectorstore.yaml on top of the
+    defaults. A missing or empty file gives the plain flat index.
+    """
+    return resolve_index_config(load_config(config_path, "index", DEFAULT_INDEX_CONFIG))
+
+
+def resolve_index_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Overlay a (possibly partial) index config on the defaults, e.g.
+    {"type": "hnsw"}, and validate its type.
+    """
+    config = {**DEFAULT_INDEX_CONFIG, **config}
+
+    config["type"] = str(config["type"]).lower()
+    if config["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{config['type']}', expected one of {INDEX_TYPES}")
+
+    return config
+
+
+def requires_training(config: Dict[str, Any]) -> bool:
+    return config["type"] in ("ivf_flat", "ivf_pq")
+
+
+def ivf_nlist(config: Dict[str, Any], n_vectors: int, n_train: int) -> int:
+    """
+    Number of IVF cells for a corpus of `n_vectors`: about 4 * sqrt(N),
+    at most the configured nlist, and small enough that every centroid gets
+    the ~39 training points faiss wants.
+    """
+    return max(1, min(int(config["nlist"]), int(4 * np.sqrt(n_vectors)), n_train // 39))
+
+
+def build_index(config: Dict[str, Any], train_vectors: Optional[np.ndarray] = None, n_vectors: Optional[int] = None):
+    """
+    Create an empty index that accepts our own int64 doc IDs.
+
+    IVF indexes take IDs natively (and support remove_ids); flat and HNSW
+    are wrapped in an IndexIDMap. IVF types are trained on `train_vectors`
+    (a sample of the `n_vectors` they will hold), see ivf_nlist.
+    """
+    dim = int(config["dimension"])
+    index_type = config["type"]
+
+    if index_type == "flat":
+        return faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, int(config["hnsw_m"]))
+        hnsw.hnsw.efConstruction = int(config["ef_construction"])
+        index = faiss.IndexIDMap(hnsw)
+        apply_search_params(index, config)
+        return index
+
+    if train_vectors is None or len(train_vectors) == 0:
+        raise ValueError(f"Index type '{index_type}' needs training vectors")
+
+    nlist = ivf_nlist(config, n_vectors or len(train_vectors), len(train_vectors))
+
+    if index_type == "ivf_flat":
+        index = faiss.index_factory(dim, f"IVF{nlist},Flat")
+    else:
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{int(config['pq_m'])}x{int(config['pq_bits'])}")
+
+    index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    apply_search_params(index, config)
+    return index
+
+
+def index_kind(index) -> str:
+    """
+    Map a loaded index back to its config type name.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+
+    return "flat"
+
+
+def apply_search_params(index, config: Dict[str, Any]):
+    """
+    Set search-time knobs: nprobe for IVF, efSearch for HNSW.
+    Higher values trade latency for recall.
+    """
+    params = faiss.ParameterSpace()
+    kind = index_kind(index)
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        params.set_index_parameter(index, "nprobe", int(config["nprobe"]))
+    elif kind == "hnsw":
+        params.set_index_parameter(index, "efSearch", int(config["ef_search"]))
+
+
+def filtered_search_params(index, config: Dict[str, Any], ids: np.ndarray):
+    """
+    SearchParameters restricting a search to `ids` via an IDSelector.
+
+    A selective filter leaves few candidates in the usual nprobe cells or
+    HNSW beam, so nprobe / efSearch grow with 1 / selectivity (capped);
+    the selector still skips distance computations for everything else.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    selectivity = max(len(ids) / max(index.ntotal, 1), 1e-6)
+    kind = index_kind(index)
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        nprobe = min(nlist, int(np.ceil(int(config["nprobe"]) / selectivity)))
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif kind == "hnsw":
+        ef_search = min(max(index.ntotal, 1), int(np.ceil(int(config["ef_search"]) / selectivity)))
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(ef_search, int(config["ef_search"])))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+
+    # SWIG does not keep the selector alive on its own
+    params.selector_ref = selector
+    return params
+
+
+def extract_vectors(index) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (vectors, ids) for everything stored in the index, so it can be
+    rebuilt without re-embedding. PQ vectors come back approximate.
+    """
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32), np.empty(0, dtype=np.int64)
+
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        return inner.reconstruct_n(0, inner.ntotal), faiss.vector_to_array(index.id_map).copy()
+
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    ids = np.concatenate([
+        faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+        for list_no in range(ivf.nlist) if invlists.list_size(list_no)
+    ])
+
+    # Arbitrary (non-sequential) IDs need the hashtable direct map to reconstruct
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index.reconstruct_batch(ids), ids
+
+
+def sample_vectors(vectors: np.ndarray, sample_size: int, seed: int = 1234) -> np.ndarray:
+    if len(vectors) <= sample_size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
@@ -1,40 +1,90 @@
 import json
 from pathlib import Path
-from src.vectorstore.store import VectorStore
+from src.vectorstore.chunking import DEFAULT_CHUNKING_CONFIG, StatementChunker
+from src.vectorstore.document import Document
+from src.utils.config import load_config
 from src.utils.logger import Logger
 
 
 class JSONIngestor:
 
-    def __init__(self, input_dir="./data/output"):
+    def __init__(self, input_dir="./data/output", chunking_config=None):
         self.input_dir = Path(input_dir)
         self.logger = Logger("JSON_INGESTOR", "./logs/ingest.log").get_logger()
 
+        # Long statements become several chunks (configs/vectorstore.yaml: chunking)
+        config = chunking_config or load_config("./configs/vectorstore.yaml", "chunking", DEFAULT_CHUNKING_CONFIG)
+        config = {**DEFAULT_CHUNKING_CONFIG, **config}
+        self.chunker = None
+        if config["enabled"]:
+            self.chunker = StatementChunker(
+                strategy=config["strategy"],
+                max_tokens=config["max_tokens"],
+                overlap_tokens=config["overlap_tokens"],
+                chars_per_token=config["chars_per_token"],
+                header_fields=config["header_fields"],
+                field_groups=config["field_groups"]
+            )
+
     def load_json_files(self):
-        json_files = list(self.input_dir.glob("*.json"))
+        return [doc.text for doc in self.load_documents()]
+
+    def load_documents(self):
+        """
+        Same as load_json_files, but keeps the source JSON file name on each
+        document so the vectorstore can give it a stable ID.
+        """
+        documents = list(self.iter_documents())
+
+        if not documents:
+            self.logger.warning("No JSON files or OCR dataset found.")
+
+        return documents
 
-        if not json_files:
-            self.logger.warning("No JSON files found.")
-            return []
+    def iter_documents(self):
+        """
+        Yield documents from the Parquet OCR dataset (streamed record batch
+        by record batch) and from per-image *.json files. A JSON file whose
+        image is also in the dataset is skipped: the dataset is newer.
+        """
+        from_dataset = set()
+        dataset_path = self.input_dir / "ocr_dataset"
+
+        if dataset_path.is_dir():
+            from src.ingestion.preprocess.columnar import iter_results
+
+            for data in iter_results(dataset_path):
+                from_dataset.add(data["source_file"])
+                yield from self.to_documents(data, source=data["source_file"])
 
-        documents = []
+            self.logger.info(f"Loaded {len(from_dataset)} statements from {dataset_path}")
 
-        for file in json_files:
+        for file in sorted(self.input_dir.glob("*.json")):
             try:
                 with open(file, "r", encoding="utf-8") as f:
                     data = json.load(f)
 
-                # Convert JSON to a flattened text chunk
-                text_chunk = self.json_to_text(data)
+                if isinstance(data, dict) and data.get("source_file") in from_dataset:
+                    continue
 
-                documents.append(text_chunk)
+                yield from self.to_documents(data, source=file.name)
 
                 self.logger.info(f"Loaded: {file.name}")
 
             except Exception as e:
                 self.logger.error(f"Failed to read {file}: {e}")
 
-        return documents
+    def to_documents(self, data, source):
+        document = self.to_document(data, source)
+        return self.chunker.chunk(document) if self.chunker is not None else [document]
+
+    def to_document(self, data, source):
+        # Convert JSON to a flattened text chunk
+        text_chunk = self.json_to_text(data)
+
+        # Parsed fields go to the metadata index for filtering/aggregates
+        metadata = data if isinstance(data, dict) else {}
+        return Document(text=text_chunk, source=source, metadata=metadata)
 
     def json_to_text(self, data: dict) -> str:
         """
@@ -0,0 +1,279 @@
+import re
+import threading
+import numpy as np
+from pathlib import Path
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.utils.sqlite import connect, table_columns
+
+
+DEFAULT_METADATA_CONFIG = {
+    "enabled": True,
+    "path": None,               # None = <index name>.meta.sqlite next to the FAISS index
+}
+
+# Statement fields extracted by BankStatementOCR (see src/llm/prompt_template.py)
+METADATA_FIELDS = {
+    "bank_name": "text",
+    "account_number": "account",
+    "account_holder_name": "text",
+    "branch_name": "text",
+    "statement_number": "text",
+    "currency": "text",
+    "statement_from_date": "date",
+    "statement_to_date": "date",
+    "statement_date_generated": "date",
+    "opening_balance": "amount",
+    "closing_balance": "amount",
+    "total_debits": "amount",
+    "total_credits": "amount",
+}
+
+DATE_FORMATS = (
+    "%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d", "%Y/%m/%d",
+    "%d-%m-%y", "%d/%m/%y", "%d %b %Y", "%d-%b-%Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y",
+)
+
+AMOUNT_RE = re.compile(r"\d[\d,]*(?:\.\d+)?|\.\d+")
+
+RANGE_OPS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def normalise_date(value) -> Optional[str]:
+    """
+    Parse the date formats the OCR model produces into ISO "YYYY-MM-DD",
+    so dates compare correctly as text. Unparseable values give None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def normalise_amount(value) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).strip()
+    negative = text.startswith("-") or (text.startswith("(") and text.endswith(")"))
+    # First number in the text, so "Rs. 1,250.50" does not pick up the "."
+    number = AMOUNT_RE.search(text)
+    if number is None:
+        return None
+    amount = float(number.group(0).replace(",", ""))
+    return -amount if negative else amount
+
+
+def normalise_value(field: str, value):
+    if value is None or str(value).strip().lower() in ("", "none", "null", "n/a"):
+        return None
+
+    kind = METADATA_FIELDS[field]
+    if kind == "date":
+        return normalise_date(value)
+    if kind == "amount":
+        return normalise_amount(value)
+    if kind == "account":
+        return re.sub(r"\D", "", str(value)) or None
+    return str(value).strip()
+
+
+def metadata_from_text(text: str) -> Dict[str, Any]:
+    """
+    Recover statement fields from the "field name: value" text written by
+    JSONIngestor.json_to_text (used to backfill stores built before the
+    metadata index existed).
+    """
+    fields = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        key = key.strip().lower().replace(" ", "_")
+        if sep and key in METADATA_FIELDS:
+            fields[key] = value.strip()
+    return fields
+
+
+class MetadataIndex:
+    """
+    Typed per-field table of statement metadata, keyed by the FAISS doc IDs.
+
+    Every field in METADATA_FIELDS is its own indexed column (ISO dates,
+    REAL amounts, digits-only account numbers), so filter predicates
+    resolve to a candidate ID set with index lookups instead of a scan.
+    """
+
+    def __init__(self, path="./data/vectorstore/faiss.meta.sqlite", read_only=False):
+        self.path = Path(path)
+        if not read_only:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = connect(self.path, read_only)
+        if read_only:
+            # Schema upgrades wait for a writable open
+            existing = table_columns(self._db, "metadata")
+            self.outdated = not {"id", "statement", *METADATA_FIELDS} <= existing
+            return
+
+        self.outdated = False
+        columns = ", ".join(
+            f"{field} {'REAL' if kind == 'amount' else 'TEXT COLLATE NOCASE'}"
+            for field, kind in METADATA_FIELDS.items()
+        )
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS metadata (id INTEGER PRIMARY KEY, {columns})")
+        for field in METADATA_FIELDS:
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS metadata_{field} ON metadata ({field})")
+
+        # Parent statement of a chunk: its chunks share the statement's fields,
+        # and aggregates must count the statement once
+        if "statement" not in table_columns(self._db, "metadata"):
+            self._db.execute("ALTER TABLE metadata ADD COLUMN statement TEXT")
+        self._db.commit()
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+
+    def add_many(self, docs: Dict[int, Dict[str, Any]]):
+        fields = list(METADATA_FIELDS)
+        rows = [
+            (
+                int(doc_id),
+                *(normalise_value(field, (metadata or {}).get(field)) for field in fields),
+                (metadata or {}).get("statement"),
+            )
+            for doc_id, metadata in docs.items()
+        ]
+        with self._lock:
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO metadata (id, {', '.join(fields)}, statement) "
+                f"VALUES ({', '.join('?' * (len(fields) + 2))})",
+                rows
+            )
+
+
+    def delete_many(self, doc_ids: Iterable[int]):
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                self._db.execute(f"DELETE FROM metadata WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        doc_ids = [int(doc_id) for doc_id in doc_ids]
+        fields = list(METADATA_FIELDS)
+        found = {}
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT id, {', '.join(fields)} FROM metadata WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = dict(zip(fields, row[1:]))
+        return found
+
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        Load the whole table as NumPy columns (one array per field, plus
+        "id" and "statement"). Amounts are float64 with NaN for missing
+        values; text and dates are str arrays with "" for missing values.
+        """
+        fields = list(METADATA_FIELDS)
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, statement, {', '.join(fields)} FROM metadata ORDER BY id").fetchall()
+
+        values = list(zip(*rows)) if rows else [()] * (len(fields) + 2)
+        columns = {
+            "id": np.array(values[0], dtype=np.int64),
+            "statement": np.array(["" if v is None else v for v in values[1]], dtype=str),
+        }
+        for field, column in zip(fields, values[2:]):
+            if METADATA_FIELDS[field] == "amount":
+                columns[field] = np.array([np.nan if v is None else v for v in column], dtype=np.float64)
+            else:
+                columns[field] = np.array(["" if v is None else v for v in column], dtype=str)
+        return columns
+
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+
+    @staticmethod
+    def where_clause(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """
+        Turn filter predicates into a SQL WHERE clause. Supported forms:
+
+            {"bank_name": "HDFC"}                          equality (case-insensitive)
+            {"account_number": ["1234", "5678"]}           any of
+            {"total_credits": {"gte": 1000, "lt": 5000}}   ranges (gt/gte/lt/lte)
+            {"bank_name": {"contains": "hdfc"}}            substring
+            {"period": ["2024-03-01", "2024-03-31"]}       statement period overlaps
+        """
+        clauses, params = [], []
+
+        for field, condition in filters.items():
+            if field == "period":
+                start, end = (normalise_date(value) for value in condition)
+                if start:
+                    clauses.append("COALESCE(statement_to_date, statement_from_date) >= ?")
+                    params.append(start)
+                if end:
+                    clauses.append("COALESCE(statement_from_date, statement_to_date) <= ?")
+                    params.append(end)
+                continue
+
+            if field not in METADATA_FIELDS:
+                raise ValueError(f"Unknown metadata field '{field}', expected one of {list(METADATA_FIELDS)}")
+
+            if isinstance(condition, dict):
+                for op, value in condition.items():
+                    if op == "contains":
+                        clauses.append(f"{field} LIKE ?")
+                        params.append(f"%{value}%")
+                    elif op in RANGE_OPS:
+                        clauses.append(f"{field} {RANGE_OPS[op]} ?")
+                        params.append(normalise_value(field, value))
+                    else:
+                        raise ValueError(f"Unknown filter operator '{op}' for '{field}'")
+            elif isinstance(condition, (list, tuple, set)):
+                values = [normalise_value(field, value) for value in condition]
+                clauses.append(f"{field} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{field} = ?")
+                params.append(normalise_value(field, condition))
+
+        return " AND ".join(clauses) or "1", params
+
+
+    def filter_ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Return the doc IDs matching every predicate in `filters`.
+        """
+        where, params = self.where_clause(filters)
+        with self._lock:
+            rows = self._db.execute(f"SELECT id FROM metadata WHERE {where}", params).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
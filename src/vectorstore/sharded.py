@@ -0,0 +1,486 @@
+import os
+import re
+import zlib
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+
+from src.utils.config import load_config
+from src.utils.logger import Logger
+from src.utils.metrics import metrics
+from src.vectorstore.document import Document
+from src.vectorstore.index_factory import (
+    apply_search_params, filtered_search_params, load_index_config, resolve_index_config
+)
+from src.retriever.bm25 import DEFAULT_LEXICAL_CONFIG
+from src.vectorstore.metadata import DEFAULT_METADATA_CONFIG, metadata_from_text
+from src.vectorstore.store import VectorStore
+
+
+DEFAULT_SHARDING_CONFIG = {
+    "enabled": False,
+    "shards": 4,
+    # source : spread by source file (even sizes)
+    # account: all statements of an account in one shard
+    "key": "source",
+    "path": "./data/vectorstore/shards",
+    "executor": "process",      # process | thread: where shard searches run
+    "workers": 0,               # 0 = one per shard, capped at the CPU count
+}
+
+SHARD_KEYS = ("source", "account")
+
+
+def shard_for(doc: Document, num_shards: int, key: str = "source") -> int:
+    """
+    Shard number of a document. Keyed on the source file (or account),
+    never on the doc ID, which changes with the content: a re-OCR'd
+    statement must land in the shard holding its previous version.
+    """
+    # Chunks follow their statement, so a statement's chunks share one shard
+    value = doc.parent or doc.source or str(doc.doc_id)
+    if key == "account":
+        account = (doc.metadata or metadata_from_text(doc.text)).get("account_number")
+        digits = re.sub(r"\D", "", str(account or ""))
+        if digits:
+            value = digits
+    return zlib.crc32(value.encode("utf-8")) % num_shards
+
+
+# Shard indexes opened by this search worker: path -> (file stamp, index)
+_worker_indexes: Dict[str, Tuple[Tuple[int, int, int], Any]] = {}
+
+
+def _init_worker(threads: int):
+    faiss.omp_set_num_threads(max(1, threads))
+
+
+def _search_shard(index_path: str, index_config: Dict[str, Any], queries: np.ndarray, top_k: int,
+                  ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search one shard's index file (runs in a worker process). The file is
+    memory-mapped, so workers share the page cache instead of each holding
+    a copy, and reopened whenever a save or rebuild has replaced it.
+    """
+    empty = (np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64))
+    if not os.path.exists(index_path):
+        return empty
+
+    stat = os.stat(index_path)
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _worker_indexes.get(index_path)
+    if cached is None or cached[0] != stamp:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        apply_search_params(index, index_config)
+        _worker_indexes[index_path] = cached = (stamp, index)
+    return _search_index(cached[1], index_config, queries, top_k, ids)
+
+
+def _search_index(index, index_config, queries, top_k, ids=None):
+    params = None
+    if ids is not None:
+        if len(ids) == 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        params = filtered_search_params(index, index_config, ids)
+        top_k = min(top_k, len(ids))
+    return index.search(np.ascontiguousarray(queries, dtype=np.float32), top_k, params=params)
+
+
+def merge_hits(shard_results: List[Tuple[np.ndarray, np.ndarray]], top_k: int) -> List[List[Tuple[float, int]]]:
+    """
+    Gather step: per query, the top_k (distance, id) pairs over all shards,
+    closest first. All shards hold vectors from the same model, so L2
+    distances compare directly.
+    """
+    distances = np.concatenate([result[0] for result in shard_results], axis=1)
+    ids = np.concatenate([result[1] for result in shard_results], axis=1)
+
+    merged = []
+    for row_distances, row_ids in zip(distances, ids):
+        valid = row_ids >= 0   # -1 pads shards holding fewer than top_k vectors
+        row_distances, row_ids = row_distances[valid], row_ids[valid]
+        order = np.argsort(row_distances, kind="stable")[:top_k]
+        merged.append([(float(row_distances[pos]), int(row_ids[pos])) for pos in order])
+    return merged
+
+
+class ShardedDocStore:
+    """
+    Read-only view over the shard docstores (what Retriever and the API use).
+    """
+
+    def __init__(self, shards: List[VectorStore]):
+        self.shards = shards
+
+
+    def __len__(self) -> int:
+        return sum(len(shard.docstore) for shard in self.shards)
+
+
+    def __contains__(self, doc_id: int) -> bool:
+        return any(doc_id in shard.docstore for shard in self.shards)
+
+
+    def get(self, doc_id: int) -> Optional[dict]:
+        return self.get_many([doc_id]).get(doc_id)
+
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, dict]:
+        doc_ids = list(doc_ids)
+        found = {}
+        for shard in self.shards:
+            found.update(shard.docstore.get_many([doc_id for doc_id in doc_ids if doc_id not in found]))
+            if len(found) == len(doc_ids):
+                break
+        return found
+
+
+    def sources(self) -> Dict[str, int]:
+        sources = {}
+        for shard in self.shards:
+            sources.update(shard.docstore.sources())
+        return sources
+
+
+    def get_parents(self, sources: Iterable[str]) -> Dict[str, str]:
+        parents = {}
+        for shard in self.shards:
+            parents.update(shard.docstore.get_parents(sources))
+        return parents
+
+
+class ShardedLexicalIndex:
+    """
+    BM25 over all shards: each shard scores with its own statistics and
+    the best scores win. Shards of similar size give similar IDF values.
+    """
+
+    def __init__(self, shards: List[VectorStore]):
+        self.shards = shards
+
+
+    def __len__(self) -> int:
+        return sum(len(shard.lexical_index) for shard in self.shards)
+
+
+    def search(self, query: str, top_k: int = 5, doc_ids=None) -> List[Tuple[int, float]]:
+        hits = []
+        for shard in self.shards:
+            hits.extend(shard.lexical_index.search(query, top_k=top_k, doc_ids=doc_ids))
+        return sorted(hits, key=lambda hit: hit[1], reverse=True)[:top_k]
+
+
+class ShardedMetadataIndex:
+
+    def __init__(self, shards: List[VectorStore]):
+        self.shards = shards
+
+
+    def __len__(self) -> int:
+        return sum(len(shard.metadata_index) for shard in self.shards)
+
+
+    def filter_ids(self, filters: Dict[str, Any]) -> np.ndarray:
+        return np.concatenate([shard.metadata_index.filter_ids(filters) for shard in self.shards])
+
+
+    def get_many(self, doc_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        doc_ids = list(doc_ids)
+        found = {}
+        for shard in self.shards:
+            found.update(shard.metadata_index.get_many(doc_ids))
+        return found
+
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        parts = [shard.metadata_index.columns() for shard in self.shards]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        order = np.argsort(columns["id"], kind="stable")
+        return {name: column[order] for name, column in columns.items()}
+
+
+class ShardedVectorStore:
+    """
+    Documents partitioned over several VectorStores (one directory per
+    shard: FAISS index, docstore, BM25 and metadata files), with the same
+    search / upsert interface as VectorStore.
+
+    Searches embed the queries once, fan out to every shard in parallel
+    (worker processes reading the memory-mapped shard files, or threads)
+    and merge the hits by distance. Writes and rebuilds lock one shard
+    only, so a shard can be rebuilt while the others keep serving.
+    """
+
+    def __init__(
+        self,
+        path="./data/vectorstore/shards",
+        num_shards=4,
+        shard_key="source",
+        executor="process",
+        workers=0,
+        embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+        index_config=None,
+        embedding_cache_config=None,
+        lexical_config=None,
+        metadata_config=None,
+        embedder_load=None,
+        embedder_config=None
+    ):
+        if shard_key not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key '{shard_key}', expected one of {SHARD_KEYS}")
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown shard executor '{executor}', expected process or thread")
+
+        self.path = Path(path)
+        self.num_shards = int(num_shards)
+        self.shard_key = shard_key
+        self.executor = executor
+        self.embedding_model = embedding_model
+        self.index_config = resolve_index_config(index_config) if index_config else load_index_config()
+
+        self.logger = Logger("VECTORSTORE", "./logs/vectorstore.log").get_logger()
+        self.logger.info(f"Opening {self.num_shards} vectorstore shards in {self.path} (key={shard_key})...")
+
+        # BM25 / metadata files always live next to each shard's index
+        lexical_config = {
+            **(lexical_config or load_config("./configs/vectorstore.yaml", "lexical", DEFAULT_LEXICAL_CONFIG)),
+            "path": None,
+        }
+        metadata_config = {
+            **(metadata_config or load_config("./configs/vectorstore.yaml", "metadata", DEFAULT_METADATA_CONFIG)),
+            "path": None,
+        }
+
+        # Shard 0 loads the embedder and embedding cache; the other shards
+        # never load a model and are handed shard 0's embeddings
+        self.shards: List[VectorStore] = []
+        for shard_no in range(self.num_shards):
+            shard_dir = self.path / f"shard_{shard_no:03d}"
+            self.shards.append(VectorStore(
+                index_path=shard_dir / "faiss.index",
+                docstore_path=shard_dir / "docstore.sqlite",
+                embedding_model=embedding_model,
+                index_config=dict(self.index_config),
+                embedding_cache_config=embedding_cache_config if shard_no == 0 else {"enabled": False},
+                lexical_config=lexical_config,
+                metadata_config=metadata_config,
+                mmap_index=executor == "process",
+                embedder_load=embedder_load if shard_no == 0 else "lazy",
+                embedder_config=embedder_config,
+            ))
+        self._locks = [threading.RLock() for _ in self.shards]
+
+        first = self.shards[0]
+        self.embedding_cache = first.embedding_cache
+        self.docstore = ShardedDocStore(self.shards)
+        self.lexical_index = ShardedLexicalIndex(self.shards) if first.lexical_index is not None else None
+        self.metadata_index = ShardedMetadataIndex(self.shards) if first.metadata_index is not None else None
+
+        workers = int(workers) or min(self.num_shards, os.cpu_count() or 1)
+        if executor == "process":
+            # spawn: workers must not inherit this process's FAISS / SQLite / logging threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=((os.cpu_count() or 1) // workers,),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard-search")
+
+        self.logger.info(f"Sharded vectorstore ready: {len(self.docstore)} documents, {workers} {executor} workers.")
+
+
+    @property
+    def embedder(self):
+        return self.shards[0].embedder
+
+
+    @embedder.setter
+    def embedder(self, embedder):
+        self.shards[0].embedder = embedder
+
+
+    @property
+    def version(self) -> int:
+        # Every shard save bumps its version: the sum changes on any write
+        return sum(shard.version for shard in self.shards)
+
+
+    def embed(self, texts: List[str], kind: str = "query") -> np.ndarray:
+        return self.shards[0].embed(texts, kind=kind)
+
+
+    def shard_of(self, doc: Document) -> int:
+        return shard_for(doc, self.num_shards, self.shard_key)
+
+
+    def add_documents(self, docs: List[Union[str, Document]]) -> List[int]:
+        return self.upsert(docs)
+
+
+    def upsert(self, docs: List[Union[str, Document]]) -> List[int]:
+        docs = [doc if isinstance(doc, Document) else Document(text=doc) for doc in docs]
+        groups: Dict[int, List[Document]] = {}
+        for doc in docs:
+            groups.setdefault(self.shard_of(doc), []).append(doc)
+
+        if self.shard_key == "account":
+            # A corrected account number moves the statement: drop the old copy
+            # elsewhere, by statement so every old chunk (or the unchunked
+            # version) goes, whatever the new copy is split into
+            for shard_no, group in groups.items():
+                statements = list({doc.parent or doc.source for doc in group if doc.parent or doc.source})
+                for other_no, other in enumerate(self.shards):
+                    if other_no != shard_no and statements:
+                        with self._locks[other_no]:
+                            other.delete(sources=statements)
+
+        for shard_no, group in sorted(groups.items()):
+            with self._locks[shard_no]:
+                self.shards[shard_no].upsert(group, embed=self.embed)
+
+        return [doc.doc_id for doc in docs]
+
+
+    def delete(self, ids: Optional[Iterable[int]] = None, sources: Optional[Iterable[str]] = None) -> int:
+        ids, sources = list(ids or []), list(sources or [])
+        removed = 0
+        for shard_no, shard in enumerate(self.shards):
+            shard_ids = shard.docstore.existing_ids(ids) if ids else set()
+            shard_sources = [source for source in sources if shard.docstore.ids_for_statement(source)]
+            if shard_ids or shard_sources:
+                with self._locks[shard_no]:
+                    removed += shard.delete(ids=shard_ids, sources=shard_sources)
+        return removed
+
+
+    def sync_documents(self, docs: List[Union[str, Document]]) -> List[int]:
+        doc_ids = self.upsert(docs)
+
+        current = {doc.source for doc in docs if isinstance(doc, Document) and doc.source}
+        gone = [source for source in self.docstore.sources() if source not in current]
+        if current and gone:
+            self.delete(sources=gone)
+
+        return doc_ids
+
+
+    def rebuild_shard(self, shard_no: int):
+        """
+        Rebuild one shard's index (e.g. after a config change). Only that
+        shard is locked; search workers keep reading its old file until the
+        rebuilt one replaces it.
+        """
+        with self._locks[shard_no]:
+            self.logger.info(f"Rebuilding shard {shard_no}...")
+            self.shards[shard_no].rebuild_index()
+
+
+    def rebuild_index(self):
+        for shard_no in range(self.num_shards):
+            self.rebuild_shard(shard_no)
+
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        if nprobe is not None:
+            self.index_config["nprobe"] = nprobe
+        if ef_search is not None:
+            self.index_config["ef_search"] = ef_search
+        for shard in self.shards:
+            shard.set_search_params(nprobe, ef_search)
+
+
+    def filter_ids(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        if self.metadata_index is None:
+            raise ValueError("Metadata filters need the metadata index (configs/vectorstore.yaml: metadata.enabled)")
+        return self.metadata_index.filter_ids(filters)
+
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[dict] = None) -> List[str]:
+        return [hit["text"] for hit in self.search_batch([query], top_k=top_k, filters=filters)[0]]
+
+
+    def search_batch(
+        self, queries: List[str], top_k: int = 5, filters: Optional[dict] = None, ids: Optional[np.ndarray] = None
+    ) -> List[List[dict]]:
+        """
+        Same contract as VectorStore.search_batch: one list of
+        {"id", "distance", "text", "source"} hits per query.
+        """
+        if not queries:
+            return []
+        if ids is None:
+            ids = self.filter_ids(filters)
+
+        query_embeddings = np.ascontiguousarray(self.embed(list(queries)), dtype=np.float32)
+        with metrics.span("sharded_search", shards=self.num_shards, executor=self.executor):
+            futures = [
+                self._pool.submit(self._search_live_shard, shard_no, query_embeddings, top_k, ids)
+                if self.executor == "thread" else
+                self._pool.submit(
+                    _search_shard, str(shard.index_path), self.index_config, query_embeddings, top_k, ids
+                )
+                for shard_no, shard in enumerate(self.shards)
+            ]
+            merged = merge_hits([future.result() for future in futures], top_k)
+
+        docs = self.docstore.get_many({doc_id for hits in merged for _, doc_id in hits})
+        results = []
+        for hits in merged:
+            results.append([
+                {
+                    "id": doc_id, "distance": distance, "text": docs[doc_id]["text"],
+                    "source": docs[doc_id].get("source"), "parent": docs[doc_id].get("parent"),
+                }
+                for distance, doc_id in hits if doc_id in docs
+            ])
+        return results
+
+
+    def _search_live_shard(self, shard_no, query_embeddings, top_k, ids):
+        # Thread executor: search the shard's live index (FAISS releases the GIL)
+        with self._locks[shard_no]:
+            shard = self.shards[shard_no]
+            return _search_index(shard.index, self.index_config, query_embeddings, top_k, ids)
+
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def open_vectorstore(config_path="./configs/vectorstore.yaml", **kwargs):
+    """
+    A ShardedVectorStore when `sharding.enabled` is set in the config, a
+    SnapshotVectorStore when `snapshots.enabled` is, otherwise a single
+    VectorStore built from `kwargs`.
+    """
+    from src.vectorstore.snapshots import DEFAULT_SNAPSHOT_CONFIG, SnapshotVectorStore
+
+    config = load_config(config_path, "sharding", DEFAULT_SHARDING_CONFIG)
+    snapshot_config = load_config(config_path, "snapshots", DEFAULT_SNAPSHOT_CONFIG)
+    if config["enabled"] and snapshot_config["enabled"]:
+        raise ValueError("Enable either sharding or snapshots in the vectorstore config, not both")
+    if not config["enabled"] and not snapshot_config["enabled"]:
+        return VectorStore(**kwargs)
+
+    kwargs.pop("index_path", None)
+    kwargs.pop("docstore_path", None)
+    kwargs.pop("mmap_index", None)
+    if snapshot_config["enabled"]:
+        return SnapshotVectorStore(path=snapshot_config["path"], keep=int(snapshot_config["keep"]), **kwargs)
+    return ShardedVectorStore(
+        path=config["path"],
+        num_shards=int(config["shards"]),
+        shard_key=config["key"],
+        executor=config["executor"],
+        workers=int(config["workers"]),
+        **kwargs
+    )
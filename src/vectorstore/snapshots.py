@@ -0,0 +1,422 @@
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from src.utils.config import load_config
+from src.utils.logger import Logger
+from src.utils.metrics import metrics
+from src.retriever.bm25 import DEFAULT_LEXICAL_CONFIG
+from src.vectorstore.document import Document
+from src.vectorstore.metadata import DEFAULT_METADATA_CONFIG
+from src.vectorstore.store import VectorStore
+
+
+DEFAULT_SNAPSHOT_CONFIG = {
+    "enabled": False,
+    "path": "./data/vectorstore/snapshots",
+    "keep": 2,                  # snapshots kept on disk, the live one included
+}
+
+CURRENT_FILE = "CURRENT"        # names the live snapshot directory
+MANIFEST_FILE = "manifest.json"
+
+
+def snapshot_name(version: int) -> str:
+    return f"v{version:06d}"
+
+
+class _LiveHandle:
+    """
+    Stands in for the live snapshot's docstore / lexical_index /
+    metadata_index: each call runs on the snapshot live at call time,
+    leased so that a swap cannot close it mid-call.
+    """
+
+    def __init__(self, snapshots: "SnapshotVectorStore", name: str):
+        self._snapshots = snapshots
+        self._name = name
+
+
+    def __getattr__(self, attr):
+        value = getattr(getattr(self._snapshots._store, self._name), attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            with self._snapshots._reading() as store:
+                return getattr(getattr(store, self._name), attr)(*args, **kwargs)
+        return call
+
+
+    def __len__(self):
+        with self._snapshots._reading() as store:
+            return len(getattr(store, self._name))
+
+
+    def __contains__(self, item):
+        with self._snapshots._reading() as store:
+            return item in getattr(store, self._name)
+
+
+    def __bool__(self):
+        return True
+
+
+class SnapshotVectorStore:
+    """
+    A VectorStore served from immutable, versioned snapshots.
+
+    Each snapshot is a directory (FAISS index, docstore, BM25 and metadata
+    files, manifest.json) that is never written once live. An update copies
+    the live snapshot, applies the documents to the copy (in a background
+    thread with refresh_async) and then swaps it in: the CURRENT pointer
+    file is replaced atomically and the in-memory store reference is
+    reassigned, so queries run against the old snapshot until the new one
+    is fully built and never see a half-updated state.
+
+    Reads (search, search_batch, docstore, ...) go to the live snapshot's
+    VectorStore, which is opened read-only: rebuilds or backfills it would
+    need (e.g. after an index.type change) are built into a new snapshot.
+    Each read leases the store it runs on; a replaced store is closed once
+    its last reader is done.
+    """
+
+    def __init__(
+        self,
+        path="./data/vectorstore/snapshots",
+        keep=2,
+        embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+        index_config=None,
+        embedding_cache_config=None,
+        lexical_config=None,
+        metadata_config=None,
+        embedder_load=None,
+        embedder_config=None
+    ):
+        self.root = Path(path)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep = max(1, int(keep))
+
+        self.logger = Logger("VECTORSTORE", "./logs/vectorstore.log").get_logger()
+
+        # BM25 / metadata files must live inside each snapshot directory
+        self._store_kwargs = {
+            "embedding_model": embedding_model,
+            "index_config": index_config,
+            "lexical_config": {
+                **(lexical_config or load_config("./configs/vectorstore.yaml", "lexical", DEFAULT_LEXICAL_CONFIG)),
+                "path": None,
+            },
+            "metadata_config": {
+                **(metadata_config or load_config("./configs/vectorstore.yaml", "metadata", DEFAULT_METADATA_CONFIG)),
+                "path": None,
+            },
+            "embedder_config": embedder_config,
+        }
+
+        self._build_lock = threading.Lock()
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-build")
+        # Replaced stores stay open until the queries still using them finish
+        self._readers_lock = threading.Lock()
+        self._readers: Dict[int, int] = {}      # id(store) -> reads in flight
+        self._retired: List[VectorStore] = []
+        self._handles = {name: _LiveHandle(self, name) for name in ("docstore", "lexical_index", "metadata_index")}
+
+        current = self._current_dir()
+        if current is None:
+            current = self.root / snapshot_name(0)
+            # Empty store files, written once before anything reads them
+            self._open(
+                current, mmap_index=False, read_only=False,
+                embedding_cache_config={"enabled": False}, embedder_load="lazy"
+            ).close()
+            self._seal(current)
+            self._write_manifest(current, {"version": 0, "documents": 0, "parent": None})
+            self._point_to(current)
+
+        self.manifest = self._read_manifest(current)
+        self._store = self._open(current, embedding_cache_config=embedding_cache_config, embedder_load=embedder_load)
+        self.logger.info(f"Serving snapshot {current.name} ({len(self._store.docstore)} documents).")
+
+        self.maintenance: Optional[Future] = None
+        pending = self._store.pending_maintenance
+        if "schema" in pending:
+            # The live files predate the current layout and cannot be queried as-is
+            self.logger.info("Live snapshot has an older file layout, migrating it into a new snapshot...")
+            self._build(lambda store: None)
+        elif pending:
+            self.logger.info(f"Building a snapshot with the pending {', '.join(pending)} maintenance...")
+            self.maintenance = self._builder.submit(self._build, lambda store: None)
+
+
+    def __getattr__(self, name):
+        # Only called for attributes not defined here: read through to the live snapshot
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._store, name)
+
+
+    @property
+    def store(self) -> VectorStore:
+        return self._store
+
+
+    @property
+    def docstore(self):
+        return self._handles["docstore"]
+
+
+    @property
+    def lexical_index(self):
+        return self._handles["lexical_index"] if self._store.lexical_index is not None else None
+
+
+    @property
+    def metadata_index(self):
+        return self._handles["metadata_index"] if self._store.metadata_index is not None else None
+
+
+    @contextmanager
+    def _reading(self):
+        with self._readers_lock:
+            store = self._store
+            self._readers[id(store)] = self._readers.get(id(store), 0) + 1
+        try:
+            yield store
+        finally:
+            with self._readers_lock:
+                self._readers[id(store)] -= 1
+                idle = self._readers[id(store)] == 0
+                if idle:
+                    del self._readers[id(store)]
+                retired = idle and any(store is old for old in self._retired)
+                if retired:
+                    self._retired = [old for old in self._retired if old is not store]
+            if retired:
+                store.close()
+
+
+    def search(self, *args, **kwargs):
+        with self._reading() as store:
+            return store.search(*args, **kwargs)
+
+
+    def search_batch(self, *args, **kwargs):
+        with self._reading() as store:
+            return store.search_batch(*args, **kwargs)
+
+
+    def filter_ids(self, *args, **kwargs):
+        with self._reading() as store:
+            return store.filter_ids(*args, **kwargs)
+
+
+    @property
+    def embedder(self):
+        return self._store.embedder
+
+
+    @embedder.setter
+    def embedder(self, embedder):
+        self._store.embedder = embedder
+
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+
+    def _current_dir(self) -> Optional[Path]:
+        pointer = self.root / CURRENT_FILE
+        if not pointer.exists():
+            return None
+        return self.root / pointer.read_text(encoding="utf-8").strip()
+
+
+    def _point_to(self, snapshot_dir: Path):
+        tmp_path = self.root / f"{CURRENT_FILE}.tmp"
+        tmp_path.write_text(snapshot_dir.name, encoding="utf-8")
+        os.replace(tmp_path, self.root / CURRENT_FILE)
+
+
+    @staticmethod
+    def _read_manifest(snapshot_dir: Path) -> Dict[str, Any]:
+        with open(snapshot_dir / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+    @staticmethod
+    def _write_manifest(snapshot_dir: Path, manifest: Dict[str, Any]):
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = snapshot_dir / f"{MANIFEST_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, snapshot_dir / MANIFEST_FILE)
+
+
+    def _open(self, snapshot_dir: Path, mmap_index=True, read_only=True, **kwargs) -> VectorStore:
+        return VectorStore(
+            index_path=snapshot_dir / "faiss.index",
+            docstore_path=snapshot_dir / "docstore.sqlite",
+            mmap_index=mmap_index,
+            read_only=read_only,
+            **self._store_kwargs,
+            **kwargs
+        )
+
+
+    @staticmethod
+    def _copy_snapshot(source: Path, target: Path):
+        target.mkdir(parents=True)
+        for path in source.iterdir():
+            if path.suffix == ".sqlite":
+                # The backup API gives a consistent copy even with a WAL file beside it
+                src, dst = sqlite3.connect(str(path)), sqlite3.connect(str(target / path.name))
+                with dst:
+                    src.backup(dst)
+                src.close()
+                dst.close()
+            elif path.suffix == ".index":
+                shutil.copy2(path, target / path.name)
+
+
+    @staticmethod
+    def _seal(snapshot_dir: Path):
+        """
+        Switch the snapshot's SQLite files from WAL to a rollback journal, so
+        read-only connections to the published files need no -wal / -shm files.
+        """
+        for path in snapshot_dir.glob("*.sqlite"):
+            db = sqlite3.connect(str(path))
+            db.execute("PRAGMA journal_mode=DELETE")
+            db.close()
+
+
+    def refresh(self, docs: List[Union[str, Document]]) -> Dict[str, Any]:
+        """
+        Build a snapshot mirroring `docs` (like VectorStore.sync_documents)
+        and make it live. Returns its manifest.
+        """
+        return self._build(lambda store: store.sync_documents(docs))
+
+
+    def _build(self, apply) -> Dict[str, Any]:
+        """
+        Copy the live snapshot, run `apply(store)` on the copy, swap it in.
+        One build runs at a time.
+        """
+        with self._build_lock, metrics.span("snapshot_build"):
+            try:
+                return self._build_locked(apply)
+            except Exception as e:
+                # Builds mostly run in the background: make sure a failure is seen
+                self.logger.error(f"Snapshot build failed, still serving {snapshot_name(self.version)}: {e}")
+                raise
+
+
+    def _build_locked(self, apply) -> Dict[str, Any]:
+        live_dir = self.root / snapshot_name(self.version)
+        version = self.version + 1
+        build_dir = self.root / f"{snapshot_name(version)}.building"
+        if build_dir.exists():
+            shutil.rmtree(build_dir)   # left over from an interrupted build
+
+        self.logger.info(f"Building snapshot {snapshot_name(version)} from {live_dir.name}...")
+        self._copy_snapshot(live_dir, build_dir)
+
+        # Opened writable: also runs any rebuild / backfill the live snapshot needs
+        builder = self._open(
+            build_dir, mmap_index=False, read_only=False,
+            embedding_cache_config={"enabled": False}, embedder_load="lazy"
+        )
+        builder.share_embedder(self._store)
+        apply(builder)
+        manifest = {
+            "version": version,
+            "parent": self.version,
+            "created": datetime.now().isoformat(),
+            "documents": len(builder.docstore),
+            "index_type": builder.index_config["type"],
+            "embedding_model": builder.embedding_model,
+        }
+        builder.close()
+        self._seal(build_dir)
+
+        self._write_manifest(build_dir, manifest)
+        snapshot_dir = self.root / snapshot_name(version)
+        if snapshot_dir.exists():
+            shutil.rmtree(snapshot_dir)   # renamed but never made live before a crash
+        os.replace(build_dir, snapshot_dir)
+        self._swap(snapshot_dir, manifest)
+        return manifest
+
+
+    def refresh_async(self, docs: List[Union[str, Document]]) -> Future:
+        """
+        refresh() in the background; queries keep using the live snapshot
+        meanwhile. The future resolves to the new manifest.
+        """
+        return self._builder.submit(self.refresh, list(docs))
+
+
+    def _swap(self, snapshot_dir: Path, manifest: Dict[str, Any]):
+        # Opened before the swap, so no query ever waits for it to load
+        store = self._open(snapshot_dir, embedder_load="lazy", embedding_cache_config={"enabled": False})
+        store.share_embedder(self._store)
+
+        self._point_to(snapshot_dir)
+        with self._readers_lock:
+            previous, self._store = self._store, store
+            self.manifest = manifest
+            busy = id(previous) in self._readers
+            if busy:
+                self._retired.append(previous)      # closed by its last reader
+        if not busy:
+            previous.close()
+        self.logger.info(f"Snapshot {snapshot_dir.name} is live ({manifest['documents']} documents).")
+        self._prune()
+
+
+    def _prune(self):
+        snapshots = sorted(path for path in self.root.glob("v*") if path.is_dir() and path.suffix == "")
+        for path in snapshots[:-self.keep]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+    # Writes always go through a new snapshot: the live one is never modified
+    def sync_documents(self, docs: List[Union[str, Document]]) -> List[int]:
+        self.refresh(docs)
+        return [doc.doc_id for doc in docs if isinstance(doc, Document)]
+
+
+    def upsert(self, docs: List[Union[str, Document]]) -> List[int]:
+        doc_ids = []
+        self._build(lambda store: doc_ids.extend(store.upsert(docs)))
+        return doc_ids
+
+
+    def add_documents(self, docs: List[Union[str, Document]]) -> List[int]:
+        return self.upsert(docs)
+
+
+    def delete(self, ids=None, sources=None) -> int:
+        removed = []
+        self._build(lambda store: removed.append(store.delete(ids=ids, sources=sources)))
+        return removed[0]
+
+
+    def rebuild_index(self):
+        self._build(lambda store: store.rebuild_index())
+
+
+    def close(self):
+        self._builder.shutdown(wait=True)
+        for store in self._retired + [self._store]:
+            store.close()
@@ -1,86 +1,666 @@
+import os
 import faiss
 import json
-from typing import List
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Union
 from pathlib import Path
 from src.utils.logger import Logger
-from sentence_transformers import SentenceTransformer
+from src.utils.metrics import metrics
+from src.vectorstore.document import Document
+from src.vectorstore.docstore import DocStore
+from src.retriever.bm25 import DEFAULT_LEXICAL_CONFIG, BM25Index
+from src.vectorstore.embedders import DEFAULT_EMBEDDER_CONFIG, EMBEDDER_BACKENDS, load_embedder
+from src.vectorstore.embedding_cache import DEFAULT_EMBEDDING_CACHE_CONFIG, EmbeddingCache
+from src.vectorstore.metadata import DEFAULT_METADATA_CONFIG, MetadataIndex, metadata_from_text
+from src.vectorstore.index_factory import (
+    apply_search_params, build_index, extract_vectors, filtered_search_params, index_kind,
+    load_index_config, requires_training, resolve_index_config, sample_vectors
+)
+from src.utils.config import load_config
 import numpy as np
 
 
+
 class VectorStore:
 
     def __init__(
         self,
         index_path="./data/vectorstore/faiss.index",
-        docstore_path="./data/vectorstore/docstore.json",
-        embedding_model="sentence-transformers/all-MiniLM-L6-v2"
+        docstore_path="./data/vectorstore/docstore.sqlite",
+        embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+        index_config=None,
+        embedding_cache_config=None,
+        lexical_config=None,
+        metadata_config=None,
+        mmap_index=False,
+        embedder_load=None,
+        embedder_config=None,
+        read_only=False
     ):
 
         self.index_path = Path(index_path)
         self.docstore_path = Path(docstore_path)
+        if self.docstore_path.suffix == ".json":
+            # Older callers point at docstore.json: store next to it as SQLite
+            self.docstore_path = self.docstore_path.with_suffix(".sqlite")
+        # Written by older versions; imported once into the SQLite docstore
+        self.legacy_docstore_path = self.docstore_path.with_suffix(".json")
+
+        # Memory-map the FAISS index for fast startup (read-only until the first write)
+        self.mmap_index = mmap_index
+        self._index_mmapped = False
+        # Never writes its files (a live snapshot): rebuilds / backfills an
+        # open would do are listed in pending_maintenance instead
+        self.read_only = read_only
+        self.pending_maintenance: List[str] = []
         self.embedding_model = embedding_model
+        # flat | ivf_flat | ivf_pq | hnsw, see configs/vectorstore.yaml
+        self.index_config = resolve_index_config(index_config) if index_config else load_index_config()
 
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        self.docstore_path.parent.mkdir(parents=True, exist_ok=True)
+        if not read_only:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            self.docstore_path.parent.mkdir(parents=True, exist_ok=True)
 
         self.logger = Logger("VECTORSTORE", "./logs/vectorstore.log").get_logger()
         self.logger.info("Initializing VectorStore...")
 
-        self.logger.info(f"Loading embedding model: {embedding_model}")
-        self.embedder = SentenceTransformer(embedding_model)
+        # Loading the embedding model (torch for the default backend) dominates
+        # startup: start it first so it overlaps with reading the index, or
+        # defer it entirely. Backend, batching and threads: configs/vectorstore.yaml
+        if embedder_config:
+            self.embedder_config = {**DEFAULT_EMBEDDER_CONFIG, **embedder_config}
+        else:
+            self.embedder_config = load_config("./configs/vectorstore.yaml", "embedder", DEFAULT_EMBEDDER_CONFIG)
+        if self.embedder_config["backend"] not in EMBEDDER_BACKENDS:
+            raise ValueError(
+                f"Unknown embedder backend '{self.embedder_config['backend']}', expected one of {EMBEDDER_BACKENDS}"
+            )
+        embedder_load = embedder_load or self.embedder_config["load"]
+        if embedder_load not in ("eager", "background", "lazy"):
+            raise ValueError(f"Unknown embedder load mode '{embedder_load}', expected eager, background or lazy")
+        self._embedder = None
+        self._embedder_future = None
+        self._embedder_lock = threading.Lock()
+        if embedder_load == "eager":
+            self._embedder = self._load_embedder()
+        elif embedder_load == "background":
+            loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedder-load")
+            self._embedder_future = loader.submit(self._load_embedder)
+            loader.shutdown(wait=False)
+
+        cache_config = embedding_cache_config or load_config(
+            "./configs/vectorstore.yaml", "embedding_cache", DEFAULT_EMBEDDING_CACHE_CONFIG
+        )
+        self.embedding_cache = None
+        if cache_config["enabled"]:
+            # int8 / ONNX vectors differ slightly from the torch ones: keep them apart
+            backend = self.embedder_config["backend"]
+            self.embedding_cache = EmbeddingCache(
+                embedding_model if backend == "torch" else f"{embedding_model}:{backend}",
+                max_entries=int(cache_config["max_entries"]),
+                path=cache_config["path"],
+                document_max_entries=int(cache_config.get("document_max_entries", cache_config["max_entries"]))
+            )
+
+        # BM25 index over the same doc IDs, kept in step with FAISS
+        lexical_config = lexical_config or load_config(
+            "./configs/vectorstore.yaml", "lexical", DEFAULT_LEXICAL_CONFIG
+        )
+        self.lexical_index = None
+        # Enabled indexes a read-only store has no file for yet (built by maintenance)
+        self._missing_indexes: List[str] = []
+        lexical_path = Path(lexical_config["path"] or self.index_path.with_suffix(".bm25.sqlite"))
+        if lexical_config["enabled"] and read_only and not lexical_path.exists():
+            self._missing_indexes.append("lexical")
+        elif lexical_config["enabled"]:
+            self.lexical_index = BM25Index(
+                lexical_path,
+                k1=float(lexical_config["k1"]),
+                b=float(lexical_config["b"]),
+                max_df_ratio=float(lexical_config["max_df_ratio"]),
+                field_weights=lexical_config["field_weights"],
+                read_only=read_only
+            )
+
+        # Structured statement fields for filter predicates (pre-filtering FAISS)
+        metadata_config = metadata_config or load_config(
+            "./configs/vectorstore.yaml", "metadata", DEFAULT_METADATA_CONFIG
+        )
+        self.metadata_index = None
+        metadata_path = Path(metadata_config["path"] or self.index_path.with_suffix(".meta.sqlite"))
+        if metadata_config["enabled"] and read_only and not metadata_path.exists():
+            self._missing_indexes.append("metadata")
+        elif metadata_config["enabled"]:
+            self.metadata_index = MetadataIndex(metadata_path, read_only=read_only)
 
         self.index = None
-        self.docstore = []
+        # Bumped on every persisted change; caches compare it to detect stale data
+        self.version = 0
+        # doc_id -> {"text", "source", "hash"}, opened lazily in _load_store
+        self.docstore: Optional[DocStore] = None
 
         self._load_store()
 
 
+    def _load_embedder(self):
+        backend = self.embedder_config["backend"]
+        self.logger.info(f"Loading embedding model: {self.embedding_model} ({backend})")
+        start = time.perf_counter()
+        embedder = load_embedder(self.embedding_model, self.embedder_config)
+        self.logger.info(f"Embedding model loaded in {time.perf_counter() - start:.2f}s")
+        return embedder
+
+
+    @property
+    def embedder(self):
+        """
+        The SentenceTransformer; waits for the background load, or loads it
+        now in lazy mode.
+        """
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    if self._embedder_future is not None:
+                        self._embedder = self._embedder_future.result()
+                    else:
+                        self._embedder = self._load_embedder()
+        return self._embedder
+
+
+    @embedder.setter
+    def embedder(self, embedder):
+        self._embedder = embedder
+
+
+    def share_embedder(self, other: "VectorStore"):
+        """
+        Use `other`'s embedder (even while it is still loading) and
+        embedding cache instead of loading a second copy.
+        """
+        with other._embedder_lock:
+            self._embedder = other._embedder
+            self._embedder_future = other._embedder_future
+        self.embedding_cache = other.embedding_cache
+
+
+    def embed(self, texts: List[str], kind: str = "query") -> np.ndarray:
+        """
+        `kind` is query or document: the embedding cache keeps each in its
+        own in-memory LRU.
+        """
+        if self.embedding_cache is None:
+            return self._encode(texts)
+        return self.embedding_cache.encode(texts, self._encode, kind=kind)
+
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        metrics.inc("embedded_texts", len(texts))
+        with metrics.span("encode", backend=self.embedder_config["backend"]):
+            return self.embedder.encode(texts, convert_to_numpy=True)
+
+
+    def _new_index(self):
+        # IVF needs training data: start flat and switch once enough vectors exist
+        if requires_training(self.index_config):
+            return build_index({**self.index_config, "type": "flat"})
+        return build_index(self.index_config)
+
+
+    def _maybe_rebuild_index(self):
+        """
+        Rebuild into the configured index type when the live index differs
+        (a flat placeholder that has reached min_train_size, or a config change),
+        or retrain an IVF index the corpus has outgrown.
+        """
+        if not self._needs_rebuild():
+            return False
+
+        self._rebuild()
+        return True
+
+
+    def _needs_rebuild(self) -> bool:
+        if index_kind(self.index) == self.index_config["type"]:
+            return self._outgrown_training()
+        return not (requires_training(self.index_config) and self.index.ntotal < self.index_config["min_train_size"])
+
+
+    def _outgrown_training(self) -> bool:
+        """
+        An IVF index keeps the centroids and nlist it was trained with, so its
+        lists grow with the corpus while nprobe stays fixed: retrain once it
+        holds retrain_growth times the vectors it was trained at.
+        """
+        if not requires_training(self.index_config):
+            return False
+        trained = self.docstore.get_meta("index_trained_size")
+        if trained is None:
+            # Trained before the size was recorded: its nlist needed at least this many
+            trained = faiss.extract_index_ivf(self.index).nlist * 39
+        return self.index.ntotal > float(self.index_config["retrain_growth"]) * max(int(trained), 1)
+
+
+    def rebuild_index(self):
+        self._rebuild()
+        self._save_store()
+
+
+    def _rebuild(self):
+        self._ensure_writable()
+        current = index_kind(self.index)
+        if current == "ivf_pq":
+            self.logger.warning("Rebuilding from an IVF-PQ index: vectors are approximate.")
+
+        vectors, ids = extract_vectors(self.index)
+        self.logger.info(
+            f"Rebuilding {current} index with {len(ids)} vectors as {self.index_config['type']}..."
+        )
+        self.index = self._build_from(vectors, ids)
+
+
+    def _build_from(self, vectors, ids):
+        train = None
+        if requires_training(self.index_config):
+            train = sample_vectors(vectors, int(self.index_config["train_sample_size"]))
+            # Saved with the docstore, for _outgrown_training
+            self.docstore.set_meta("index_trained_size", len(ids))
+
+        index = build_index(self.index_config, train_vectors=train, n_vectors=len(ids))
+        if len(ids):
+            index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+        return index
+
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        if nprobe is not None:
+            self.index_config["nprobe"] = nprobe
+        if ef_search is not None:
+            self.index_config["ef_search"] = ef_search
+        apply_search_params(self.index, self.index_config)
+
+
+    def _read_index(self):
+        if self.mmap_index:
+            self._index_mmapped = True
+            return faiss.read_index(str(self.index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        return faiss.read_index(str(self.index_path))
+
+
+    def _check_read_only(self):
+        if self.read_only:
+            raise RuntimeError(f"Vectorstore {self.index_path.parent} is opened read-only")
+
+
+    def _ensure_writable(self):
+        self._check_read_only()
+        # A memory-mapped index is read-only: load it fully before the first write
+        if self._index_mmapped:
+            self.logger.info("Loading memory-mapped index into RAM for writing...")
+            self.index = faiss.read_index(str(self.index_path))
+            apply_search_params(self.index, self.index_config)
+            self._index_mmapped = False
+
+
     def _load_store(self):
-        if self.index_path.exists() and self.docstore_path.exists():
+        legacy = not self.docstore_path.exists() and self.legacy_docstore_path.exists()
+        has_docstore = self.docstore_path.exists() or legacy
+        if self.read_only and not self.docstore_path.exists():
+            raise FileNotFoundError(f"Read-only vectorstore has no docstore: {self.docstore_path}")
+
+        self.docstore = DocStore(self.docstore_path, read_only=self.read_only)
+
+        if self.index_path.exists() and has_docstore:
             self.logger.info("Loading FAISS index and docstore...")
 
-            self.index = faiss.read_index(str(self.index_path))
+            self.index = self._read_index()
+
+            if legacy:
+                self._import_legacy_docstore()
 
-            with open(self.docstore_path, "r", encoding="utf-8") as f:
-                self.docstore = json.load(f)
+            apply_search_params(self.index, self.index_config)
 
         else:
             self.logger.info("Creating new FAISS index and docstore...")
-            self.index = faiss.IndexFlatL2(384)  # 384 dims for MiniLM
-            self.docstore = []
+            self.index = self._new_index()
+
+        if self.read_only:
+            components = [self.docstore, self.lexical_index, self.metadata_index]
+            self.pending_maintenance = [
+                name for name, pending in (
+                    # Older file layouts: migrated by a writable open
+                    ("schema", any(component is not None and component.outdated for component in components)),
+                    ("index", self._needs_rebuild()),
+                    ("lexical", "lexical" in self._missing_indexes or (
+                        self.lexical_index is not None and len(self.lexical_index) != len(self.docstore))),
+                    ("metadata", "metadata" in self._missing_indexes or (
+                        self.metadata_index is not None and not self.metadata_index.outdated
+                        and len(self.metadata_index) != len(self.docstore))),
+                ) if pending
+            ]
+            if self.pending_maintenance:
+                self.logger.warning(f"Read-only store needs maintenance: {', '.join(self.pending_maintenance)}")
+            return
+
+        rebuilt = self._maybe_rebuild_index()
+        backfilled = self._backfill_lexical_index()
+        backfilled = self._backfill_metadata_index() or backfilled
+        if rebuilt or backfilled:
+            self._save_store()
+
+
+    def _backfill_lexical_index(self):
+        # First run with the lexical index enabled on an existing store
+        if self.lexical_index is None or len(self.lexical_index) == len(self.docstore):
+            return False
+
+        self.logger.info(f"Building BM25 index for {len(self.docstore)} stored documents...")
+        self.lexical_index.delete_many(self.docstore.ids())
+        for batch in self.docstore.iter_texts():
+            self.lexical_index.add_many(batch)
+        return True
+
 
+    def _backfill_metadata_index(self):
+        if self.metadata_index is None or len(self.metadata_index) == len(self.docstore):
+            return False
 
-    def add_documents(self, docs: List[str]):
-        self.logger.info(f"Adding {len(docs)} documents to vectorstore...")
+        self.logger.info(f"Building metadata index for {len(self.docstore)} stored documents...")
+        self.metadata_index.delete_many(self.docstore.ids())
+        for batch in self.docstore.iter_texts():
+            self.metadata_index.add_many({doc_id: metadata_from_text(text) for doc_id, text in batch.items()})
+        return True
 
-        embeddings = self.embedder.encode(docs, convert_to_numpy=True)
 
-        self.index.add(embeddings)
-        self.docstore.extend(docs)
+    def _import_legacy_docstore(self):
+        self.logger.info(f"Importing legacy docstore {self.legacy_docstore_path}...")
 
+        with open(self.legacy_docstore_path, "r", encoding="utf-8") as f:
+            docstore = json.load(f)
+
+        if isinstance(docstore, list):
+            self._migrate_legacy_store(docstore)
+        else:
+            self.docstore.add_many({int(doc_id): doc for doc_id, doc in docstore["documents"].items()})
+            self.docstore.commit()
+
+        self.logger.info(f"Legacy docstore imported: {len(self.docstore)} documents.")
+
+
+    def _migrate_legacy_store(self, texts: List[str]):
+        """
+        The first stores kept a plain list of texts aligned with FAISS row
+        positions. Move the existing vectors into an ID-mapped index
+        (no re-embedding) and drop duplicate rows on the way.
+        """
+        self.logger.info(f"Migrating legacy docstore with {len(texts)} rows to stable IDs...")
+
+        self._ensure_writable()
+        rows = min(len(texts), self.index.ntotal)
+        vectors = self.index.reconstruct_n(0, rows) if rows else None
+        self.index = self._new_index()
+
+        docs, keep_rows = {}, []
+        for row, text in enumerate(texts[:rows]):
+            doc = Document(text=text)
+            if doc.doc_id in docs:
+                continue
+            docs[doc.doc_id] = {"text": text, "source": None, "hash": doc.hash}
+            keep_rows.append(row)
+
+        if keep_rows:
+            self.index.add_with_ids(vectors[keep_rows], np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)))
+        self.docstore.add_many(docs)
+
+        self.logger.info(f"Migration done: kept {len(keep_rows)} of {len(texts)} rows.")
         self._save_store()
 
 
-    def _save_store(self):
-        faiss.write_index(self.index, str(self.index_path))
+    def add_documents(self, docs: List[Union[str, Document]]):
+        """
+        Kept for compatibility: adding is an upsert, so documents the store
+        already holds are never embedded or appended twice.
+        """
+        return self.upsert(docs)
+
+
+    def upsert(self, docs: List[Union[str, Document]], embed=None) -> List[int]:
+        """
+        Add new documents, replace changed ones (same source, new content)
+        and skip those already stored. `embed` overrides self.embed, e.g. a
+        ShardedVectorStore embedding with one model for all its shards.
+        """
+        self._check_read_only()
+        docs = [doc if isinstance(doc, Document) else Document(text=doc) for doc in docs]
+        self.logger.info(f"Upserting {len(docs)} documents into vectorstore...")
+
+        doc_ids = [doc.doc_id for doc in docs]
+        existing = self.docstore.existing_ids(doc_ids)
+
+        new_docs, stale_ids, checked = {}, set(), set()
+        batch_ids = set(doc_ids)
+        for doc, doc_id in zip(docs, doc_ids):
+            if doc_id in existing or doc_id in new_docs:
+                continue
+
+            # Same statement with different content -> replace the old version,
+            # including chunks (or the unchunked document) it no longer has
+            statement = doc.parent or doc.source
+            if statement and statement not in checked:
+                checked.add(statement)
+                stale_ids.update(old_id for old_id in self.docstore.ids_for_statement(statement) if old_id not in batch_ids)
+
+            new_docs[doc_id] = doc
+
+        if stale_ids:
+            self._remove(list(stale_ids))
+
+        if not new_docs:
+            self.logger.info("All documents already present, nothing to embed.")
+            if stale_ids:
+                self._save_store()
+            return doc_ids
+
+        texts = [doc.text for doc in new_docs.values()]
+        embeddings = (embed or self.embed)(texts, kind="document")
+
+        self._ensure_writable()
+        self.index.add_with_ids(
+            np.asarray(embeddings, dtype=np.float32),
+            np.fromiter(new_docs.keys(), dtype=np.int64, count=len(new_docs))
+        )
+
+        self.docstore.add_many({
+            doc_id: {
+                "text": doc.text, "source": doc.source, "hash": doc.hash,
+                "parent": doc.parent, "parent_text": doc.parent_text,
+            }
+            for doc_id, doc in new_docs.items()
+        })
+        if self.lexical_index is not None:
+            self.lexical_index.add_many({doc_id: doc.text for doc_id, doc in new_docs.items()})
+        if self.metadata_index is not None:
+            self.metadata_index.add_many({
+                doc_id: {**(doc.metadata or metadata_from_text(doc.text)), "statement": doc.parent}
+                for doc_id, doc in new_docs.items()
+            })
+
+        self._maybe_rebuild_index()
+
+        self.logger.info(
+            f"Embedded {len(new_docs)} new documents, replaced {len(stale_ids)}, "
+            f"skipped {len(docs) - len(new_docs)} already stored."
+        )
+        self._save_store()
+        return doc_ids
+
+
+    def delete(self, ids: Optional[Iterable[int]] = None, sources: Optional[Iterable[str]] = None) -> int:
+        """
+        Delete by doc ID and/or source. A chunked statement's source removes
+        all of its chunks.
+        """
+        doc_ids = set(ids or [])
+        for source in sources or []:
+            doc_ids.update(self.docstore.ids_for_statement(source))
+
+        removed = self._remove(doc_ids)
+        if removed:
+            self._save_store()
+        self.logger.info(f"Deleted {removed} documents from vectorstore.")
+        return removed
 
-        with open(self.docstore_path, "w", encoding="utf-8") as f:
-            json.dump(self.docstore, f, indent=4, ensure_ascii=False)
 
+    def sync_documents(self, docs: List[Union[str, Document]]) -> List[int]:
+        """
+        Make the store mirror `docs`: upsert them and delete documents whose
+        source file is no longer part of the corpus.
+        """
+        doc_ids = self.upsert(docs)
+
+        current = {doc.source for doc in docs if isinstance(doc, Document) and doc.source}
+        gone = [source for source in self.docstore.sources() if source not in current]
+
+        # Plain-text batches carry no sources; never treat them as "everything was deleted"
+        if current and gone:
+            self.delete(sources=gone)
+
+        return doc_ids
+
+
+    def _remove(self, doc_ids: Iterable[int]) -> int:
+        doc_ids = list(self.docstore.existing_ids(doc_ids))
+        if not doc_ids:
+            return 0
+
+        self._ensure_writable()
+        remove = np.array(doc_ids, dtype=np.int64)
+        try:
+            self.index.remove_ids(remove)
+        except RuntimeError:
+            # HNSW graphs cannot drop nodes: rebuild from the remaining vectors
+            self.logger.info(f"{index_kind(self.index)} index has no remove_ids, rebuilding...")
+            vectors, ids = extract_vectors(self.index)
+            keep = ~np.isin(ids, remove)
+            self.index = self._build_from(vectors[keep], ids[keep])
+
+        self.docstore.delete_many(doc_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete_many(doc_ids)
+        if self.metadata_index is not None:
+            self.metadata_index.delete_many(doc_ids)
+        return len(doc_ids)
+
+
+    def _save_store(self):
+        with metrics.span("save_store"):
+            # Written aside and renamed: readers that reopen the file (shard
+            # search workers) never see a half-written index
+            tmp_path = self.index_path.with_suffix(".index.tmp")
+            faiss.write_index(self.index, str(tmp_path))
+            os.replace(tmp_path, self.index_path)
+            # Only the rows touched since the last save are written
+            self.docstore.commit()
+            if self.lexical_index is not None:
+                self.lexical_index.commit()
+            if self.metadata_index is not None:
+                self.metadata_index.commit()
+
+        self.version += 1
         self.logger.info("Vectorstore saved.")
 
 
-    def search(self, query: str, top_k: int = 5) -> List[str]:
-        self.logger.info(f"Searching for: {query}")
+    def filter_ids(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        """
+        Resolve metadata filter predicates (see MetadataIndex.where_clause)
+        to candidate doc IDs. No filters gives None, meaning "everything".
+        """
+        if not filters:
+            return None
+        if self.metadata_index is None:
+            raise ValueError("Metadata filters need the metadata index (configs/vectorstore.yaml: metadata.enabled)")
+
+        ids = self.metadata_index.filter_ids(filters)
+        self.logger.debug(f"Filters {filters} matched {len(ids)} of {self.index.ntotal} documents")
+        return ids
+
+
+    def search(self, query: str, top_k: int = 5, filters: Optional[dict] = None) -> List[str]:
+        self.logger.debug(f"Searching for: {query}")
 
-        query_embedding = self.embedder.encode([query], convert_to_numpy=True)
+        query_embedding = self.embed([query])
 
-        distances, indices = self.index.search(query_embedding, top_k)
+        hits = self._search_vectors(query_embedding, top_k, ids=self.filter_ids(filters))[0]
+        results = [hit["text"] for hit in hits]
+
+        self.logger.debug(f"Found {len(results)} matching chunks")
+        return results
+
+
+    def search_batch(
+        self, queries: List[str], top_k: int = 5, filters: Optional[dict] = None, ids: Optional[np.ndarray] = None
+    ) -> List[List[dict]]:
+        """
+        Embed all queries in one encode call and run a single FAISS search
+        over the whole matrix. Returns one hit list per query, each hit as
+        {"id", "distance", "text", "source"} (L2 distance, lower is closer).
+        `filters` (or already resolved candidate `ids`) restrict the search.
+        """
+        self.logger.debug(f"Batch searching {len(queries)} queries")
+
+        if not queries:
+            return []
+
+        if ids is None:
+            ids = self.filter_ids(filters)
+
+        query_embeddings = self.embed(list(queries))
+        return self._search_vectors(query_embeddings, top_k, ids=ids)
+
+
+    def _search_vectors(self, query_embeddings, top_k: int, ids: Optional[np.ndarray] = None) -> List[List[dict]]:
+        params = None
+        if ids is not None:
+            if len(ids) == 0:
+                return [[] for _ in range(len(query_embeddings))]
+            # Pre-filter: FAISS only considers vectors whose ID is in the candidate set
+            params = filtered_search_params(self.index, self.index_config, ids)
+            top_k = min(top_k, len(ids))
+
+        with metrics.span("index_search", index=index_kind(self.index)):
+            distances, indices = self.index.search(
+                np.ascontiguousarray(query_embeddings, dtype=np.float32), top_k, params=params
+            )
+        metrics.inc("index_queries", len(query_embeddings))
+
+        # One docstore read for just the top-k texts of every query
+        docs = self.docstore.get_many(indices.ravel().tolist())
 
         results = []
-        for idx in indices[0]:
-            if idx < len(self.docstore):
-                results.append(self.docstore[idx])
+        for row_distances, row_ids in zip(distances, indices):
+            hits = []
+            for distance, doc_id in zip(row_distances, row_ids):
+                # -1 pads rows when the index holds fewer than top_k vectors
+                doc = docs.get(int(doc_id))
+                if doc is None:
+                    continue
+                hits.append({
+                    "id": int(doc_id),
+                    "distance": float(distance),
+                    "text": doc["text"],
+                    "source": doc.get("source"),
+                    "parent": doc.get("parent"),
+                })
+            results.append(hits)
 
-        self.logger.info(f"Found {len(results)} matching chunks")
         return results
+
+
+    def close(self):
+        # The embedding cache is left open: it may be shared (see share_embedder)
+        self.docstore.close()
+        if self.lexical_index is not None:
+            self.lexical_index.close()
+        if self.metadata_index is not None:
+            self.metadata_index.close()
@@ -0,0 +1,309 @@
+import base64
+import json
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("ollama")
+
+from benchmarks.fake_ollama import start_fake_ollama, stop_fake_ollama
+from src.ingestion.preprocess.ocr import BankStatementOCR
+
+
+@pytest.fixture
+def stub_ollama():
+    """
+    Answers every image with a statement JSON wrapped in chatter; see
+    server.flaky / server.garbled for failure modes.
+    """
+    server = start_fake_ollama(
+        ocr_latency_ms=20, llm_latency_ms=0,
+        ocr_response='Sure! {"bank_name": "HDFC", "closing_balance": 100.5}'
+    )
+    yield server
+    stop_fake_ollama(server)
+
+
+def make_images(directory, count):
+    directory.mkdir(parents=True, exist_ok=True)
+    for i in range(count):
+        (directory / f"stmt_{i:03d}.png").write_bytes(b"\x89PNG fake image %d" % i)
+
+
+def test_concurrent_ocr_keeps_order_and_bounds_in_flight(tmp_path, stub_ollama):
+    make_images(tmp_path / "images", 12)
+    host = f"http://127.0.0.1:{stub_ollama.server_address[1]}"
+
+    ocr = BankStatementOCR(
+        input_dir=tmp_path / "images",
+        output_dir=tmp_path / "output",
+        model="stub",
+        max_workers=3,
+        host=host,
+        preprocess=False,
+    )
+    results = ocr.process_all_images()
+
+    assert [r["source_file"] for r in results] == [f"stmt_{i:03d}.png" for i in range(12)]
+    assert len(list((tmp_path / "output").glob("*_parsed.json"))) == 12
+    assert 1 <= stub_ollama.max_in_flight <= 3
+
+
+def test_ocr_retries_failed_requests(tmp_path, stub_ollama):
+    make_images(tmp_path / "images", 2)
+    host = f"http://127.0.0.1:{stub_ollama.server_address[1]}"
+
+    ocr = BankStatementOCR(
+        input_dir=tmp_path / "images",
+        output_dir=tmp_path / "output",
+        model="stub",
+        max_workers=2,
+        retry_backoff=0.01,
+        host=host,
+        preprocess=False,
+    )
+    # ollama sends images base64-encoded; mark the first one as flaky
+    first = (tmp_path / "images" / "stmt_000.png").read_bytes()
+    stub_ollama.flaky.add(base64.b64encode(first).decode())
+
+    results = ocr.process_all_images()
+
+    assert len(results) == 2
+    assert stub_ollama.calls == 3
+
+
+def test_extract_json_and_schema_coercion():
+    from src.ingestion.preprocess.ocr_schema import OCR_FIELDS, coerce_result, extract_json
+
+    chatty = 'Here you go {not json} and the data:\n```json\n{"bank_name": "A {B}", "extra": {"x": 1},}\n```\nDone.'
+    assert extract_json(chatty) == {"bank_name": "A {B}", "extra": {"x": 1}}
+    assert extract_json('Result: {"a": "quote \\" }"} trailing }') == {"a": 'quote " }'}
+    assert extract_json("no json here") is None
+
+    result, problems = coerce_result({
+        "account_number": "XX-1234 5678", "closing_balance": "Rs. 1,250.50",
+        "total_debits": "unknown", "currency": "N/A", "statement_number": 42, "note": "kept",
+    })
+    assert set(OCR_FIELDS) <= set(result)
+    assert result["account_number"] == "12345678"
+    assert result["closing_balance"] == 1250.5
+    assert result["total_debits"] is None and result["currency"] is None
+    assert result["statement_number"] == "42" and result["note"] == "kept"
+    assert problems == ["total_debits: 'unknown' is not a number"]
+
+
+def test_unparseable_response_is_retried_with_json_format(tmp_path, stub_ollama):
+    make_images(tmp_path / "images", 3)
+
+    ocr = BankStatementOCR(
+        input_dir=tmp_path / "images",
+        output_dir=tmp_path / "output",
+        model="stub",
+        max_workers=2,
+        host=f"http://127.0.0.1:{stub_ollama.server_address[1]}",
+        preprocess=False,
+    )
+    second = (tmp_path / "images" / "stmt_001.png").read_bytes()
+    stub_ollama.garbled.add(base64.b64encode(second).decode())
+
+    results = ocr.process_all_images()
+
+    # Retried result lands back in its original position
+    assert [r["source_file"] for r in results] == ["stmt_000.png", "stmt_001.png", "stmt_002.png"]
+    assert results[1]["closing_balance"] == 100.5 and results[1]["total_debits"] is None
+    assert stub_ollama.calls == 4
+    assert stub_ollama.formats[-1]["properties"]["closing_balance"]["type"] == ["number", "null"]
+
+
+def test_ocr_cache_only_plans_new_or_changed_images(tmp_path):
+    from src.ingestion.preprocess.cache import OCRCache
+
+    images, output = tmp_path / "images", tmp_path / "output"
+    make_images(images, 3)
+    output.mkdir()
+    manifest = tmp_path / "cache" / "manifest.json"
+
+    cache = OCRCache(manifest_path=manifest, model="stub")
+    image_files = sorted(images.glob("*.png"))
+    assert cache.plan(image_files, output) == image_files
+
+    for image_file in image_files:
+        out = output / f"{image_file.stem}_parsed.json"
+        out.write_text(json.dumps({"source_file": image_file.name}))
+        cache.record(image_file, out)
+    cache.save()
+
+    # Unchanged corpus -> nothing to do
+    cache = OCRCache(manifest_path=manifest, model="stub")
+    assert cache.plan(image_files, output) == []
+
+    # Changed content, new model, and a deleted image
+    image_files[0].write_bytes(b"changed")
+    assert cache.plan(image_files, output) == [image_files[0]]
+    assert OCRCache(manifest_path=manifest, model="other").plan(image_files, output) == image_files
+    # Turning on (or retuning) image preprocessing changes the OCR input
+    preprocessed = OCRCache(manifest_path=manifest, model="stub", preprocess={"max_side": 1600})
+    assert preprocessed.plan(image_files[1:], output) == image_files[1:]
+
+    image_files[2].unlink()
+    assert cache.prune(image_files[:2], output) == 1
+    assert not (output / "stmt_002_parsed.json").exists()
+
+
+def test_ocr_cache_reuses_result_for_duplicate_content(tmp_path):
+    from src.ingestion.preprocess.cache import OCRCache
+
+    images, output = tmp_path / "images", tmp_path / "output"
+    make_images(images, 1)
+    output.mkdir()
+    original = images / "stmt_000.png"
+    duplicate = images / "copy.png"
+    duplicate.write_bytes(original.read_bytes())
+
+    cache = OCRCache(manifest_path=tmp_path / "manifest.json", model="stub")
+    out = output / "stmt_000_parsed.json"
+    out.write_text(json.dumps({"bank_name": "HDFC", "source_file": original.name}))
+    cache.record(original, out)
+
+    assert cache.plan([duplicate, original], output) == []
+    reused = json.loads((output / "copy_parsed.json").read_text())
+    assert reused == {"bank_name": "HDFC", "source_file": "copy.png"}
+
+
+def test_parquet_output_keeps_latest_row_per_image(tmp_path, stub_ollama):
+    pytest.importorskip("pyarrow")
+    from src.ingestion.preprocess.cache import OCRCache
+    from src.ingestion.preprocess.columnar import iter_results
+
+    make_images(tmp_path / "images", 3)
+    host = f"http://127.0.0.1:{stub_ollama.server_address[1]}"
+    ocr = BankStatementOCR(
+        input_dir=tmp_path / "images",
+        output_dir=tmp_path / "output",
+        model="stub",
+        host=host,
+        output_format="parquet",
+        preprocess=False,
+    )
+    image_files = ocr.list_images()
+    cache = OCRCache(manifest_path=tmp_path / "manifest.json", model="stub")
+
+    ocr.process_all_images()
+    # Re-OCR one image: the newer row wins
+    ocr.process_all_images(image_files=image_files[:1])
+    for image_file in image_files:
+        cache.record(image_file, ocr.output_path_for(image_file))
+
+    assert not list((tmp_path / "output").glob("*.json"))
+    results = list(iter_results(ocr.output_path_for(image_files[0])))
+    assert sorted(r["source_file"] for r in results) == ["stmt_000.png", "stmt_001.png", "stmt_002.png"]
+    assert results[0]["closing_balance"] == 100.5 and results[0]["total_credits"] is None
+
+    # Deleted images become tombstones
+    assert cache.prune(image_files[1:], tmp_path / "output") == 1
+    results = list(iter_results(ocr.output_path_for(image_files[0])))
+    assert sorted(r["source_file"] for r in results) == ["stmt_001.png", "stmt_002.png"]
+
+
+def test_parquet_output_is_adopted_and_reused_by_the_ocr_cache(tmp_path, stub_ollama):
+    pytest.importorskip("pyarrow")
+    from src.ingestion.preprocess.cache import OCRCache
+    from src.ingestion.preprocess.columnar import iter_results
+
+    make_images(tmp_path / "images", 2)
+    ocr = BankStatementOCR(
+        input_dir=tmp_path / "images", output_dir=tmp_path / "output", model="stub",
+        host=stub_ollama.url, output_format="parquet", preprocess=False,
+    )
+    ocr.process_all_images()
+    image_files = ocr.list_images()
+
+    # Rows written before the manifest existed are adopted, not re-OCR'd
+    cache = OCRCache(manifest_path=tmp_path / "manifest.json", model="stub")
+    assert cache.plan(image_files, ocr.output_dir, ocr.output_path_for) == []
+    assert set(cache.entries) == {"stmt_000.png", "stmt_001.png"}
+
+    # Same content under a new name: the row is copied with the new source_file
+    duplicate = tmp_path / "images" / "copy.png"
+    duplicate.write_bytes(image_files[0].read_bytes())
+    assert cache.plan(ocr.list_images(), ocr.output_dir, ocr.output_path_for) == []
+    assert stub_ollama.calls == 2
+    results = {r["source_file"]: r for r in iter_results(ocr.output_path_for(duplicate))}
+    assert sorted(results) == ["copy.png", "stmt_000.png", "stmt_001.png"]
+    assert results["copy.png"]["bank_name"] == "HDFC" and results["copy.png"]["closing_balance"] == 100.5
+
+
+def test_preprocessing_shrinks_crops_and_splits_pages(tmp_path, stub_ollama):
+    Image = pytest.importorskip("PIL.Image")
+    ImageDraw = pytest.importorskip("PIL.ImageDraw")
+    from src.ingestion.preprocess.image_prep import DEFAULT_PREPROCESS_CONFIG, ImagePreprocessor
+
+    images = tmp_path / "images"
+    images.mkdir()
+
+    # A large colour scan with wide blank margins and slightly rotated text lines
+    page = Image.new("RGB", (3000, 4000), "white")
+    draw = ImageDraw.Draw(page)
+    for y in range(1200, 2800, 80):
+        draw.rectangle((800, y, 2200, y + 20), fill=(20, 20, 120))
+    page.rotate(3, fillcolor="white").save(images / "scan.png")
+    page.save(images / "multi.tiff", save_all=True, append_images=[page.copy()])
+
+    config = {**DEFAULT_PREPROCESS_CONFIG, "output_dir": str(tmp_path / "prepared"), "workers": 2}
+    preprocessor = ImagePreprocessor(config)
+    prepared = dict(preprocessor.iter_prepared(sorted(images.iterdir())))
+
+    assert [Path(p).name for p in prepared[images / "multi.tiff"]] == ["multi.tiff_p1.png", "multi.tiff_p2.png"]
+    scan = Image.open(prepared[images / "scan.png"][0])
+    assert scan.mode == "L" and max(scan.size) <= 1600
+    # Margins cropped away: only the text block (plus padding) is left
+    assert scan.size[0] < 800 and scan.size[1] < 1000
+    assert preprocessor.summary()["pixel_ratio"] < 0.05
+
+    # Prepared pages are sent to the model, then deleted
+    ocr = BankStatementOCR(
+        input_dir=images,
+        output_dir=tmp_path / "output",
+        model="stub",
+        host=f"http://127.0.0.1:{stub_ollama.server_address[1]}",
+        preprocess=False,
+    )
+    ocr.preprocessor = ImagePreprocessor(config)
+    results = ocr.process_all_images()
+
+    assert sorted(r["source_file"] for r in results) == ["multi.tiff", "scan.png"]
+    assert not list((tmp_path / "prepared").glob("*.png"))
+
+
+def test_stream_zip_ocr_skips_members_already_done(tmp_path, stub_ollama):
+    import zipfile
+    from src.ingestion.loaders.image_loader import KaggleLoader
+    from src.ingestion.preprocess.cache import OCRCache
+
+    raw, output = tmp_path / "raw", tmp_path / "output"
+    raw.mkdir()
+    with zipfile.ZipFile(raw / "statements.zip", "w") as zip_ref:
+        for i in range(4):
+            zip_ref.writestr(f"images/stmt_{i:03d}.png", b"\x89PNG fake image %d" % i)
+        zip_ref.writestr("images/README.txt", b"not an image")
+
+    loader = KaggleLoader(download_path=raw)
+    ocr = BankStatementOCR(
+        output_dir=output,
+        model="stub",
+        max_workers=2,
+        host=f"http://127.0.0.1:{stub_ollama.server_address[1]}",
+        preprocess=False,
+    )
+    cache = OCRCache(manifest_path=tmp_path / "manifest.json", model="stub")
+
+    results = ocr.process_stream(loader.iter_images())
+    assert [r["source_file"] for r in results] == [f"stmt_{i:03d}.png" for i in range(4)]
+    assert len(list(output.glob("*_parsed.json"))) == 4
+
+    for name, data in loader.iter_images():
+        cache.member_fingerprint(name, data)
+        cache.record(Path(name), ocr.output_path_for(Path(name)))
+
+    # Second pass: every member is skipped from the zip directory alone
+    assert list(loader.iter_images(skip=lambda info: cache.is_member_current(info, output))) == []
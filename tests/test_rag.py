@@ -0,0 +1,971 @@
+import json
+import asyncio
+import threading
+import zlib
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from benchmarks.fake_ollama import start_fake_ollama, stop_fake_ollama
+from src.pipeline.response_cache import ResponseCache
+from src.vectorstore.embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text)] * self.dim for text in texts], dtype=np.float32)
+
+
+class SeededEncoder:
+    """
+    Deterministic 384-d stand-in for the SentenceTransformer; records the
+    texts it was asked to encode.
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.encoded.extend(texts)
+        return np.stack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).normal(size=384) for text in texts
+        ]).astype(np.float32)
+
+
+def make_store(tmp_path, name="store", **kwargs):
+    from src.vectorstore.store import VectorStore
+
+    store = VectorStore(
+        index_path=tmp_path / f"{name}.index", docstore_path=tmp_path / f"{name}.sqlite",
+        embedding_cache_config={"enabled": False}, embedder_load="lazy", **kwargs
+    )
+    store.embedder = SeededEncoder()
+    return store
+
+
+def test_embedding_cache_only_encodes_misses(tmp_path):
+    encoder = CountingEncoder()
+    cache = EmbeddingCache("mini", max_entries=2, path=tmp_path / "emb.sqlite")
+
+    first = cache.encode(["a", "bb", "a"], encoder)
+    assert first.shape == (3, 4)
+    assert encoder.calls == [["a", "bb"]]
+
+    cache.encode(["bb", "ccc"], encoder)
+    assert encoder.calls[-1] == ["ccc"]
+    assert cache.stats()["memory_entries"] == 2
+
+    # "a" was evicted from the LRU but is still on disk
+    cache.encode(["a"], encoder)
+    assert len(encoder.calls) == 2
+    assert cache.stats()["disk_hits"] == 1
+
+    # Another model never shares entries
+    EmbeddingCache("other", path=tmp_path / "emb.sqlite").encode(["a"], encoder)
+    assert encoder.calls[-1] == ["a"]
+
+
+def test_embedding_cache_ingest_does_not_evict_queries():
+    encoder = CountingEncoder()
+    cache = EmbeddingCache("mini", max_entries=2, document_max_entries=3)
+
+    cache.encode(["q1", "q2"], encoder)
+    cache.encode([f"doc {i}" for i in range(10)], encoder, kind="document")
+    assert cache.stats()["memory_entries"] == 2 and cache.stats()["document_memory_entries"] == 3
+
+    # Hot queries are still served from memory; recent documents are too
+    calls = len(encoder.calls)
+    cache.encode(["q1", "q2", "doc 9"], encoder)
+    assert len(encoder.calls) == calls
+
+
+def test_response_cache_matches_similar_queries_and_invalidates_on_store_change():
+    cache = ResponseCache(similarity_threshold=0.9, ttl_seconds=60)
+    query = np.array([1.0, 0.0, 0.0])
+
+    assert cache.get("closing balance?", query, store_version=1) is None
+    cache.put("closing balance?", query, "1000", store_version=1)
+
+    assert cache.get("what is the closing balance?", np.array([0.99, 0.05, 0.0]), store_version=1) == "1000"
+    assert cache.get("closing balance?", np.array([0.0, 1.0, 0.0]), store_version=1) is None
+
+    # New documents were ingested -> cached answers are stale
+    assert cache.get("closing balance?", query, store_version=2) is None
+    assert cache.stats() == {
+        "hits": 1, "misses": 3, "hit_rate": 0.25, "invalidations": 1, "entries": 0
+    }
+
+
+def test_response_cache_requires_the_same_accounts_amounts_and_periods():
+    cache = ResponseCache(similarity_threshold=0.9, ttl_seconds=60)
+    embedding = np.array([1.0, 0.0, 0.0])
+    cache.put("Closing balance of account 1234-5678 in March 2024?", embedding, "1000", store_version=1)
+
+    # Near-identical embeddings, but another account / month is another answer
+    assert cache.get("Closing balance of account 1234-5679 in March 2024?", embedding, store_version=1) is None
+    assert cache.get("Closing balance of account 1234-5678 in April 2024?", embedding, store_version=1) is None
+    assert cache.get("closing balance for account 12345678, mar 2024", embedding, store_version=1) == "1000"
+
+
+def test_async_cache_hit_skips_retrieval():
+    from src.pipeline.rag_pipeline import RAGPipeline
+
+    class FakeStore:
+        version = 1
+        metadata_index = None
+
+        def embed(self, texts):
+            return np.ones((len(texts), 3), dtype=np.float32)
+
+    class CountingRetriever:
+        vectorstore = FakeStore()
+        calls = 0
+
+        def retrieve_batch(self, queries, top_k=None, filters=None):
+            self.calls += 1
+            return [[] for _ in queries]
+
+    retriever = CountingRetriever()
+    pipeline = RAGPipeline(retriever, response_cache=ResponseCache(similarity_threshold=0.9))
+    pipeline.response_cache.put("closing balance?", np.ones(3), "1000", store_version=1)
+
+    assert asyncio.run(pipeline.aquery("closing balance?")) == "1000"
+    assert retriever.calls == 0
+    asyncio.run(pipeline.aquery("opening balance in 2023?"))
+    assert retriever.calls == 1
+
+
+def test_response_cache_expires_entries():
+    cache = ResponseCache(similarity_threshold=0.9, ttl_seconds=0)
+    cache.put("q", np.array([1.0, 0.0]), "answer", store_version=1)
+    cache._entries[0]["created"] -= 1
+
+    assert cache.get("q", np.array([1.0, 0.0]), store_version=1) is None
+
+
+@pytest.fixture
+def streaming_ollama():
+    # One NDJSON chunk per word, 10 ms apart
+    server = start_fake_ollama(llm_latency_ms=0, token_delay_ms=10, llm_response="The closing balance is 1000.")
+    yield server.url, server
+    stop_fake_ollama(server)
+
+
+def test_generate_stream_yields_tokens_and_reports_ttft(streaming_ollama):
+    pytest.importorskip("ollama")
+    from src.llm.model import LLMModel
+
+    host, server = streaming_ollama
+    llm = LLMModel("stub", host=host)
+
+    stats = {}
+    tokens = list(llm.generate_stream("question", stats=stats))
+
+    assert "".join(tokens) == "The closing balance is 1000."
+    assert server.bodies[0]["stream"] is True
+    assert stats["ttft_s"] is not None
+    assert stats["ttft_s"] <= stats["total_s"]
+    assert stats["cancelled"] is False
+
+
+def test_generate_stream_can_be_cancelled(streaming_ollama):
+    pytest.importorskip("ollama")
+    from src.llm.model import LLMModel
+
+    host, _ = streaming_ollama
+    llm = LLMModel("stub", host=host)
+    cancel = threading.Event()
+
+    tokens, stats, other_stats = [], {}, {}
+    other = llm.generate_stream("question", stats=other_stats)
+    for token in llm.generate_stream("question", cancel_event=cancel, stats=stats):
+        tokens.append(token)
+        cancel.set()
+        # A second stream on the same model keeps its own stats
+        list(other)
+
+    assert tokens == ["The "]
+    assert stats["cancelled"] is True
+    assert other_stats["cancelled"] is False and other_stats["chunks"] > 1
+
+
+def test_generate_stream_raises_when_the_connection_drops(streaming_ollama):
+    pytest.importorskip("ollama")
+    from src.llm.model import LLMModel
+
+    host, server = streaming_ollama
+    server.drop_after = 2
+    llm = LLMModel("stub", host=host)
+
+    tokens, stats = [], {}
+    with pytest.raises(Exception):
+        for token in llm.generate_stream("question", stats=stats):
+            tokens.append(token)
+
+    # The partial answer is never passed off as complete
+    assert tokens == ["The ", "closing "]
+    assert stats["error"] is True and stats["cancelled"] is False
+
+
+def test_query_batcher_groups_concurrent_queries():
+    import asyncio
+    from src.api.batcher import QueryBatcher
+
+    class FakeRetriever:
+        def __init__(self):
+            self.calls = []
+
+        def retrieve_batch(self, queries, top_k):
+            self.calls.append((list(queries), top_k))
+            return [[{"id": i, "text": f"{query}-{i}"} for i in range(top_k)] for query in queries]
+
+    store = FakeRetriever()
+    batcher = QueryBatcher(store, top_k=2, max_batch_size=8, max_wait_ms=50)
+
+    async def run():
+        results = await asyncio.gather(*(batcher.search(f"q{i}", top_k=1 + i % 3) for i in range(6)))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert len(store.calls) == 1
+    assert store.calls[0] == (["q0", "q1", "q2", "q3", "q4", "q5"], 3)
+    assert [len(hits) for hits in results] == [1, 2, 3, 1, 2, 3]
+    assert results[4][0]["text"] == "q4-0"
+
+
+def test_query_batcher_stop_cancels_pending_searches():
+    from src.api.batcher import QueryBatcher
+
+    class BlockingRetriever:
+        release = threading.Event()
+
+        def retrieve_batch(self, queries, top_k):
+            self.release.wait(5)
+            return [[] for _ in queries]
+
+    retriever = BlockingRetriever()
+    batcher = QueryBatcher(retriever, max_batch_size=1, max_wait_ms=0)
+
+    async def run():
+        searches = [asyncio.ensure_future(batcher.search(f"q{i}")) for i in range(3)]
+        await asyncio.sleep(0.05)       # q0 is being searched, q1 / q2 are queued
+        await batcher.stop()
+        retriever.release.set()
+        return await asyncio.wait_for(asyncio.gather(*searches, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+def test_api_rejects_malformed_bodies_and_bad_top_k():
+    pytest.importorskip("aiohttp")
+    from aiohttp.test_utils import TestClient, TestServer
+    from src.api.batcher import QueryBatcher
+    from src.api.server import RAGServer
+
+    class FakeRetriever:
+        def retrieve_batch(self, queries, top_k=None, filters=None):
+            return [[{"id": 1, "text": query}] for query in queries]
+
+    class FakeLLM:
+        async def aclose(self):
+            pass
+
+    class FakeRAG:
+        retriever = FakeRetriever()
+        llm = FakeLLM()
+
+    server = RAGServer(FakeRAG(), QueryBatcher(FakeRAG.retriever, max_wait_ms=0), max_top_k=50)
+
+    async def run():
+        client = TestClient(TestServer(server.build_app()))
+        await client.start_server()
+        try:
+            statuses = []
+            for path, data in [
+                ("/query", "{not json"),
+                ("/retrieve", "[1, 2]"),
+                ("/retrieve", json.dumps({"query": "q", "top_k": -1})),
+                ("/retrieve", json.dumps({"query": "q", "top_k": 10 ** 12})),
+                ("/retrieve", json.dumps({"query": "q", "top_k": "5"})),
+                ("/retrieve", json.dumps({"queries": [1, 2]})),
+                ("/retrieve", json.dumps({"query": "q", "top_k": 3})),
+            ]:
+                response = await client.post(path, data=data)
+                statuses.append(response.status)
+            return statuses
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == [400, 400, 400, 400, 400, 400, 200]
+
+
+def test_docstore_fetches_only_requested_rows(tmp_path):
+    from src.vectorstore.docstore import DocStore
+
+    store = DocStore(tmp_path / "docstore.sqlite")
+    store.add_many({
+        1: {"text": "bank name: HDFC", "source": "a.json", "hash": "h1"},
+        2: {"text": "bank name: SBI", "source": "b.json", "hash": "h2"},
+    })
+    store.commit()
+    store.close()
+
+    reopened = DocStore(tmp_path / "docstore.sqlite")
+    assert len(reopened) == 2
+    assert reopened.get_many([2, -1]) == {2: {"text": "bank name: SBI", "source": "b.json", "hash": "h2"}}
+    assert reopened.id_for_source("a.json") == 1
+    assert reopened.existing_ids([1, 3]) == {1}
+
+    reopened.delete_many([1])
+    assert reopened.sources() == {"b.json": 2}
+
+
+def test_bm25_ranks_exact_identifiers_first(tmp_path):
+    from src.retriever.bm25 import BM25Index, tokenize
+    from src.retriever.retriever import reciprocal_rank_fusion
+
+    assert "12345678" in tokenize("Account Number: 1234-5678")
+
+    index = BM25Index(tmp_path / "bm25.sqlite", field_weights={"account_number": 3.0})
+    index.add_many({
+        1: "bank_name: HDFC\naccount_number: 1234-5678\nnote: salary",
+        2: "bank_name: HDFC\naccount_number: 9999-0000\nnote: mentions 12345678 once",
+        3: "bank_name: SBI\naccount_number: 5555-1111",
+    })
+
+    assert index.search("account 12345678", top_k=2)[0][0] == 1
+
+    index.delete_many([1])
+    assert len(index) == 2
+    assert [doc_id for doc_id, _ in index.search("12345678")] == [2]
+
+    fused = reciprocal_rank_fusion([[3, 1, 2], [1, 2]], k=60)
+    assert [doc_id for doc_id, _ in fused] == [1, 2, 3]
+    index.close()
+
+
+def test_metadata_index_filters_statements(tmp_path):
+    from src.vectorstore.metadata import MetadataIndex, metadata_from_text
+
+    index = MetadataIndex(tmp_path / "meta.sqlite")
+    index.add_many({
+        1: {"bank_name": "HDFC Bank", "account_number": "1234-5678", "statement_from_date": "01-03-2024",
+            "statement_to_date": "31-03-2024", "total_credits": "12,500.00"},
+        2: {"bank_name": "HDFC Bank", "statement_from_date": "01-04-2024",
+            "statement_to_date": "30-04-2024", "total_credits": 900},
+        3: metadata_from_text("bank name: SBI\nstatement from date: 15/03/2024\ntotal credits: None"),
+    })
+
+    assert sorted(index.filter_ids({"period": ["2024-03-01", "2024-03-31"]}).tolist()) == [1, 3]
+    assert index.filter_ids({"bank_name": "hdfc bank", "total_credits": {"gte": 1000}}).tolist() == [1]
+    assert index.filter_ids({"account_number": ["12345678"]}).tolist() == [1]
+    assert index.get_many([3])[3]["total_credits"] is None
+
+    with pytest.raises(ValueError):
+        index.filter_ids({"colour": "blue"})
+
+    index.delete_many([1])
+    assert len(index) == 2
+    index.close()
+
+
+def test_statement_analytics_answers_aggregates(tmp_path):
+    from src.vectorstore.metadata import MetadataIndex
+    from src.pipeline.aggregates import StatementAnalytics
+
+    class FakeStore:
+        version = 1
+        metadata_index = MetadataIndex(tmp_path / "meta.sqlite")
+
+    FakeStore.metadata_index.add_many({
+        1: {"bank_name": "HDFC Bank", "account_number": "111", "statement_from_date": "01-01-2024",
+            "total_credits": 1000, "currency": "INR"},
+        2: {"bank_name": "HDFC Bank", "account_number": "222", "statement_from_date": "01-02-2024",
+            "total_credits": "2,500.50", "currency": "INR"},
+        3: {"bank_name": "SBI", "account_number": "333", "statement_from_date": "01-03-2024",
+            "total_credits": 500, "currency": "INR"},
+        4: {"bank_name": "SBI", "account_number": "333", "statement_from_date": "01-04-2024",
+            "total_credits": 9000, "currency": "INR"},
+    })
+    analytics = StatementAnalytics(FakeStore())
+
+    query = analytics.parse("What are the total credits across all accounts for Q1 2024?")
+    assert (query.metric, query.amount) == ("sum", "total_credits")
+    assert analytics.run(query)[0]["value"] == 4000.5
+
+    rows = analytics.run(analytics.parse("highest credits per bank in Q1"))
+    assert {row["group"]: row["value"] for row in rows} == {"HDFC Bank": 2500.5, "SBI": 500.0}
+
+    assert analytics.answer("How many statements from HDFC?") == "Statements: 2"
+    assert analytics.parse("What is the account holder's name?") is None
+
+    # Single-statement questions go to RAG, not a corpus-wide aggregate
+    assert analytics.parse("What was the largest debit transaction for Ramesh Kumar?") is None
+    assert analytics.parse("Did Priya's account receive any income in total?") is None
+    assert analytics.parse("What is the balance across Ramesh's statements for 2024?") is None
+    assert analytics.parse("Total credits across all accounts for Ramesh Kumar") is None
+
+    query = analytics.parse("How many statements from SBI in Feb 2023?")
+    assert (query.months, query.year) == ({2}, "2023")
+
+    class SpanningStore:
+        version = 1
+        metadata_index = MetadataIndex(tmp_path / "spanning.sqlite")
+
+    SpanningStore.metadata_index.add_many({
+        1: {"bank_name": "HDFC Bank", "statement_from_date": "01-02-2024", "statement_to_date": "29-02-2024",
+            "total_credits": 100, "currency": "INR"},
+        # Starts in Q1, ends in Q2: counted in Q1 only, with or without the year
+        2: {"bank_name": "HDFC Bank", "statement_from_date": "15-03-2024", "statement_to_date": "14-04-2024",
+            "total_credits": 1000, "currency": "INR"},
+        3: {"bank_name": "SBI", "statement_from_date": "01-05-2024", "statement_to_date": "31-05-2024",
+            "total_credits": 50, "currency": "USD"},
+    })
+    analytics = StatementAnalytics(SpanningStore())
+
+    def total(question):
+        return {row["currency"]: row["value"] for row in analytics.run(analytics.parse(question))}
+
+    assert total("total credits across all accounts for Q1 2024") == total("total credits across all accounts for Q1") == {"INR": 1100.0}
+    assert total("total credits across all accounts for Q2 2024") == {"USD": 50.0}
+
+    # Different currencies are never added up
+    assert total("total credits across all accounts in 2024") == {"INR": 1100.0, "USD": 50.0}
+    assert analytics.answer("What are the total credits across all accounts in 2024?") == (
+        "Total credits per currency:\n- 1,100.00 INR over 2 statements\n- 50.00 USD over 1 statements"
+    )
+
+
+def test_context_packer_ranks_dedupes_and_respects_budget():
+    from src.pipeline.context import ContextPacker
+
+    packer = ContextPacker(max_tokens=20, chars_per_token=1)
+    hits = [
+        {"id": 1, "score": 0.1, "text": "bank name: SBI\ncurrency: None"},
+        {"id": 2, "score": 0.9, "text": "bank name: HDFC"},
+        {"id": 3, "score": 0.5, "text": "bank  name: hdfc"},
+        {"id": 4, "score": 0.3, "text": "x" * 30},
+    ]
+
+    context, stats = packer.pack(hits)
+    assert context == "bank name: HDFC"
+    assert stats["duplicates"] == 1 and stats["dropped"] == 2
+
+    context, stats = ContextPacker(max_tokens=100, chars_per_token=1).pack(hits[:1] + hits[1:2])
+    assert context == "bank name: HDFC\n\nbank name: SBI"
+
+    # A single oversized chunk is cut at a line boundary
+    context, stats = ContextPacker(max_tokens=25, chars_per_token=1).pack(["line one\nline two\nline three"])
+    assert context == "line one\nline two" and stats["truncated"]
+
+
+def test_vectorstore_starts_without_importing_or_loading_the_embedder(tmp_path):
+    pytest.importorskip("faiss")
+    from benchmarks.startup_profile import ENTRY_POINTS, check, profile_imports
+
+    for module in ("run", "src.vectorstore.store"):
+        assert check(module, profile_imports(module), ENTRY_POINTS[module]) == []
+
+    from src.vectorstore.store import VectorStore
+
+    class HashEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            return np.array([[hash(text) % 97 + i for i in range(384)] for text in texts], dtype=np.float32)
+
+    store = VectorStore(
+        index_path=tmp_path / "faiss.index",
+        docstore_path=tmp_path / "docstore.sqlite",
+        embedding_cache_config={"enabled": False},
+        embedder_load="lazy",
+    )
+    assert store._embedder is None
+
+    store.embedder = HashEncoder()
+    store.upsert(["bank name: HDFC", "bank name: SBI"])
+    assert store.search("bank name: SBI", top_k=1) == ["bank name: SBI"]
+
+
+def test_vectorstore_upsert_and_sync_keep_stable_ids(tmp_path):
+    from src.vectorstore.document import Document, make_doc_id
+
+    a = Document(text="bank name: HDFC\nclosing balance: 100", source="a_parsed.json")
+    b = Document(text="bank name: SBI\nclosing balance: 200", source="b_parsed.json")
+    assert a.doc_id == make_doc_id("a_parsed.json", a.hash) == Document(text=a.text, source=a.source).doc_id
+
+    store = make_store(tmp_path)
+    assert store.upsert([a, b]) == [a.doc_id, b.doc_id]
+    assert store.search(a.text, top_k=1) == [a.text]
+
+    # Unchanged documents are skipped without re-embedding
+    encoded = len(store.embedder.encoded)
+    store.upsert([a, b])
+    assert len(store.embedder.encoded) == encoded and store.index.ntotal == 2
+
+    # New content for the same source replaces the old version
+    a2 = Document(text="bank name: HDFC\nclosing balance: 150", source="a_parsed.json")
+    store.upsert([a2])
+    assert store.embedder.encoded[encoded:] == [a2.text]
+    assert store.index.ntotal == 2 and a.doc_id not in store.docstore and a2.doc_id in store.docstore
+
+    # Sources no longer in the corpus are deleted on sync; IDs survive a reopen
+    store.sync_documents([a2])
+    assert store.docstore.sources() == {"a_parsed.json": a2.doc_id} and store.index.ntotal == 1
+    store.close()
+    reopened = make_store(tmp_path)
+    assert reopened.docstore.sources() == {"a_parsed.json": a2.doc_id}
+    assert reopened.search(a2.text, top_k=1) == [a2.text]
+    reopened.close()
+
+
+def test_vectorstore_trains_rebuilds_and_removes_from_every_index_type(tmp_path):
+    pytest.importorskip("faiss")
+    from src.vectorstore.document import Document
+    from src.vectorstore.index_factory import index_kind
+
+    docs = [Document(text=f"statement {i}: closing balance {i * 37}", source=f"s{i}.json") for i in range(60)]
+
+    # Partial configs are completed from the defaults; IVF starts flat until it can train
+    store = make_store(tmp_path, index_config={"type": "ivf_flat", "min_train_size": 40})
+    store.upsert(docs[:30])
+    assert index_kind(store.index) == "flat"
+    store.upsert(docs[30:])
+    assert index_kind(store.index) == "ivf_flat" and store.index.ntotal == 60
+    assert store.search(docs[5].text, top_k=1) == [docs[5].text]
+    store.rebuild_index()
+    assert index_kind(store.index) == "ivf_flat" and store.index.ntotal == 60
+    store.close()
+
+    # A changed index type is rebuilt on open; HNSW cannot remove_ids and is rebuilt on delete
+    store = make_store(tmp_path, index_config={"type": "hnsw"})
+    assert index_kind(store.index) == "hnsw" and store.index.ntotal == 60
+    assert store.delete(sources=["s5.json"]) == 1
+    assert index_kind(store.index) == "hnsw" and store.index.ntotal == 59
+    assert docs[5].text not in store.search(docs[5].text, top_k=3)
+    assert store.search(docs[6].text, top_k=1) == [docs[6].text]
+    store.close()
+
+    store = make_store(tmp_path, index_config={"type": "ivf_pq", "pq_m": 8, "pq_bits": 4, "min_train_size": 40})
+    assert index_kind(store.index) == "ivf_pq" and store.index.ntotal == 59
+    assert docs[6].text in store.search(docs[6].text, top_k=5)
+    store.close()
+
+
+def test_ivf_index_is_retrained_as_the_corpus_grows(tmp_path):
+    pytest.importorskip("faiss")
+    import faiss
+    from src.vectorstore.document import Document
+
+    docs = [Document(text=f"statement {i}: closing balance {i * 37}", source=f"s{i}.json") for i in range(200)]
+    config = {"type": "ivf_flat", "min_train_size": 40, "retrain_growth": 4}
+
+    store = make_store(tmp_path, index_config=config)
+    store.upsert(docs[:40])
+    assert faiss.extract_index_ivf(store.index).nlist == 1
+    assert store.docstore.get_meta("index_trained_size") == 40
+
+    # Below retrain_growth x the training size the centroids are kept
+    store.upsert(docs[40:150])
+    assert faiss.extract_index_ivf(store.index).nlist == 1
+    assert store.docstore.get_meta("index_trained_size") == 40
+
+    # Past it: retrained at the current size, with nlist recomputed from it
+    store.upsert(docs[150:])
+    assert faiss.extract_index_ivf(store.index).nlist == 5 and store.index.ntotal == 200
+    assert store.docstore.get_meta("index_trained_size") == 200
+    assert store.search(docs[170].text, top_k=1) == [docs[170].text]
+    store.close()
+
+    # The training size is saved: reopening does not retrain again
+    store = make_store(tmp_path, index_config=config)
+    assert not store._needs_rebuild()
+    store.close()
+
+
+def test_batch_search_and_retrieval_match_per_query_results(tmp_path):
+    pytest.importorskip("faiss")
+    from src.vectorstore.document import Document
+    from src.retriever.retriever import Retriever
+
+    store = make_store(tmp_path)
+    docs = [
+        Document(text=f"bank name: {bank}\naccount number: {1000 + i}", source=f"s{i}.json",
+                 metadata={"bank_name": bank, "account_number": str(1000 + i)})
+        for i, bank in enumerate(["HDFC", "SBI", "ICICI"] * 8)
+    ]
+    store.upsert(docs)
+    queries = [docs[0].text, docs[7].text, "account number: 1013", "bank name: SBI"]
+
+    batch = store.search_batch(queries, top_k=4)
+    assert [[hit["text"] for hit in hits] for hits in batch] == [store.search(query, top_k=4) for query in queries]
+    filters = {"bank_name": "SBI"}
+    assert [[hit["text"] for hit in hits] for hits in store.search_batch(queries, top_k=4, filters=filters)] == \
+        [store.search(query, top_k=4, filters=filters) for query in queries]
+
+    for hybrid in (False, True):
+        retriever = Retriever(store, top_k=4, hybrid=hybrid)
+        assert retriever.retrieve_batch(queries) == [retriever.retrieve_batch([query])[0] for query in queries]
+        assert [[hit["text"] for hit in hits] for hits in retriever.retrieve_batch(queries)] == \
+            [retriever.retrieve(query) for query in queries]
+    store.close()
+
+
+def test_embedder_batches_by_length_within_token_budget():
+    from src.vectorstore.embedders import plan_batches
+
+    lengths = [5, 40, 6, 38, 7, 100]
+    batches = plan_batches(lengths, batch_size=2, max_batch_tokens=80)
+
+    assert batches == [[5], [1, 3], [4, 2], [0]]
+    assert sorted(pos for batch in batches for pos in batch) == list(range(len(lengths)))
+
+
+def test_onnx_embedder_matches_reference_pooling(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("tokenizers")
+    import shutil
+    from onnx import TensorProto, helper, numpy_helper
+    from src.vectorstore.embedders import load_embedder
+
+    # Local model dir: the vendored tokenizer and a tiny embedding-lookup "transformer"
+    source = Path(__file__).resolve().parent.parent / "sentece-transformers" / "all-MiniLM-L6-v2"
+    model_dir = tmp_path / "model"
+    (model_dir / "1_Pooling").mkdir(parents=True)
+    for name in ("tokenizer.json", "modules.json", "sentence_bert_config.json"):
+        shutil.copy(source / name, model_dir / name)
+    (model_dir / "1_Pooling" / "config.json").write_text(json.dumps(
+        {"word_embedding_dimension": 8, "pooling_mode_mean_tokens": True}
+    ))
+
+    table = np.random.default_rng(0).normal(size=(30522, 8)).astype(np.float32)
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "lookup",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 8])],
+        [numpy_helper.from_array(table, "table")],
+    )
+    (model_dir / "onnx").mkdir()
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)], ir_version=8)
+    onnx.save(model, model_dir / "onnx" / "model.onnx")
+
+    texts = ["bank name: HDFC", "a much longer statement text about closing balances and credits", "SBI"]
+    config = {"model_path": str(model_dir), "batch_size": 2, "max_batch_tokens": 64}
+    embedder = load_embedder("unused", {**config, "backend": "onnx"})
+    vectors = embedder.encode(texts)
+
+    for text, vector in zip(texts, vectors):
+        ids = embedder.tokenizer.encode(text).ids
+        expected = table[ids].mean(axis=0)
+        assert np.allclose(vector, expected / np.linalg.norm(expected), atol=1e-5)
+
+    quantized = load_embedder("unused", {**config, "backend": "onnx_int8"}).encode(texts)
+    assert (model_dir / "onnx" / "model_int8.onnx").exists()
+    assert np.all(np.sum(quantized * vectors, axis=1) > 0.99)
+
+
+def test_pipeline_benchmark_reports_every_stage(tmp_path):
+    from benchmarks.pipeline_benchmark import compare, run_benchmark
+
+    results = run_benchmark(
+        docs=40, images=2, queries=5, index_batch_size=20, preprocess=False,
+        ocr_latency_ms=0, llm_latency_ms=0, work_dir=tmp_path / "bench",
+    )
+
+    assert set(results["stages"]) == {"ocr", "ingest", "embed", "index", "search", "generate"}
+    assert results["stages"]["ingest"]["items"] == 40
+    assert results["stages"]["ocr"]["items"] == 2
+    for summary in results["stages"].values():
+        assert summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"]
+
+    slower = {"stages": {"search": {**results["stages"]["search"], "throughput_per_s": 1e9}}}
+    assert compare(results, results) == []
+    assert compare(results, slower) == [f"search: throughput {results['stages']['search']['throughput_per_s']}/s < 1000000000.0/s"]
+
+
+def test_metrics_spans_counters_and_prometheus_export():
+    from src.utils.metrics import Metrics
+
+    registry = Metrics(buckets=(0.01, 0.1, 1.0))
+    registry.observe("encode", 0.005, backend="onnx")
+    registry.observe("encode", 0.05, backend="onnx")
+    with pytest.raises(RuntimeError):
+        with registry.span("encode", backend="onnx"):
+            raise RuntimeError("boom")
+    registry.inc("embedding_cache_hits", 3)
+    registry.inc("embedding_cache_hits", 2)
+
+    snapshot = registry.snapshot()
+    timer = snapshot["timers"]["encode"][0]
+    assert timer["labels"] == {"backend": "onnx"}
+    assert timer["count"] == 3 and timer["errors"] == 1
+    assert snapshot["counters"]["embedding_cache_hits"][0]["value"] == 5
+
+    text = registry.to_prometheus()
+    assert 'finsight_encode_seconds_bucket{backend="onnx",le="0.01"} 2' in text
+    assert 'finsight_encode_seconds_count{backend="onnx"} 3' in text
+    assert "finsight_embedding_cache_hits_total 5" in text
+
+    registry.enabled = False
+    registry.inc("embedding_cache_hits")
+    assert registry.snapshot()["counters"]["embedding_cache_hits"][0]["value"] == 5
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_sharded_store_matches_single_store(tmp_path, executor):
+    pytest.importorskip("faiss")
+    from src.vectorstore.document import Document
+    from src.vectorstore.sharded import ShardedVectorStore
+    from src.vectorstore.store import VectorStore
+
+    class SeededEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            return np.stack([
+                np.random.default_rng(sum(map(ord, text))).normal(size=384) for text in texts
+            ]).astype(np.float32)
+
+    docs = [
+        Document(
+            text=f"bank name: {bank}\naccount number: {1000 + i}\nclosing balance: {i * 10}",
+            source=f"stmt_{i}_parsed.json",
+            metadata={"bank_name": bank, "account_number": str(1000 + i)},
+        )
+        for i, bank in enumerate(["HDFC", "SBI", "ICICI", "Axis"] * 10)
+    ]
+    options = {"embedding_cache_config": {"enabled": False}, "embedder_load": "lazy"}
+
+    single = VectorStore(index_path=tmp_path / "single.index", docstore_path=tmp_path / "single.sqlite", **options)
+    single.embedder = SeededEncoder()
+    single.upsert(docs)
+
+    sharded = ShardedVectorStore(path=tmp_path / "shards", num_shards=3, executor=executor, workers=2, **options)
+    sharded.embedder = SeededEncoder()
+    try:
+        sharded.upsert(docs)
+        assert len(sharded.docstore) == 40
+        assert all(len(shard.docstore) for shard in sharded.shards)
+
+        queries = [docs[3].text, docs[17].text, "bank name: SBI"]
+        expected = single.search_batch(queries, top_k=5)
+        assert [[hit["id"] for hit in hits] for hits in sharded.search_batch(queries, top_k=5)] == \
+            [[hit["id"] for hit in hits] for hits in expected]
+
+        hits = sharded.search_batch(["bank name: SBI"], top_k=20, filters={"bank_name": "SBI"})[0]
+        assert len(hits) == 10 and all("SBI" in hit["text"] for hit in hits)
+
+        # A rebuilt shard keeps serving the same results
+        sharded.rebuild_shard(1)
+        assert sharded.search(docs[17].text, top_k=1) == [docs[17].text]
+
+        assert sharded.delete(sources=[docs[17].source]) == 1
+        assert docs[17].text not in sharded.search(docs[17].text, top_k=3)
+    finally:
+        sharded.close()
+
+
+def test_snapshot_store_serves_old_snapshot_until_the_new_one_is_swapped_in(tmp_path):
+    pytest.importorskip("faiss")
+    from src.vectorstore.document import Document
+    from src.vectorstore.snapshots import SnapshotVectorStore
+
+    class SlowEncoder:
+        def __init__(self):
+            self.release = threading.Event()
+
+        def encode(self, texts, convert_to_numpy=True):
+            if any("SBI" in text for text in texts):
+                self.release.wait(5)
+            return np.stack([
+                np.random.default_rng(sum(map(ord, text))).normal(size=384) for text in texts
+            ]).astype(np.float32)
+
+    encoder = SlowEncoder()
+    options = {"embedding_cache_config": {"enabled": False}, "embedder_load": "lazy"}
+    store = SnapshotVectorStore(path=tmp_path / "snapshots", **options)
+    store.embedder = encoder
+
+    hdfc = Document(text="bank name: HDFC", source="a_parsed.json")
+    sbi = Document(text="bank name: SBI", source="b_parsed.json")
+    assert store.refresh([hdfc])["version"] == 1
+
+    future = store.refresh_async([hdfc, sbi])
+    # While v2 builds (blocked in encode), queries are answered from v1
+    assert store.version == 1 and len(store.docstore) == 1
+    assert store.search("bank name: HDFC", top_k=2) == ["bank name: HDFC"]
+
+    encoder.release.set()
+    assert future.result(timeout=10)["documents"] == 2
+    assert store.version == 2 and len(store.docstore) == 2
+    assert (tmp_path / "snapshots" / "CURRENT").read_text() == "v000002"
+
+    # Reopening serves the pointed-to snapshot; only `keep` snapshots stay on disk
+    store.close()
+    reopened = SnapshotVectorStore(path=tmp_path / "snapshots", **options)
+    assert reopened.version == 2 and len(reopened.docstore) == 2
+    assert sorted(path.name for path in (tmp_path / "snapshots").glob("v*")) == ["v000001", "v000002"]
+    reopened.close()
+
+
+def test_long_statements_are_chunked_and_expand_to_their_parent(tmp_path):
+    pytest.importorskip("faiss")
+    from src.vectorstore.chunking import StatementChunker
+    from src.vectorstore.ingest import JSONIngestor
+    from src.vectorstore.store import VectorStore
+    from src.retriever.retriever import Retriever
+    from src.pipeline.aggregates import StatementAnalytics
+
+    class SeededEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            return np.stack([
+                np.random.default_rng(sum(map(ord, text))).normal(size=384) for text in texts
+            ]).astype(np.float32)
+
+    statement = {
+        "bank_name": "HDFC Bank", "account_number": "111", "statement_from_date": "01-01-2024",
+        "statement_to_date": "31-01-2024", "total_credits": 1000, "currency": "INR",
+        "transactions": [{"date": f"{day:02d}-01-2024", "description": f"UPI payment {day}", "amount": day * 10}
+                         for day in range(1, 41)],
+    }
+    ingestor = JSONIngestor(tmp_path, chunking_config={"enabled": True, "max_tokens": 120})
+    chunks = ingestor.to_documents(statement, source="long_parsed.json")
+    short = ingestor.to_documents({"bank_name": "SBI", "total_credits": 500}, source="short_parsed.json")
+
+    assert len(short) == 1 and short[0].parent is None
+    assert len(chunks) > 3
+    assert all(chunk.parent == "long_parsed.json" for chunk in chunks)
+    assert all(chunk.text.startswith("bank name: HDFC Bank") for chunk in chunks)
+    chunker = StatementChunker(max_tokens=120)
+    assert all(chunker.count_tokens(chunk.text) <= 120 for chunk in chunks)
+    # Every transaction ends up in some chunk
+    assert all(any(f"UPI payment {day}," in chunk.text for chunk in chunks) for day in range(1, 41))
+
+    store = VectorStore(
+        index_path=tmp_path / "faiss.index", docstore_path=tmp_path / "docstore.sqlite",
+        embedding_cache_config={"enabled": False}, embedder_load="lazy"
+    )
+    store.embedder = SeededEncoder()
+    store.upsert(chunks + short)
+
+    retriever = Retriever(store, top_k=2)
+    query = chunks[-1].text
+    hits = retriever.retrieve_batch([query])[0]
+    assert hits[0]["source"] == chunks[-1].source and hits[0]["parent"] == "long_parsed.json"
+
+    expanded = retriever.retrieve_batch([query], expand_parents=True)[0]
+    assert expanded[0]["source"] == "long_parsed.json" and expanded[0]["text"] == chunks[0].parent_text
+    assert len({hit["source"] for hit in expanded}) == len(expanded)
+
+    # Aggregates count the chunked statement once
+    assert StatementAnalytics(store).answer("How many statements from HDFC?") == "Statements: 1"
+
+    # A re-OCR'd statement that now fits replaces all of its old chunks
+    store.upsert(ingestor.to_documents({**statement, "transactions": []}, source="long_parsed.json"))
+    assert len(store.docstore) == 2 and store.docstore.get_parents(["long_parsed.json"]) == {}
+
+    # Deleting a chunked statement by its source removes every chunk
+    store.upsert(chunks)
+    assert store.delete(sources=["long_parsed.json"]) == len(chunks)
+    assert store.docstore.sources() == {"short_parsed.json": short[0].doc_id}
+    assert store.docstore.get_parents(["long_parsed.json"]) == {}
+    store.close()
+
+
+def test_account_sharding_moves_a_corrected_statement_with_all_its_chunks(tmp_path):
+    pytest.importorskip("faiss")
+    from src.vectorstore.ingest import JSONIngestor
+    from src.vectorstore.sharded import ShardedVectorStore, shard_for
+    from src.vectorstore.document import Document
+
+    class SeededEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            return np.stack([
+                np.random.default_rng(sum(map(ord, text))).normal(size=384) for text in texts
+            ]).astype(np.float32)
+
+    def account_in(shard_no, exclude=()):
+        return next(account for account in map(str, range(1000, 2000))
+                    if account not in exclude
+                    and shard_for(Document(text="", metadata={"account_number": account}), 4, "account") == shard_no)
+
+    old_account, new_account = account_in(1), account_in(0)
+    statement = {
+        "bank_name": "HDFC Bank", "account_number": old_account, "statement_from_date": "01-01-2024",
+        "transactions": [{"date": f"{day:02d}-01-2024", "description": f"UPI payment {day}", "amount": day * 10}
+                         for day in range(1, 41)],
+    }
+    ingestor = JSONIngestor(tmp_path, chunking_config={"enabled": True, "max_tokens": 120})
+    store = ShardedVectorStore(path=tmp_path / "shards", num_shards=4, shard_key="account", executor="thread",
+                               embedding_cache_config={"enabled": False}, embedder_load="lazy")
+    store.embedder = SeededEncoder()
+    try:
+        old_chunks = ingestor.to_documents(statement, source="a_parsed.json")
+        store.upsert(old_chunks)
+        assert [len(shard.docstore) for shard in store.shards] == [0, len(old_chunks), 0, 0]
+
+        # Re-OCR'd under the corrected account, and shorter: fewer chunks in another shard
+        corrected = {**statement, "account_number": new_account, "transactions": statement["transactions"][:10]}
+        new_chunks = ingestor.to_documents(corrected, source="a_parsed.json")
+        assert 1 < len(new_chunks) < len(old_chunks)
+        store.upsert(new_chunks)
+        assert [len(shard.docstore) for shard in store.shards] == [len(new_chunks), 0, 0, 0]
+
+        # An unchunked statement that is later chunked under another account moves as well
+        short = ingestor.to_documents({"bank_name": "SBI", "account_number": old_account}, source="b_parsed.json")
+        store.upsert(short)
+        store.upsert(ingestor.to_documents({**statement, "account_number": new_account}, source="b_parsed.json"))
+        assert len(store.shards[1].docstore) == 0
+    finally:
+        store.close()
+
+
+def test_snapshot_store_never_writes_the_live_snapshot_and_closes_retired_ones_when_idle(tmp_path):
+    pytest.importorskip("faiss")
+    import sqlite3
+    from src.vectorstore.document import Document
+    from src.vectorstore.snapshots import SnapshotVectorStore
+
+    class SeededEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            return np.stack([
+                np.random.default_rng(sum(map(ord, text))).normal(size=384) for text in texts
+            ]).astype(np.float32)
+
+    options = {"embedding_cache_config": {"enabled": False}, "embedder_load": "lazy"}
+    lexical = {"enabled": True, "path": None, "k1": 1.5, "b": 0.75, "max_df_ratio": 1.0, "field_weights": {}}
+    store = SnapshotVectorStore(path=tmp_path / "snapshots", lexical_config={**lexical, "enabled": False}, **options)
+    store.embedder = SeededEncoder()
+    docs = [Document(text=f"bank name: {bank}", source=f"{bank}.json") for bank in ("HDFC", "SBI")]
+    store.refresh(docs)
+
+    # A query still running on v1 keeps it open across two swaps; its last read closes it
+    with store._reading() as old:
+        store.refresh(docs[:1])
+        store.refresh(docs)
+        assert store.version == 3 and len(old.docstore) == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        len(old.docstore)
+    store.close()
+
+    # Enabling BM25 needs a backfill: built into a new snapshot, the live one is untouched
+    live = tmp_path / "snapshots" / "v000003"
+    stamps = {path.name: path.stat().st_mtime_ns for path in live.iterdir()}
+    reopened = SnapshotVectorStore(path=tmp_path / "snapshots", lexical_config=lexical, **options)
+    assert reopened.store.read_only and reopened.store.pending_maintenance == ["lexical"]
+    assert reopened.maintenance.result(timeout=10)["version"] == 4
+    assert len(reopened.lexical_index) == 2 and not reopened.store.pending_maintenance
+    # Read-only SQLite connections leave no -wal / -shm files and change nothing
+    assert {path.name: path.stat().st_mtime_ns for path in live.iterdir()} == stamps
+    assert not list((tmp_path / "snapshots" / "v000004").glob("*.sqlite-*"))
+    with pytest.raises(RuntimeError):
+        reopened.store.upsert([Document(text="bank name: ICICI", source="ICICI.json")])
+    reopened.close()